@@ -0,0 +1,244 @@
+"""
+K线数据的列式存储。
+
+原来各个数据加载函数返回两条平行的 Python 列表：时间字符串（如 2022/03/03-09:35:10）和价格，
+每根K线拆成开盘、最高、最低、收盘四个数据点。BarSeries 用 NumPy 数组按列保存K线：
+int64 的时间戳和 float64 的开高低收，回测用的数据点序列（ticks）在第一次用到时才展开。
+"""
+import copy
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# 每根K线内四个数据点的秒数后缀
+_tick_seconds = np.array([10, 20, 30, 40], dtype=np.int64)
+# K线内的价格路径，auto为先走离开盘价近的极值：开-近端-远端-收
+_paths = {
+    'OHLC': ('open', 'high', 'low', 'close'),
+    'OLHC': ('open', 'low', 'high', 'close'),
+    'auto': None,
+}
+# 可选的K线内价格路径
+bar_paths = tuple(_paths)
+
+
+def to_epoch(times, fmt=None):
+    """
+    时间字符串转为时间戳（秒），按字面时间直接换算，不做时区转换。
+    ```
+    :param times: 时间字符串列表
+    :param fmt: 时间格式，例如 %Y/%m/%d-%H:%M
+    :return: np.ndarray(int64)
+    ```
+    """
+    if not len(times):
+        return np.zeros(0, dtype=np.int64)
+    stamps = pd.to_datetime(pd.Index(times), format=fmt)
+    return stamps.values.astype('datetime64[s]').astype(np.int64)
+
+
+def format_epoch(stamps, fmt='%Y/%m/%d-%H:%M:%S'):
+    """
+    时间戳（秒）格式化为时间字符串列表。
+    ```
+    :param stamps: 时间戳数组
+    :param fmt: 时间格式
+    :return: list
+    ```
+    """
+    return pd.to_datetime(np.asarray(stamps, dtype=np.int64), unit='s').strftime(fmt).tolist()
+
+
+class BarSeries(object):
+    """
+    列式K线序列。
+    ```
+    time: K线时间戳（秒），日线统一记为当天10:00
+    open/high/low/close/volume: 开盘、最高、最低、收盘、成交量
+    path: K线内的价格路径，OHLC为 开-高-低-收，OLHC为 开-低-高-收，auto为先到离开盘价近的极值
+    ticks: 按路径展开的数据点价格，长度为K线数的4倍
+    ```
+    """
+
+    def __init__(self, time, open, high, low, close, volume=None, path='OHLC'):
+        if path not in _paths:
+            raise ValueError(f'unknown bar path: {path}')
+        self.time = self._column(time, np.int64)
+        self.open = self._column(open)
+        self.high = self._column(high)
+        self.low = self._column(low)
+        self.close = self._column(close)
+        self.volume = self._column(np.zeros(len(self.time)) if volume is None else volume)
+        self.path = path
+        self._ticks = None
+        self._index = None
+        self._bar_index = None
+        self._suffix = {}
+        self._levels = None
+        self._tick_time = None
+        self._time_sorted = None
+
+    @staticmethod
+    def _column(values, dtype=np.float64):
+        # 类型一致时不复制，只做只读视图（例如共享内存里的列）
+        arr = np.asarray(values, dtype=dtype).view()
+        arr.flags.writeable = False
+        return arr
+
+    def __len__(self):
+        return len(self.time)
+
+    def __repr__(self):
+        return f'BarSeries(bars={len(self)}, path={self.path})'
+
+    def path_columns(self, path=None):
+        """
+        K线内四个数据点对应的价格列。
+        ```
+        :param path: K线内的价格路径，默认用序列自己的路径
+        :return: (第1点, 第2点, 第3点, 第4点) 四个数组
+        ```
+        """
+        path = path or self.path
+        if path == 'auto':
+            gao_xian = self.high - self.open <= self.open - self.low
+            return (self.open, np.where(gao_xian, self.high, self.low),
+                    np.where(gao_xian, self.low, self.high), self.close)
+        return tuple(getattr(self, name) for name in _paths[path])
+
+    def with_path(self, path):
+        """换一种K线内价格路径，列数据共用。"""
+        if path not in _paths:
+            raise ValueError(f'unknown bar path: {path}')
+        series = copy.copy(self)
+        series.path = path
+        series._ticks = None
+        series._index = None
+        series._suffix = {}
+        return series
+
+    @property
+    def ticks(self):
+        """按K线内价格路径展开的数据点价格。"""
+        if self._ticks is None:
+            ticks = np.stack(self.path_columns(), axis=1).reshape(-1)
+            ticks.flags.writeable = False
+            self._ticks = ticks
+        return self._ticks
+
+    def digest(self):
+        """数据内容的哈希：时间、开高低收和K线内价格路径，用作结果缓存的键。"""
+        h = hashlib.sha1(self.path.encode('utf8'))
+        for arr in (self.time, self.open, self.high, self.low, self.close):
+            h.update(np.ascontiguousarray(arr).tobytes())
+        return h.hexdigest()
+
+    def price_levels(self):
+        """所有数据点出现过的价格，从小到大去重，与K线内价格路径无关。"""
+        if self._levels is None:
+            levels = np.unique(np.concatenate([self.open, self.high, self.low, self.close]))
+            levels.flags.writeable = False
+            self._levels = levels
+        return self._levels
+
+    def price_range(self):
+        """所有数据点的 (最低价, 最高价)，不展开数据点。"""
+        cols = (self.open, self.high, self.low, self.close)
+        return min(c.min() for c in cols), max(c.max() for c in cols)
+
+    @property
+    def tick_time(self):
+        """数据点的时间戳，K线时间加上10/20/30/40秒，同一条序列只展开一次。"""
+        if self._tick_time is None:
+            tick_time = (self.time[:, None] + _tick_seconds).reshape(-1)
+            tick_time.flags.writeable = False
+            self._tick_time = tick_time
+        return self._tick_time
+
+    def tick_position(self, stamps):
+        """
+        第一个时间不早于stamp的数据点位置，都早于stamp时为数据点数。
+        数据点时间递增时二分查找，否则（少见）逐个比较。
+        ```
+        :param stamps: 时间戳（秒）或其数组
+        :return: 位置或位置数组
+        ```
+        """
+        times = self.tick_time
+        if self._time_sorted is None:
+            self._time_sorted = bool(np.all(times[1:] >= times[:-1]))
+        if self._time_sorted:
+            return np.searchsorted(times, stamps, side='left')
+        stamps = np.asarray(stamps)
+        found = times[None, :] >= stamps.reshape(-1, 1)
+        pos = np.where(found.any(axis=1), found.argmax(axis=1), len(times))
+        return pos.reshape(stamps.shape)
+
+    @property
+    def index(self):
+        """数据点的区间最值索引，同一条序列只构建一次。"""
+        if self._index is None:
+            from .range_index import RangeIndex
+            self._index = RangeIndex(self.ticks)
+        return self._index
+
+    @property
+    def bar_index(self):
+        """K线的区间最值索引（最高价/最低价），同一条序列只构建一次。"""
+        if self._bar_index is None:
+            from .range_index import RangeIndex
+            self._bar_index = RangeIndex(self.high, self.low)
+        return self._bar_index
+
+    def suffix_stats(self, path=None):
+        """
+        按K线内价格路径展开的数据点的后缀统计，每种路径只计算一次，用于回测剪枝的上界估计。
+        ```
+        :param path: K线内的价格路径，默认用序列自己的路径
+        :return: (suf_max, suf_min, suf_bianhua)，长度为数据点数+1，
+                 第t个分别为第t个数据点及之后的最高价、最低价和相邻数据点价格变化绝对值之和
+        ```
+        """
+        path = path or self.path
+        if path not in self._suffix:
+            ticks = np.stack(self.path_columns(path), axis=1).reshape(-1)
+            suf_max = np.append(np.maximum.accumulate(ticks[::-1])[::-1], -np.inf)
+            suf_min = np.append(np.minimum.accumulate(ticks[::-1])[::-1], np.inf)
+            bianhua = np.abs(np.diff(ticks))
+            suf_bianhua = np.zeros(len(ticks) + 1)
+            suf_bianhua[:len(bianhua)] = np.cumsum(bianhua[::-1])[::-1]
+            for arr in (suf_max, suf_min, suf_bianhua):
+                arr.flags.writeable = False
+            self._suffix[path] = (suf_max, suf_min, suf_bianhua)
+        return self._suffix[path]
+
+    def tick_names(self):
+        """数据点的时间字符串，例如 2022/03/03-09:35:10。"""
+        return format_epoch(self.tick_time)
+
+    def to_lists(self):
+        """
+        展开成原来的 (时间字符串列表, 价格列表)，用于写json结果和逐点明细回测。
+        """
+        return self.tick_names(), self.ticks.tolist()
+
+    def slice(self, start=None, end=None):
+        """按K线位置切片。"""
+        cols = dict(time=self.time, open=self.open, high=self.high, low=self.low,
+                    close=self.close, volume=self.volume)
+        return BarSeries(path=self.path, **{k: v[start:end] for k, v in cols.items()})
+
+    def slice_ticks(self, start=None, end=None):
+        """
+        按数据点位置切片，位置对齐到整根K线：包含起点所在的K线和终点前一个数据点所在的K线。
+        ```
+        :param start: 数据点起始位置，可为负数或None
+        :param end: 数据点结束位置（不含），可为负数或None
+        :return: BarSeries
+        ```
+        """
+        start, end, _ = slice(start, end).indices(len(self) * 4)
+        if end <= start:
+            return self.slice(0, 0)
+        return self.slice(start // 4, (end + 3) // 4)
@@ -0,0 +1,148 @@
+"""
+多品种批量参数搜索。
+
+一次请求给出多个数据代号和同一套搜索条件：行情在主进程各加载一次，
+每个品种的搜索作为一个任务分给进程池，最后按最佳参数的盈亏比例排出跨品种的排名表。
+也可以在命令行运行：
+    python -m grid_trading.batch_search "sz.*_60_*.csv" "*_101_*.csv" --start 2023/01/01 --end 2023/12/31
+"""
+import argparse
+import fnmatch
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .walk_forward import window_info
+
+# 排名表里列出的最佳参数字段
+_table_params = ('wanggeshangjie', 'wanggexiajie', 'mairuyuzhi', 'maichuyuzhi', 'jizhunjia',
+                 'jiancangfene', 'dancifene')
+
+
+def expand_tokens(patterns, roots):
+    """
+    把数据代号列表展开：含通配符的按文件名匹配各数据目录下的文件，不含的原样保留；去重并保持顺序。
+    ```
+    :param patterns: 数据代号或通配符，例如 ['000665-5', 'sz.*_60_*.csv']
+    :param roots: 数据目录列表
+    :return: 数据代号列表
+    ```
+    """
+    names = sorted({name for root in roots if os.path.isdir(root) for name in os.listdir(root)})
+    tokens = []
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        matched = fnmatch.filter(names, pattern) if any(c in pattern for c in '*?[') else [pattern]
+        tokens.extend(t for t in matched if t not in tokens)
+    return tokens
+
+
+def search_symbol(search, token, series, base):
+    """一个品种的搜索，在子进程里运行，只返回排名表需要的内容。"""
+    result = search(series, dict(base, data_token=token))
+    best = result['result_best'][0] if result['result_best'] else None
+    topn = [dt['result']['yinkuibili'] for dt in result['result_topn']]
+    row = dict(data_token=token, **window_info(series),
+               n_candidates=result['search_stats']['n_candidates'],
+               topn_mean=round(sum(topn) / len(topn), 4) if topn else None)
+    if best is not None:
+        row.update(yinkuibili=best['result']['yinkuibili'],
+                   zongjiaoyicishu=best['result']['zongjiaoyicishu'],
+                   **{k: best['param'][k] for k in _table_params})
+    return row
+
+
+def rank_rows(rows):
+    """按最佳盈亏比例从高到低排名，失败的品种排在最后，不给名次。"""
+    ok = sorted((r for r in rows if r.get('yinkuibili') is not None), key=lambda r: -r['yinkuibili'])
+    failed = [r for r in rows if r.get('yinkuibili') is None]
+    for rank, row in enumerate(ok, 1):
+        row['rank'] = rank
+    return ok + failed
+
+
+def batch_search(items, base, search, workers=1, progress=None):
+    """
+    批量搜索。
+    ```
+    :param items: [(数据代号, BarSeries)]，加载失败的品种传入异常对象代替BarSeries
+    :param base: 基础参数（投入资金、手续费率、起止时间）
+    :param search: search(series, base) -> search_params 格式的结果，多进程时须可pickle
+    :param workers: 进程数，1为逐个品种搜索
+    :param progress: 每完成一个品种调用 progress(已完成数, 总数)
+    :return: 排名表 [dict(rank, data_token, start, end, bars, yinkuibili, 最佳参数..., error)]
+    ```
+    """
+    rows, tasks = [], []
+    for token, series in items:
+        if isinstance(series, Exception):
+            rows.append(dict(data_token=token, error=f'{type(series).__name__}: {series}'))
+        else:
+            tasks.append((token, series))
+
+    def failed(token, e):
+        return dict(data_token=token, error=f'{type(e).__name__}: {e}')
+
+    if workers <= 1:
+        for k, (token, series) in enumerate(tasks, 1):
+            try:
+                rows.append(search_symbol(search, token, series, base))
+            except Exception as e:
+                rows.append(failed(token, e))
+            if progress is not None:
+                progress(k, len(tasks))
+    elif tasks:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(tasks)))
+        try:
+            futures = {pool.submit(search_symbol, search, token, series, base): token for token, series in tasks}
+            for k, future in enumerate(as_completed(futures), 1):
+                try:
+                    rows.append(future.result())
+                except Exception as e:
+                    rows.append(failed(futures[future], e))
+                if progress is not None:
+                    progress(k, len(tasks))
+        finally:
+            pool.shutdown(cancel_futures=True)
+    return rank_rows(rows)
+
+
+def format_table(rows):
+    """排名表的文本形式，命令行输出用。"""
+    cols = ('rank', 'data_token', 'start', 'end', 'bars', 'yinkuibili', 'topn_mean', 'zongjiaoyicishu') \
+        + _table_params + ('error',)
+    cols = [c for c in cols if any(c in r for r in rows)]
+    lines = [[str(c) for c in cols]] + [['' if r.get(c) is None else str(r.get(c)) for c in cols] for r in rows]
+    widths = [max(len(line[k]) for line in lines) for k in range(len(cols))]
+    return '\n'.join('  '.join(v.ljust(w) for v, w in zip(line, widths)).rstrip() for line in lines)
+
+
+def main(argv=None):
+    """命令行入口：批量搜索并写结果文件，打印排名表。"""
+    from .grid_handler import run_batch_searching, _search_strategies, _batch_n_search
+
+    parser = argparse.ArgumentParser(description='多品种批量网格参数搜索')
+    parser.add_argument('data_tokens', nargs='+', help='数据代号，可用通配符匹配数据目录下的文件名')
+    parser.add_argument('--start', default='2022/01/01', help='起始时间')
+    parser.add_argument('--end', default='2023/06/30', help='结束时间')
+    parser.add_argument('--touruzijin', type=float, default=100000, help='投入总资金')
+    parser.add_argument('--shouxufeilv', type=float, default=0.0001, help='手续费率')
+    parser.add_argument('--n-search', type=int, default=_batch_n_search, help='搜索密度')
+    parser.add_argument('--topn', type=int, default=10, help='每个品种保留的最佳结果数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='进程数')
+    parser.add_argument('--strategy', default='grid', choices=_search_strategies, help='搜索策略')
+    parser.add_argument('--prune', action='store_true', help='剪枝')
+    parser.add_argument('--max-seconds', type=float, default=0, help='每个品种的时间预算（秒）')
+    args = parser.parse_args(argv)
+
+    out = run_batch_searching(args.data_tokens, args.start, args.end, touruzijin=args.touruzijin,
+                              shouxufeilv=args.shouxufeilv, n_search=args.n_search, topn=args.topn,
+                              workers=args.workers, strategy=args.strategy, prune=args.prune,
+                              max_seconds=args.max_seconds)
+    print(format_table(out['table']))
+    print(out['result_path'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+按内容哈希保存的数据文件，文件名是别名。
+
+上传的行情和网格参数文件按内容md5保存一份：{root}/.objects/{md5前2位}/{md5}{扩展名}，
+数据代号、网格参数代号等好记的名字作为别名记在一个小索引里（{root}/.objects/index.json），
+别名文件是指向同一份内容的硬链接，原来按 os.path.join(root, 别名) 读文件的代码不用改。
+同名同内容重复上传时直接查索引返回已有的别名，不再写文件；不同名同内容只多一个硬链接，不多占磁盘。
+取名时只查索引，不再逐个 os.path.exists 试探。
+多个进程（几个uvicorn worker、命令行的批量搜索）共用一个索引：改索引时先加文件锁，重读磁盘上的索引，
+合并本进程的条目后再写临时文件改名，不会互相覆盖掉别的进程刚登记的别名。
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows没有fcntl，只在进程内加锁，单进程部署
+    fcntl = None
+
+
+class ContentStore(object):
+    """
+    内容寻址的数据文件和别名索引。
+    ```
+    store = ContentStore('mnt/wp')
+    alias = store.put_bytes(data, 'data_token', '.csv')  # data_token.csv，已有同名不同内容时为 data_token.{md5[:k]}.csv
+    store.digest(alias)  # 内容md5
+    ```
+    """
+
+    def __init__(self, root, objects='.objects'):
+        self.root = root
+        self.objects = os.path.join(root, objects)
+        self.index_path = os.path.join(self.objects, 'index.json')
+        self.lock_path = os.path.join(self.objects, 'index.lock')
+        # 别名 -> md5；目录里原有的、不是经这里保存的文件记为None，只占名字
+        self._aliases = None
+        # (名字, 扩展名, md5) -> 别名
+        self._named = {}
+        self._lock = threading.Lock()
+
+    def blob_path(self, md5, ext=''):
+        return os.path.join(self.objects, md5[:2], f'{md5}{ext}')
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """跨进程的索引锁，读-改-写索引期间持有。"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.objects, exist_ok=True)
+        with open(self.lock_path, 'a') as fout:
+            fcntl.flock(fout, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fout, fcntl.LOCK_UN)
+
+    def _load(self):
+        """
+        读磁盘上的索引，合并进内存（其他进程登记的别名也就看得到了）。
+        第一次读时把目录里原有的文件登记为已占用的名字（只列一次目录）。
+        """
+        try:
+            with open(self.index_path, encoding='utf8') as fin:
+                index = json.load(fin)
+        except (OSError, ValueError):
+            index = {}
+        if self._aliases is None:
+            self._aliases = {name: None for name in (os.listdir(self.root) if os.path.isdir(self.root) else ())}
+        self._aliases.update(index.get('aliases', {}))
+        for named in index.get('named', []):
+            self._named[tuple(named[:3])] = named[3]
+
+    def _save(self):
+        """写索引，须持有文件锁并在此之前 _load 过，内存里已经是磁盘索引和本进程条目的合并。"""
+        os.makedirs(self.objects, exist_ok=True)
+        index = dict(aliases={k: v for k, v in self._aliases.items() if v is not None},
+                     named=[list(k) + [v] for k, v in self._named.items()])
+        fd, tmp = tempfile.mkstemp(dir=self.objects, suffix='.tmp')
+        with os.fdopen(fd, 'wt', encoding='utf8') as fout:
+            json.dump(index, fout, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, self.index_path)
+
+    def _store_blob(self, src_path, md5, ext):
+        """
+        把临时文件移到内容路径，已有同样内容的则丢掉临时文件。
+        内容文件设为只读：别名都是它的硬链接，就地改写一个别名会改掉所有别名的内容。
+        """
+        blob = self.blob_path(md5, ext)
+        if os.path.exists(blob):
+            os.remove(src_path)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.chmod(src_path, 0o444)
+            os.replace(src_path, blob)
+        return blob
+
+    def _link(self, blob, alias):
+        """建别名文件，已存在时抛 FileExistsError。"""
+        path = os.path.join(self.root, alias)
+        try:
+            os.link(blob, path)
+        except FileExistsError:
+            raise
+        except OSError:
+            # 不支持硬链接的文件系统，退回复制
+            with open(blob, 'rb') as fin, open(path, 'xb') as fout:
+                shutil.copyfileobj(fin, fout)
+
+    def alias(self, blob, md5, name, ext, min_prefix=0):
+        """
+        给内容取别名：同名同内容的返回已有别名；否则依次尝试 {name}{ext}、{name}.{md5[:k]}{ext}，取第一个没被占用的。
+        ```
+        :param blob: 内容文件路径
+        :param md5: 内容md5
+        :param name: 名字
+        :param ext: 扩展名，例如 .csv、.json
+        :param min_prefix: 最少带几位md5，0为先试不带md5的名字
+        :return: 别名（root下的文件名）
+        ```
+        """
+        with self._lock, self._file_lock():
+            self._load()
+            known = self._named.get((name, ext, md5))
+            if known is not None and self._aliases.get(known) == md5:
+                if os.path.exists(os.path.join(self.root, known)):
+                    return known
+                # 别名文件被删了，这个名字可以重新用
+                del self._aliases[known]
+            candidates = ([f'{name}{ext}'] if min_prefix == 0 else []) + \
+                         [f'{name}.{md5[:k]}{ext}' for k in range(max(1, min_prefix), len(md5) + 1)]
+            for alias in candidates:
+                if alias in self._aliases:
+                    continue
+                try:
+                    self._link(blob, alias)
+                except FileExistsError:
+                    # 目录里有这个文件但索引里没有（不是经这里保存的，或登记前出错留下的）
+                    self._aliases[alias] = None
+                    continue
+                self._aliases[alias] = md5
+                self._named[(name, ext, md5)] = alias
+                self._save()
+                return alias
+            raise FileExistsError(f'no free alias for {name}{ext}')
+
+    def put_file(self, src_path, md5, name, ext):
+        """
+        保存已经算好md5的临时文件，返回别名。临时文件会被移走或删除。
+        ```
+        :param src_path: 临时文件，须与root在同一个文件系统
+        :param md5: 文件内容md5
+        :param name: 名字
+        :param ext: 扩展名
+        :return: 别名
+        ```
+        """
+        return self.alias(self._store_blob(src_path, md5, ext), md5, name, ext)
+
+    def put_bytes(self, data, name, ext, min_prefix=0):
+        """保存一段内容，返回别名。"""
+        md5 = hashlib.md5(data).hexdigest()
+        blob = self.blob_path(md5, ext)
+        if not os.path.exists(blob):
+            os.makedirs(self.objects, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.objects, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as fout:
+                fout.write(data)
+            self._store_blob(tmp, md5, ext)
+        return self.alias(blob, md5, name, ext, min_prefix=min_prefix)
+
+    def digest(self, alias):
+        """
+        别名的内容md5：别名文件仍是内容文件的硬链接时直接返回，否则（不是经这里保存的、或被改写过）返回None。
+        """
+        with self._lock:
+            if self._aliases is None or self._aliases.get(alias) is None:
+                # 可能是其他进程刚登记的别名
+                self._load()
+            md5 = self._aliases.get(alias)
+        if md5 is None:
+            return None
+        ext = os.path.splitext(alias)[1]
+        try:
+            if os.path.samefile(os.path.join(self.root, alias), self.blob_path(md5, ext)):
+                return md5
+        except OSError:
+            pass
+        return None
@@ -0,0 +1,463 @@
+"""
+网格交易回测引擎。
+
+grid_func 一次只回测一组参数，记录交易明细和每个数据点的总价值。
+参数搜索时把多组网格参数叠成参数矩阵，在同一条时间循环里用 NumPy 同步推进所有参数组，
+每组参数的交易规则与 grid_func 完全一致，最终输出与 report_data 相同的汇总结果。
+"""
+import numpy as np
+
+from .range_index import RangeIndex
+
+# 网格参数字段，顺序与 grid_func 的参数一致
+_param_keys = ('touruzijin', 'jizhunjia', 'dancifene', 'jiancangfene',
+               'wanggeshangjie', 'wanggexiajie', 'wanggeleixing', 'mairuyuzhi', 'maichuyuzhi',
+               'shouxufeilv')
+# 剪枝时每条序列大约检查上界的次数
+_check_times = 64
+
+
+def make_report_data(values_len, shoupanjia, touruzijin, jizhunjia, xianjin, totalfene,
+                     zongjiaoyicishu, kaishi_idx):
+    """
+    生成回测的汇总结果，grid_func 与批量引擎共用。
+    ```
+    :param values_len: 回测数据长度
+    :param shoupanjia: 最后一个数据的价格
+    :param touruzijin: 投入资金
+    :param jizhunjia: 基准价格
+    :param xianjin: 最终现金
+    :param totalfene: 最终份额
+    :param zongjiaoyicishu: 总交易次数
+    :param kaishi_idx: 开始交易的位置
+    :return:
+    ```
+    """
+    # numpy标量转为Python数，round按Python的规则舍入，与逐tick回测读Python列表时相同
+    shoupanjia, jizhunjia, xianjin, totalfene = (v.item() if isinstance(v, np.generic) else v
+                                                 for v in (shoupanjia, jizhunjia, xianjin, totalfene))
+    zongjiazhi = (xianjin + totalfene * shoupanjia)
+    xianjin = round(xianjin, 4)
+    return dict(
+        touruzijin=touruzijin,
+        zongjiaoyicishu=zongjiaoyicishu,
+        zongjiageshu=values_len - kaishi_idx,
+        kaishijiaoyidian=kaishi_idx,
+        kanpanjia=jizhunjia,
+        xianjin=xianjin,
+        totalfene=totalfene,
+        shoupanjia=shoupanjia,
+        fenejiazhi=totalfene * shoupanjia,
+        zongjiazhi=round(xianjin + totalfene * shoupanjia, 4),
+        yinkuibili=round(zongjiazhi / touruzijin, 4)
+    )
+
+
+def grid_func(shuju, touruzijin, jizhunjia, dancifene, jiancangfene,
+              wanggeshangjie, wanggexiajie, wanggeleixing, mairuyuzhi, maichuyuzhi,
+              shouxufeilv=0.0001, index=None, **kwargs):
+    """
+    网格交易回测
+    ```
+    :param shuju: 股票所有数据
+    :param touruzijin: 投入资金
+    :param jizhunjia: 基准价格，设置为0则为回测的第一个数据
+    :param dancifene: 买入卖出单次交易股数，等股交易
+    :param jiancangfene: 起始建仓股数
+    :param wanggeshangjie: 网格上界
+    :param wanggexiajie: 网格下界
+    :param wanggeleixing: 网格类型，1为差价，2为百分比
+    :param mairuyuzhi: 买入阈值，差价或百分比
+    :param maichuyuzhi: 卖出阈值，差价或百分比
+    :param shouxufeilv: 手续费率，默认0.01%，0.1元起
+    :param index: 数据的区间最值索引RangeIndex，不传则现建
+    :return:
+    ```
+    """
+    values = shuju
+    # 暂用起始价来做基准价
+    if not jizhunjia:
+        jizhunjia = values[0]
+
+    # 基准价是否限制在网格上下界
+    # if wanggexiajie <= values[0] <= wanggeshangjie:
+    #     jizhunjia = values[0]
+    # elif values[0] < wanggexiajie:
+    #     jizhunjia = wanggexiajie
+    # else:
+    #     jizhunjia = wanggeshangjie
+
+    # 是否建立起始仓位
+    xianjin = touruzijin - jiancangfene * jizhunjia
+    # 总共份额数
+    totalfene = jiancangfene
+    jizhunjingzhi = jizhunjia
+
+    # 找股价达到基准价的时刻，基准价在前后两个股价之间则开始交易
+    if index is None:
+        index = RangeIndex(values)
+    kaishi_idx = index.first_cross(jizhunjia)
+    if kaishi_idx >= 0:
+        jizhunjingzhi = values[kaishi_idx]
+    else:
+        kaishi_idx = 0
+
+    maichu_jiazhi, mairu_jiazhi = [], []
+    maichu_idx, mairu_idx = [], []
+
+    jiazhi_lst = []
+    for i in range(0, len(values), 1):
+        # 记录每一天的总价值
+        if i < kaishi_idx:
+            jiazhi_lst.append(touruzijin)
+            # 股价达到基准价时候开始交易
+            continue
+
+        # 获取当时股价净值
+        dangshijingzhi = values[i]
+        jiazhi_lst.append(xianjin + totalfene * dangshijingzhi)
+
+        # 涨破上界
+        if dangshijingzhi > wanggeshangjie:
+            continue
+
+        # 跌破下界
+        if dangshijingzhi < wanggexiajie:
+            continue
+
+        if wanggeleixing == 1:
+            # 差价网格
+            maichujia = jizhunjingzhi + maichuyuzhi
+        else:
+            # 比例网格
+            maichujia = jizhunjingzhi * (1 + maichuyuzhi / 100)
+        # 卖出基金
+        if dangshijingzhi >= maichujia and totalfene >= dancifene:
+            totalfene -= dancifene
+            shouxufei = max(0.1, shouxufeilv * dangshijingzhi * dancifene)
+            xianjin += (dangshijingzhi * dancifene - shouxufei)
+            maichu_idx.append(i)
+            maichu_jiazhi.append(xianjin + totalfene * dangshijingzhi)
+
+            # 用成交价更新基准价
+            jizhunjingzhi = dangshijingzhi
+
+            # 可能出现当时净值高于多个网格的情况
+            gengxin_idx = 0
+            continue
+
+        if wanggeleixing == 1:
+            # 差价网格
+            mairujia = jizhunjingzhi - mairuyuzhi
+        else:
+            # 比例网格
+            mairujia = jizhunjingzhi * (1 - mairuyuzhi / 100)
+        # 买入基金
+        if dangshijingzhi <= mairujia and xianjin >= (1 + shouxufeilv) * dancifene * dangshijingzhi:
+            totalfene += dancifene
+            shouxufei = max(0.1, shouxufeilv * dangshijingzhi * dancifene)
+            xianjin -= (dangshijingzhi * dancifene + shouxufei)
+            mairu_idx.append(i)
+            mairu_jiazhi.append(xianjin + totalfene * dangshijingzhi)
+
+            # 用成交价更新基准价
+            jizhunjingzhi = dangshijingzhi
+
+            # 可能出现当时净值低于多个网格的情况
+            gengxin_idx = 0
+            continue
+    zongjiazhi = (xianjin + totalfene * values[-1])
+    report_content = ("投入资金：{}，回报总价值：{:.3f}（其中现金：{:.3f}，份额价值：{:.3f}），盈亏比例：{:.2f}%".format(
+        touruzijin, zongjiazhi, xianjin, totalfene * values[-1], (zongjiazhi / touruzijin) * 100))
+
+    report_data = make_report_data(values_len=len(values), shoupanjia=values[-1], touruzijin=touruzijin,
+                                   jizhunjia=jizhunjia, xianjin=xianjin, totalfene=totalfene,
+                                   zongjiaoyicishu=len(mairu_idx) + len(maichu_idx), kaishi_idx=kaishi_idx)
+    # from pprint import pprint
+
+    # pprint(report_content)
+    result = dict(report_conclusion=dict(report_content=report_content, report_data=report_data),
+                  trading_detail=dict(maichu_jiazhi=maichu_jiazhi, maichu_idx=maichu_idx,
+                                      mairu_jiazhi=mairu_jiazhi, mairu_idx=mairu_idx,
+                                      jiazhi_lst=jiazhi_lst))
+    return result
+
+
+def stack_params(params):
+    """
+    把参数字典列表叠成参数矩阵。
+    ```
+    :param params: 网格参数字典列表，字段同 grid_func
+    :return: dict，每个字段一列 np.ndarray
+    ```
+    """
+    columns = {}
+    for key in _param_keys:
+        if key == 'shouxufeilv':
+            columns[key] = np.array([p.get(key, 0.0001) for p in params], dtype=np.float64)
+        else:
+            columns[key] = np.array([p[key] for p in params], dtype=np.float64)
+    return columns
+
+
+def _bar_first_cross(cols4, bar_index, jizhunjia):
+    """
+    在K线上找股价达到基准价的时刻，位置按展开后的数据点计，规则同 RangeIndex.first_cross。
+    :return: 位置，没有则返回-1
+    """
+    nbars = len(cols4[0])
+    v0 = cols4[0][0]
+    if v0 == jizhunjia:
+        return 0
+    shangchuan = v0 < jizhunjia
+    lo, hi = (-np.inf, jizhunjia) if shangchuan else (jizhunjia, np.inf)
+    # 第一根K线从第二个数据点开始找，之后用K线索引跳到最高价/最低价达到基准价的K线
+    for b in (0, bar_index.first_outside(1, lo, hi)):
+        if b >= nbars:
+            break
+        for k in range(1 if b == 0 else 0, 4):
+            v = cols4[k][b]
+            if (v >= jizhunjia) if shangchuan else (v <= jizhunjia):
+                return b * 4 + k - 1
+    return -1
+
+
+def upper_bound(suffix, t, shoupanjia, xianjin, totalfene, dancifene, wanggeshangjie, wanggexiajie,
+                chajia, mairuyuzhi, maichuyuzhi):
+    """
+    从第t个数据点回测到最后，最终总价值的上界（乐观估计）。
+    ```
+    之后每次交易都在网格上下界内、以当时价格成交，最终总价值为
+        现金 + 份额*收盘价 + sum(每次交易的份额变化*(收盘价-成交价)) - 手续费
+    每次交易最多贡献 单次交易股数*max(收盘价-最低成交价, 最高成交价-收盘价)，成交价取后缀最高/最低价与上下界的交集；
+    相邻两次交易之间价格至少变化一个网格大小，交易次数不超过 1 + 后缀价格变化总量/网格大小。
+    :param suffix: BarSeries.suffix_stats 的返回值
+    :param t: 数据点位置，状态为处理完第t个数据点之前的现金和份额
+    :return: np.ndarray，每组参数的总价值上界
+    ```
+    """
+    suf_max, suf_min, suf_bianhua = suffix
+    jia_hi = np.minimum(wanggeshangjie, suf_max[t])
+    jia_lo = np.maximum(wanggexiajie, suf_min[t])
+    # 百分比网格：成交价不低于下界，相邻交易的价格变化不小于 下界*网格大小%
+    wangge = np.minimum(mairuyuzhi, maichuyuzhi)
+    wangge = np.where(chajia, wangge, wanggexiajie * wangge / 100)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cishu = np.where(wangge > 0, 1 + np.floor(suf_bianhua[t] / wangge), np.inf)
+    # 价格再也进不了网格上下界，不会再交易
+    cishu = np.where(jia_lo <= jia_hi, cishu, 0)
+    shouyi = np.maximum(np.maximum(shoupanjia - jia_lo, jia_hi - shoupanjia), 0)
+    with np.errstate(invalid='ignore'):
+        extra = np.where(cishu > 0, cishu * dancifene * shouyi, 0)
+    return xianjin + totalfene * shoupanjia + extra
+
+
+def grid_func_bars(series, params, path=None, threshold=None):
+    """
+    直接在K线上做批量网格交易回测，不把K线展开成数据点。
+    ```
+    每根K线按K线内价格路径依次判断四个数据点，结果与按同一路径展开后用 grid_func 逐组回测完全一致；
+    最高价和最低价都碰不到触发价的K线整根跳过。开始交易点等位置仍按数据点计（K线序号*4+点序号）。
+    传入threshold时，定期用 upper_bound 估计每组参数最终盈亏比例的上界，上界低于threshold的参数组提前放弃（剪枝），
+    剪枝的参数组不再参与回测，返回结果里 jianzhi 标记为True，shangxian 为放弃时的总价值上界。
+    :param series: BarSeries
+    :param params: 网格参数字典列表，或 stack_params 生成的参数矩阵
+    :param path: K线内的价格路径，OHLC、OLHC或auto，默认用 series.path
+    :param threshold: 剪枝阈值（盈亏比例），标量或每组参数一个，默认不剪枝
+    :return: dict，每组参数的最终现金xianjin、份额totalfene、交易次数zongjiaoyicishu、
+             开始交易点kaishijiaoyidian、基准价kanpanjia，剪枝标记jianzhi和总价值上界shangxian
+    ```
+    """
+    cols4 = series.path_columns(path)
+    bar_index = series.bar_index
+    n = len(series) * 4
+    cols = params if isinstance(params, dict) else stack_params(params)
+    touruzijin = cols['touruzijin']
+    # 暂用起始价来做基准价
+    jizhunjia = np.where(cols['jizhunjia'] == 0, cols4[0][0], cols['jizhunjia'])
+    dancifene = cols['dancifene']
+    shangjie, xiajie = cols['wanggeshangjie'], cols['wanggexiajie']
+    shouxufeilv = cols['shouxufeilv']
+    chajia = cols['wanggeleixing'] == 1
+
+    # 与 grid_func 相同的运算顺序，保证浮点结果一致
+    maichu_cha, mairu_cha = cols['maichuyuzhi'], cols['mairuyuzhi']
+    maichu_bi = 1 + cols['maichuyuzhi'] / 100
+    mairu_bi = 1 - cols['mairuyuzhi'] / 100
+    mairu_xishu = (1 + shouxufeilv) * dancifene
+
+    xianjin = touruzijin - cols['jiancangfene'] * jizhunjia
+    totalfene = cols['jiancangfene'].copy()
+    cishu = np.zeros(len(touruzijin), dtype=np.int64)
+
+    # 找股价达到基准价的时刻，同一基准价只查询一次
+    kaishi_idx = np.zeros(len(jizhunjia), dtype=np.int64)
+    jizhunjingzhi = jizhunjia.copy()
+    uniq, inverse = np.unique(jizhunjia, return_inverse=True)
+    for k, jzj in enumerate(uniq):
+        hit = _bar_first_cross(cols4, bar_index, jzj)
+        if hit >= 0:
+            mask = inverse == k
+            kaishi_idx[mask] = hit
+            jizhunjingzhi[mask] = cols4[hit & 3][hit >> 2]
+    kaishi_lst = np.unique(kaishi_idx)
+
+    # 剪枝：有参数组放弃时压缩参数矩阵，rows为剩下的参数组在原矩阵中的位置
+    jianzhi_all = np.zeros(len(touruzijin), dtype=bool)
+    shangxian = np.full(len(touruzijin), np.inf)
+    rows = np.arange(len(touruzijin))
+    xianjin_all, totalfene_all, cishu_all, kaishi_all = xianjin, totalfene, cishu, kaishi_idx
+    if threshold is not None:
+        suffix = series.suffix_stats(path)
+        threshold = np.broadcast_to(np.asarray(threshold, dtype=np.float64), touruzijin.shape)
+        shoupanjia = float(cols4[3][-1])
+        check_step = max(n // _check_times, 4)
+    next_check = -1 if threshold is not None else n
+
+    t, next_start, gengxin = int(kaishi_lst[0]) if len(kaishi_lst) else n, -1, True
+    while t < n:
+        if t >= next_check:
+            # 最终盈亏比例的上界都达不到阈值的参数组提前放弃；留余量，避免浮点误差误剪
+            bound = upper_bound(suffix, t, shoupanjia, xianjin, totalfene, dancifene, shangjie, xiajie,
+                                chajia, mairu_cha, maichu_cha)
+            jianzhi = np.round(bound * (1 + 1e-9) / touruzijin + 1e-6, 4) < threshold
+            next_check = t + check_step
+            if jianzhi.any():
+                jianzhi_all[rows[jianzhi]] = True
+                shangxian[rows[jianzhi]] = bound[jianzhi]
+                xianjin_all[rows], totalfene_all[rows], cishu_all[rows] = xianjin, totalfene, cishu
+                if jianzhi.all():
+                    break
+                keep = ~jianzhi
+                rows = rows[keep]
+                (xianjin, totalfene, cishu, kaishi_idx, jizhunjingzhi, touruzijin, threshold, dancifene,
+                 shangjie, xiajie, shouxufeilv, chajia, maichu_cha, mairu_cha, maichu_bi, mairu_bi,
+                 mairu_xishu) = (a[keep] for a in (
+                    xianjin, totalfene, cishu, kaishi_idx, jizhunjingzhi, touruzijin, threshold, dancifene,
+                    shangjie, xiajie, shouxufeilv, chajia, maichu_cha, mairu_cha, maichu_bi, mairu_bi,
+                    mairu_xishu))
+                kaishi_lst = np.unique(kaishi_idx)
+                gengxin = True
+        if gengxin or t >= next_start:
+            # 成交或有新的参数组开始交易后，重新计算所有参数组的触发价
+            started = kaishi_idx <= t
+            pos = np.searchsorted(kaishi_lst, t, side='right')
+            next_start = int(kaishi_lst[pos]) if pos < len(kaishi_lst) else n
+            maichujia = np.where(chajia, jizhunjingzhi + maichu_cha, jizhunjingzhi * maichu_bi)
+            mairujia = np.where(chajia, jizhunjingzhi - mairu_cha, jizhunjingzhi * mairu_bi)
+            q = xianjin / mairu_xishu
+            hi = np.where(started & (totalfene >= dancifene), maichujia, np.inf).min()
+            lo = np.where(started, np.minimum(mairujia, q + np.abs(q) * 1e-9 + 1e-12), -np.inf).max()
+            gengxin = False
+
+        if not t & 3:
+            # 跳到下一根最高价或最低价碰到触发价的K线
+            t_next = bar_index.first_outside(t >> 2, lo, hi) * 4
+            if t_next >= next_start:
+                t = next_start
+                continue
+            t = t_next
+
+        dangshijingzhi = cols4[t & 3][t >> 2]
+        t += 1
+        if not (dangshijingzhi >= hi or dangshijingzhi <= lo):
+            continue
+        # 股价达到基准价且在网格上下界之内才交易
+        active = started & (dangshijingzhi <= shangjie) & (dangshijingzhi >= xiajie)
+        maichu = active & (dangshijingzhi >= maichujia) & (totalfene >= dancifene)
+        mairu = (active & ~maichu & (dangshijingzhi <= mairujia)
+                 & (xianjin >= mairu_xishu * dangshijingzhi))
+        jiaoyi = maichu | mairu
+        if not jiaoyi.any():
+            continue
+        shouxufei = np.maximum(0.1, shouxufeilv * dangshijingzhi * dancifene)
+        chengjiao = dangshijingzhi * dancifene
+        xianjin = np.where(maichu, xianjin + (chengjiao - shouxufei), xianjin)
+        xianjin = np.where(mairu, xianjin - (chengjiao + shouxufei), xianjin)
+        totalfene = np.where(maichu, totalfene - dancifene, totalfene)
+        totalfene = np.where(mairu, totalfene + dancifene, totalfene)
+        # 用成交价更新基准价
+        jizhunjingzhi = np.where(jiaoyi, dangshijingzhi, jizhunjingzhi)
+        cishu += jiaoyi
+        gengxin = True
+
+    xianjin_all[rows], totalfene_all[rows], cishu_all[rows] = xianjin, totalfene, cishu
+    return dict(xianjin=xianjin_all, totalfene=totalfene_all, zongjiaoyicishu=cishu_all,
+                kaishijiaoyidian=kaishi_all, kanpanjia=jizhunjia, values_len=n, shoupanjia=float(cols4[3][-1]),
+                jianzhi=jianzhi_all, shangxian=shangxian)
+
+
+def batch_report_data(params, batch):
+    """
+    把批量回测结果展开为每组参数的 report_data，与 grid_func 的 report_data 一致。
+    ```
+    :param params: 网格参数字典列表
+    :param batch: grid_func_bars 的返回结果
+    :return: report_data 列表
+    ```
+    """
+    shoupanjia = batch['shoupanjia']
+    jianzhi = batch.get('jianzhi')
+    out = []
+    for k, p in enumerate(params):
+        if jianzhi is not None and jianzhi[k]:
+            # 剪枝的参数组只给出盈亏比例的上界
+            out.append(dict(jianzhi=True, yinkuibili=round(float(batch['shangxian'][k]) / p['touruzijin'], 4)))
+            continue
+        jizhunjia = p['jizhunjia'] if p['jizhunjia'] else float(batch['kanpanjia'][k])
+        out.append(make_report_data(
+            values_len=batch['values_len'], shoupanjia=shoupanjia, touruzijin=p['touruzijin'], jizhunjia=jizhunjia,
+            xianjin=float(batch['xianjin'][k]), totalfene=int(batch['totalfene'][k]),
+            zongjiaoyicishu=int(batch['zongjiaoyicishu'][k]), kaishi_idx=int(batch['kaishijiaoyidian'][k])))
+    return out
+
+
+def canonical_params(series, cols):
+    """
+    参数组规范化去重：交易行为完全相同的参数组只回测一次。
+    ```
+    只有数据点价格落在 [网格下界, 网格上界] 内才交易，而数据点的价格只有有限几种，
+    所以上界可以换成不超过它的最高价格，下界换成不低于它的最低价格，例如高于全部数据的上界都等价于最高价。
+    上下界之间没有任何价格的参数组都不会交易，统一为空区间。其余字段原样参与比较：
+    基准价、建仓份额等会改变现金和份额，不能合并。
+    :param series: BarSeries
+    :param cols: stack_params 生成的参数矩阵
+    :return: (去重后的参数矩阵, 每个等价类代表在原矩阵中的位置, 原矩阵每组参数对应的等价类序号)
+    ```
+    """
+    levels = series.price_levels()
+    shangjie, xiajie = cols['wanggeshangjie'], cols['wanggexiajie']
+    i = np.searchsorted(levels, shangjie, side='right') - 1
+    j = np.searchsorted(levels, xiajie, side='left')
+    shangjie = np.where(i >= 0, levels[np.maximum(i, 0)], -np.inf)
+    xiajie = np.where(j < len(levels), levels[np.minimum(j, len(levels) - 1)], np.inf)
+    empty = shangjie < xiajie
+    shangjie, xiajie = np.where(empty, -np.inf, shangjie), np.where(empty, np.inf, xiajie)
+
+    canon = dict(cols, wanggeshangjie=shangjie, wanggexiajie=xiajie)
+    keys = np.column_stack([canon[key] for key in _param_keys])
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    return {key: v[first] for key, v in cols.items()}, first, inverse.reshape(-1)
+
+
+def run_summary(series, params, path=None, threshold=None):
+    """
+    批量回测多组参数，只返回每组参数的 report_data（汇总结果）。
+    ```
+    直接在K线上批量回测（grid_func_bars），不展开数据点，也不做逐点记录；
+    交易行为相同的参数组（见 canonical_params）只回测一次，结果再分给每组参数。
+    :param series: BarSeries
+    :param params: 网格参数字典列表
+    :param path: K线内的价格路径，默认用 series.path
+    :param threshold: 剪枝阈值（盈亏比例），剪枝的参数组返回 dict(jianzhi=True, yinkuibili=盈亏比例上界)
+    :return: report_data 列表
+    ```
+    """
+    if not len(params):
+        return []
+    cols, first, inverse = canonical_params(series, stack_params(params))
+    if threshold is not None:
+        threshold = np.broadcast_to(np.asarray(threshold, dtype=np.float64), (len(params),))[first]
+    batch = grid_func_bars(series, cols, path=path, threshold=threshold)
+    batch = {k: v[inverse] if isinstance(v, np.ndarray) else v for k, v in batch.items()}
+    return batch_report_data(params, batch)
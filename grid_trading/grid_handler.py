@@ -26,9 +26,13 @@ import os
 import pathlib
 import pprint
 import re
+import tempfile
+import time
 import traceback
 import hashlib
 import base64
+import codecs
+import io
 
 import pandas
 import pandas as pd
@@ -38,50 +42,117 @@ import matplotlib as mpl
 import numpy as np
 import tqdm
 
-from fastapi import FastAPI, File, UploadFile, Query
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, File, UploadFile, Query, Header
+from fastapi.responses import FileResponse, StreamingResponse
 from .fastapi_fixer import app
+from .grid_engine import grid_func, run_summary
+from .bar_series import BarSeries, to_epoch, bar_paths
+from .search_pool import iter_scored_chunks, ScoringPool
+from .search_stream import iter_candidates, iter_chunks, pick_candidates, TopK, QuantileSketch, SpreadCandidates
+from .search_adaptive import zoom_search, zoom_levels, coarse_density
+from .result_cache import ResultCache, pack_search_result, unpack_search_result
+from .walk_forward import walk_forward, fold_modes, split_folds
+from .job_queue import JobQueue
+from .search_cost import count_candidates, count_zoom_candidates, count_rounds, ThroughputMeter, effective_workers
+from .batch_search import expand_tokens, batch_search
+from .series_store import SeriesStore
+from .content_store import ContentStore
+from .quote_store import QuoteStore, EfinanceFetcher, FileFetcher, frame_to_series
 
-import efinance as ef
 
 # 设置字体类型
 mpl.rcParams['font.sans-serif'] = ['KaiTi']
 mpl.rcParams['font.serif'] = ['KaiTi']
 
 _data_root = 'mnt/wp'
+# 上传和解析文件时每次读的字节数
+_upload_chunk_size = 1 << 20
+# 上传的行情和网格参数文件按内容保存，数据代号和网格参数代号是别名
+_content_store = ContentStore(_data_root)
+# 下载脚本保存的行情目录，数据代号为其中的文件名
+_quote_roots = ('data/stock', 'data/Index/points')
+# 解析后的行情按文件md5保存成列式二进制，之后内存映射加载
+_series_store = SeriesStore('mnt/series')
+# 数据代号为 代码-周期 的行情：上面的行情目录里有完整覆盖的文件（或更细周期的文件，合成粗周期）时直接用；
+# 否则在线下载，按代码和周期增量保存在本地，只下载本地没有的日期；GRID_QUOTE_SOURCE=file 时不联网
+_quote_source = os.environ.get('GRID_QUOTE_SOURCE', 'efinance')
+_local_quotes = FileFetcher(_quote_roots, loader=lambda path: _series_store.load_file(path, parse_quote_csv))
+_quote_store = QuoteStore(os.path.join('mnt/quotes', _quote_source),
+                          _local_quotes if _quote_source == 'file' else EfinanceFetcher())
+# 批量回测引擎每次同步推进的参数组数
+_batch_size = 4096
+# 限时搜索和有进度回调时每块的候选数，块小一些，超时后能及时停下，进度也更新得勤（回测速度约慢5%）
+_budget_batch_size = 1024
+# 盈亏比例分位数草图每层的样本数，候选数不超过它时抽样结果是精确的
+_sketch_size = 1 << 16
+# 自适应搜索剪枝阈值的分段长度：比任何一批候选都长，每批都用这批开始时的阈值
+_zoom_stride = 1 << 62
+# 参数搜索策略：grid为全网格搜索，zoom为先粗后细的自适应搜索
+_search_strategies = ('grid', 'zoom')
+# 搜索和评估结果的磁盘缓存，回测规则或结果格式变化时增加版本号，使旧缓存失效
+_result_cache = ResultCache('mnt/cache', max_bytes=512 << 20)
+_cache_version = 1
+# 参数里描述数据的字段，缓存按数据内容区分，不看这些字段的写法
+_data_keys = ('data_token', 'data_start_index', 'data_end_index')
+# 后台任务队列，同时运行的任务数有上限，其余排队
+_job_queue = JobQueue(max_workers=2)
+# 预计耗时超过上限（秒）的搜索：同步请求直接拒绝，后台任务放到单独的队列逐个运行，不挤占其他任务
+_search_budget_seconds = float(os.environ.get('GRID_SEARCH_BUDGET_SECONDS', 600))
+_large_job_queue = JobQueue(max_workers=1)
+# 批量搜索的默认搜索密度，接口和命令行共用
+_batch_n_search = 4
+# 最近实际搜索的回测速度，用来预计搜索耗时；保存在磁盘上，重启后不用重新现场测
+_cost_meter = ThroughputMeter('mnt/throughput.json')
 
 
 @app.post('/do_loading')
 @app.post('/load_data')
-def load_data(file: bytes = File(...), name: str = "data_token"):
+def load_data(file: UploadFile = File(...), name: str = "data_token"):
     """
     加载股票数据Excel。
+    按块读取上传的文件，边写临时文件边计算md5和解析，最后按内容md5保存、以name取别名，内存占用与文件大小无关。
     ```
     :param file: Excel文件。
     :param name: 最后生成的data_token基于name。
     :return:
     ```
     """
+    tmp_path = None
     try:
-        # file.read()
-        # file.filename
         if not os.path.exists(_data_root):
             os.makedirs(_data_root)
-        # token = base64.urlsafe_b64encode(hashlib.md5(b'').digest()).decode()[:-2]
-        token = hashlib.md5(file).hexdigest()
-        fname = f'{name}.csv'
-        cnt = 1
-        while os.path.exists(os.path.join(_data_root, fname)):
-            fname = f'{name}.{token[:cnt]}.csv'
-            cnt += 1
-
+        md5, parser = hashlib.md5(), ExcelStreamParser()
+        with tempfile.NamedTemporaryFile(dir=_data_root, prefix='.upload.', delete=False) as fout:
+            tmp_path = fout.name
+            for chunk in iter(lambda: file.file.read(_upload_chunk_size), b''):
+                fout.write(chunk)
+                md5.update(chunk)
+                if parser is not None:
+                    try:
+                        parser.feed(chunk)
+                    except Exception:
+                        # 不是能解析的行情，照样保存，用到时再报错
+                        parser = None
+        token = md5.hexdigest()
+        series = None
+        if parser is not None:
+            try:
+                series = parser.close()
+            except Exception:
+                pass
+
+        # 按内容保存，同名同内容的重复上传直接返回已有的数据代号
+        fname = _content_store.put_file(tmp_path, token, name, '.csv')
         fname_path = os.path.join(_data_root, fname)
-        with open(fname_path, 'wb') as f:
-            f.write(file)
+        if series is not None:
+            _series_store.put_file(fname_path, token, series, parse_excel)
         return dict(success=1, message='data loaded success.', data=dict(data_token=fname))
     except Exception:
         exc = traceback.format_exc()
         return dict(success=0, message=f'Failed to load data.\n{exc}')
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 
 @app.post('/run_example2')
@@ -89,6 +160,19 @@ def run_example2():
     run_example()
 
 
+def write_json(path, out, **kwargs):
+    """
+    结果文件先写临时文件再改名，同一个结果文件的任务并发时读到的总是某一次完整的结果。
+    ```
+    :param kwargs: json.dump 的参数
+    ```
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wt', encoding='utf8') as fout:
+        json.dump(out, fout, ensure_ascii=False, **kwargs)
+    os.replace(tmp, path)
+
+
 @app.get('/do_trading')
 def do_trading(
         grid_token_evaluating: str = Query('',
@@ -154,30 +238,20 @@ def do_trading(
         )
 
     data_token = grid_params['data_token']
-    names, data = parse_data(data_token, data_start_index, data_end_index)
+    names, data = parse_data(data_token, data_start_index, data_end_index).to_lists()
     params_json = json.dumps(grid_params, ensure_ascii=False, indent=4)
-    token = hashlib.md5(params_json.encode('utf8')).hexdigest()
-    fname = f'{data_token}.{name}.json'
-    cnt = 1
-    while os.path.exists(os.path.join(_data_root, fname)):
-        fname = f'{data_token}.{name}.{token[:cnt]}.json'
-        cnt += 1
-    grid_token = fname
+    # 按内容保存参数文件，同样的参数和name得到同一个grid_token
+    grid_token = _content_store.put_bytes(params_json.encode('utf8'), f'{data_token}.{name}', '.json')
 
     result = grid_func(shuju=data,  # 数据
                        **grid_params)
     # 投入资金：10000，回报总价值：17342.759（其中现金：8740.759，份额价值：8602.000），盈亏比例：73.43%
     # display(shoupan=shoupan, maichu_idx=maichu_idx, mairu_idx=mairu_idx)
 
-    fname_path = os.path.join(_data_root, grid_token)
-    with open(fname_path, 'wt') as f:
-        f.write(params_json)
-
     data = dict(data_token=data_token, grid_token=grid_token, grid_params=grid_params, data=data, names=names)
     result_path = os.path.join(_data_root, f'grid_token={grid_token}.trading.json')
-    with open(result_path, 'wt', encoding='utf8') as fout:
-        out = dict(result=result, data=data, data_token=data_token, grid_token=grid_token)
-        json.dump(out, fout, ensure_ascii=False, indent=4)
+    out = dict(result=result, data=data, data_token=data_token, grid_token=grid_token)
+    write_json(result_path, out, indent=4)
 
     return dict(success=1, message='do trading success.',
                 data=dict(grid_token=grid_token, data_token=data_token, result=result['report_conclusion']))
@@ -202,15 +276,30 @@ def do_searching(
         # maichuyuzhi: float = Query(0.5, description='网格大小，卖出阈值，差价或百分比'),
         shouxufeilv: float = Query(0.0001, description='手续费率，默认0.01%，0.1元起'),
         n_search: int = Query(4, description='搜索密度，数量越大越精细，但耗时越久，默认4'),
-        topn: int = Query(10, description='返回最佳收益的结果数，默认10')
+        topn: int = Query(10, description='返回最佳收益的结果数，默认10'),
+        workers: int = Query(1, description='并行搜索的进程数，默认1为单进程，结果与进程数无关'),
+        strategy: str = Query('grid', description='搜索策略：grid为全网格搜索，'
+                                                  'zoom为先粗后细的自适应搜索，回测次数少一个数量级，默认grid'),
+        prune: bool = Query(False, description='是否剪枝：回测途中就能确定进不了前topn的参数组提前放弃，'
+                                               '最佳结果不变，默认不剪枝'),
+        max_seconds: float = Query(0, description='搜索的时间预算（秒）：候选按均匀覆盖参数空间的顺序回测，'
+                                                  '到时返回已找到的最佳结果和覆盖比例，默认0为不限时'),
+        path: str = Query('', description='K线内的价格路径：OHLC为开-高-低-收，OLHC为开-低-高-收，'
+                                          'auto为先到离开盘价近的极值，默认空为数据自己的路径'),
+        background: bool = Query(False, description='是否后台运行：立即返回任务id，'
+                                                    '用/jobs/{job_id}查看进度和结果，默认否')
 ):
     """
     网格交易参数搜索。
     """
+    if strategy not in _search_strategies:
+        return dict(success=0, message=f'参数搜索失败，原因：不支持的搜索策略{strategy}，'
+                                       f'可选：{"、".join(_search_strategies)}')
+    if path and path not in bar_paths:
+        return dict(success=0, message=f'参数搜索失败，原因：不支持的K线内价格路径{path}，可选：{"、".join(bar_paths)}')
     # jizhunjia = 0, dancifene = 100,
     # jiancangfene = 1000,
     # wanggeshangjie = 12, wanggexiajie = 6, wanggeleixing = 1, mairuyuzhi = 0.5, maichuyuzhi = 0.5,
-    names, data = parse_data(data_token, data_start_index, data_end_index)
 
     # grid_path = os.path.join(_data_root, grid_token)
     # if os.path.isfile(grid_path):
@@ -232,33 +321,51 @@ def do_searching(
         shouxufeilv=float(shouxufeilv),  # 手续费率
     )
 
+    # 准入控制：预计耗时超过上限的，同步请求拒绝，后台任务放到大任务队列
+    try:
+        cost = estimate_search_cost(grid_params, n_search=int(n_search), topn=int(topn), workers=int(workers),
+                                    strategy=strategy, prune=bool(prune), max_seconds=float(max_seconds), path=path)
+    except ValueError as e:
+        return dict(success=0, message=f'参数搜索失败，原因：{e}')
+    if cost['over_budget'] and not background:
+        return dict(success=0, message=f'参数搜索失败，原因：{over_budget_message(cost)}', data=cost)
+
+    search = dict(n_search=int(n_search), topn=int(topn), strategy=strategy, prune=bool(prune),
+                  max_seconds=float(max_seconds), path=path)
+    # 参数和搜索条件按内容保存，grid_token随之而定：同一份数据上条件不同的搜索（例如grid和zoom）结果文件不会互相覆盖，
+    # 条件相同的搜索结果相同，共用一个结果文件。进程数不影响结果，不记在里面
+    spec_json = json.dumps(dict(grid_params, search=search), ensure_ascii=False, indent=4)
+    grid_token = _content_store.put_bytes(spec_json.encode('utf8'), f'{data_token}.{name}', '.json')
+    run = functools.partial(run_searching, grid_params, grid_token, workers=int(workers), **search)
+    if background:
+        queue = _large_job_queue if cost['over_budget'] else _job_queue
+        job = queue.submit('searching', lambda job: run(progress=job.progress),
+                           params=dict(grid_token=grid_token, data_token=data_token))
+        return dict(success=1, message='searching job submitted.',
+                    data=dict(job_id=job.id, grid_token=grid_token, data_token=data_token, cost=cost))
+    return dict(success=1, message='do searching success.', data=run())
+
+
+def run_searching(grid_params, grid_token, progress=None, **kwargs):
+    """
+    参数搜索并写结果文件 grid_token=...searching.json，同步请求和后台任务共用。
+    :param kwargs: search_params 的搜索参数
+    :return: dict(grid_token, data_token, result)
+    """
+    data_token = grid_params['data_token']
+    names, data = parse_data(data_token, grid_params['data_start_index'], grid_params['data_end_index']).to_lists()
     params_json = json.dumps(grid_params, ensure_ascii=False, indent=4)
-    token = hashlib.md5(params_json.encode('utf8')).hexdigest()
-    fname = f'{data_token}.{name}.json'
-    cnt = 1
-    while os.path.exists(os.path.join(_data_root, fname)):
-        fname = f'{data_token}.{name}.{token[:cnt]}.json'
-        cnt += 1
-    grid_token = fname
-
-    result = search_params(param=params_json, n_search=int(n_search), topn=int(topn))
+    result = search_params(param=params_json, progress=progress, **kwargs)
     # result = grid_func(shuju=data,  # 数据
     #                    **grid_params)
     # 投入资金：10000，回报总价值：17342.759（其中现金：8740.759，份额价值：8602.000），盈亏比例：73.43%
     # display(shoupan=shoupan, maichu_idx=maichu_idx, mairu_idx=mairu_idx)
 
-    fname_path = os.path.join(_data_root, grid_token)
-    with open(fname_path, 'wt') as f:
-        f.write(params_json)
-
     data = dict(data_token=data_token, grid_token=grid_token, grid_params=grid_params, data=data, names=names)
     result_path = os.path.join(_data_root, f'grid_token={grid_token}.searching.json')
-    with open(result_path, 'wt', encoding='utf8') as fout:
-        out = dict(result=result, data=data, data_token=data_token, grid_token=grid_token)
-        json.dump(out, fout, ensure_ascii=False, indent=4)
-
-    return dict(success=1, message='do searching success.',
-                data=dict(grid_token=grid_token, data_token=data_token, result=result))
+    out = dict(result=result, data=data, data_token=data_token, grid_token=grid_token)
+    write_json(result_path, out, indent=4)
+    return dict(grid_token=grid_token, data_token=data_token, result=result)
 
 
 @app.get('/do_evaluating')
@@ -284,12 +391,34 @@ def do_evaluating(
         # maichuyuzhi: float = Query(0.5, description='网格大小，卖出阈值，差价或百分比'),
         shouxufeilv: float = Query(0.0001, description='手续费率，默认0.01%，0.1元起'),
         n_search: int = Query(4, description='搜索密度，数量越大越精细，但耗时越久，默认4'),
-        topn: int = Query(10, description='返回最佳收益的结果数，默认10')
+        topn: int = Query(10, description='返回最佳收益的结果数，默认10'),
+        workers: int = Query(1, description='并行搜索的进程数，默认1为单进程，结果与进程数无关'),
+        strategy: str = Query('grid', description='搜索策略：grid为全网格搜索，'
+                                                  'zoom为先粗后细的自适应搜索，回测次数少一个数量级，默认grid'),
+        prune: bool = Query(False, description='是否剪枝：回测途中就能确定进不了前topn的参数组提前放弃，'
+                                               '最佳结果不变，默认不剪枝'),
+        max_seconds: float = Query(0, description='搜索的时间预算（秒）：候选按均匀覆盖参数空间的顺序回测，'
+                                                  '到时返回已找到的最佳结果和覆盖比例，默认0为不限时'),
+        path: str = Query('', description='K线内的价格路径：OHLC为开-高-低-收，OLHC为开-低-高-收，'
+                                          'auto为先到离开盘价近的极值，默认空为数据自己的路径'),
+        n_folds: int = Query(0, description='滚动验证的折数：把训练起始时间到验证结束时间按交易日切成n_folds+1段，'
+                                            '每折用前面的数据搜索、紧接着的一段验证，各折按workers并行；默认0为只验证一次'),
+        fold_mode: str = Query('rolling', description='滚动验证的切分方式：rolling为只用前一段训练，'
+                                                      'anchored为从第一段训练到前一段，默认rolling'),
+        background: bool = Query(False, description='是否后台运行：立即返回任务id，'
+                                                    '用/jobs/{job_id}查看进度和结果，默认否')
 
 ):
     """
     网格交易参数搜索和评估。
     """
+    if strategy not in _search_strategies:
+        return dict(success=0, message=f'参数评估失败，原因：不支持的搜索策略{strategy}，'
+                                       f'可选：{"、".join(_search_strategies)}')
+    if path and path not in bar_paths:
+        return dict(success=0, message=f'参数评估失败，原因：不支持的K线内价格路径{path}，可选：{"、".join(bar_paths)}')
+    if fold_mode not in fold_modes:
+        return dict(success=0, message=f'参数评估失败，原因：不支持的切分方式{fold_mode}，可选：{"、".join(fold_modes)}')
     # jizhunjia = 0, dancifene = 100,
     # jiancangfene = 1000,
     # wanggeshangjie = 12, wanggexiajie = 6, wanggeleixing = 1, mairuyuzhi = 0.5, maichuyuzhi = 0.5,
@@ -315,47 +444,177 @@ def do_evaluating(
         shouxufeilv=float(shouxufeilv),  # 手续费率
     )
 
-    params_json = json.dumps(grid_params, ensure_ascii=False, indent=4)
-    token = hashlib.md5(params_json.encode('utf8')).hexdigest()
-    fname = f'{data_token}.{name}.json'
-    cnt = 1
-    while os.path.exists(os.path.join(_data_root, fname)):
-        fname = f'{data_token}.{name}.{token[:cnt]}.json'
-        cnt += 1
-    grid_token = fname
-
-    # 训练集搜索最佳参数
-    result = search_params(param=params_json, n_search=int(n_search), topn=int(topn))
-
-    # 评估验证集
-    names, data = parse_data(data_token, data_eval_start_index, data_eval_end_index)
-
-    for dt in result["result_topn"]:
-        res = grid_func(shuju=data, **dt["param"])
-        rep = res['report_conclusion']['report_data']
-        dt["result_evaluating"] = rep
-
-    for dt in result["result_examples"]:
-        res = grid_func(shuju=data, **dt["param"])
-        rep = res['report_conclusion']['report_data']
-        dt["result_evaluating"] = rep
-        # result = grid_func(shuju=data,  # 数据
+    # 准入控制：预计耗时超过上限的，同步请求拒绝，后台任务放到大任务队列
+    try:
+        cost = estimate_search_cost(grid_params, n_search=int(n_search), topn=int(topn), workers=int(workers),
+                                    strategy=strategy, prune=bool(prune), max_seconds=float(max_seconds), path=path,
+                                    n_folds=int(n_folds), fold_mode=fold_mode, data_end_index=data_eval_end_index)
+    except ValueError as e:
+        return dict(success=0, message=f'参数评估失败，原因：{e}')
+    if cost['over_budget'] and not background:
+        return dict(success=0, message=f'参数评估失败，原因：{over_budget_message(cost)}', data=cost)
+
+    search = dict(n_search=int(n_search), topn=int(topn), strategy=strategy, prune=bool(prune),
+                  max_seconds=float(max_seconds), path=path)
+    evaluate = dict(data_eval_start_index=data_eval_start_index, data_eval_end_index=data_eval_end_index,
+                    n_folds=int(n_folds), fold_mode=fold_mode)
+    # 参数、搜索和评估条件按内容保存，grid_token随之而定，条件不同的评估结果文件不会互相覆盖（同 do_searching）
+    spec_json = json.dumps(dict(grid_params, search=search, evaluate=evaluate), ensure_ascii=False, indent=4)
+    grid_token = _content_store.put_bytes(spec_json.encode('utf8'), f'{data_token}.{name}', '.json')
+    run = functools.partial(run_evaluating, grid_params, grid_token, workers=int(workers), **evaluate, **search)
+    if background:
+        queue = _large_job_queue if cost['over_budget'] else _job_queue
+        job = queue.submit('evaluating', lambda job: run(progress=job.progress),
+                           params=dict(grid_token=grid_token, data_token=data_token))
+        return dict(success=1, message='evaluating job submitted.',
+                    data=dict(job_id=job.id, grid_token=grid_token, data_token=data_token, cost=cost))
+    try:
+        data = run()
+    except ValueError as e:
+        return dict(success=0, message=f'参数评估失败，原因：{e}')
+    return dict(success=1, message='do evaluating success.', data=data)
+
+
+def run_evaluating(grid_params, grid_token, data_eval_start_index, data_eval_end_index, n_folds=0,
+                   fold_mode='rolling', workers=1, progress=None, **kwargs):
+    """
+    参数搜索和评估并写结果文件 grid_token=...evaluating.json，同步请求和后台任务共用。
+    :param kwargs: search_params 的搜索参数
+    :return: dict(grid_token, data_token, result)
+    """
+    data_token = grid_params['data_token']
+    path = kwargs.get('path')
+    if n_folds > 0:
+        # 滚动验证：训练起始到验证结束的整段行情只加载一次，各折用切片
+        series = parse_data(data_token, grid_params['data_start_index'], data_eval_end_index)
+        if path:
+            series = series.with_path(path)
+        search = functools.partial(search_series, **kwargs)
+        result = walk_forward(series, grid_params, n_folds, search, evaluate_params,
+                              mode=fold_mode, workers=workers, progress=progress)
+    else:
+        # 训练集搜索最佳参数
+        params_json = json.dumps(grid_params, ensure_ascii=False, indent=4)
+        result = search_params(param=params_json, workers=workers, progress=progress, **kwargs)
+
+        # 评估验证集，K线内的价格路径与搜索时相同
+        series = parse_data(data_token, data_eval_start_index, data_eval_end_index)
+        if path:
+            series = series.with_path(path)
+
+        dts = result["result_topn"] + result["result_examples"]
+        params = [dt["param"] for dt in dts]
+        for dt, rep in zip(dts, evaluate_params(series, params)):
+            dt["result_evaluating"] = rep
+    names, data = series.to_lists()
+    # result = grid_func(shuju=data,  # 数据
     #                    **grid_params)
     # 投入资金：10000，回报总价值：17342.759（其中现金：8740.759，份额价值：8602.000），盈亏比例：73.43%
     # display(shoupan=shoupan, maichu_idx=maichu_idx, mairu_idx=mairu_idx)
 
-    fname_path = os.path.join(_data_root, grid_token)
-    with open(fname_path, 'wt') as f:
-        f.write(params_json)
-
     data = dict(data_token=data_token, grid_token=grid_token, grid_params=grid_params, data=data, names=names)
     result_path = os.path.join(_data_root, f'grid_token={grid_token}.evaluating.json')
-    with open(result_path, 'wt', encoding='utf8') as fout:
-        out = dict(result=result, data=data, data_token=data_token, grid_token=grid_token)
-        json.dump(out, fout, ensure_ascii=False, indent=4)
-
-    return dict(success=1, message='do evaluating success.',
-                data=dict(grid_token=grid_token, data_token=data_token, result=result))
+    out = dict(result=result, data=data, data_token=data_token, grid_token=grid_token)
+    write_json(result_path, out, indent=4)
+    return dict(grid_token=grid_token, data_token=data_token, result=result)
+
+
+@app.get('/do_batch_searching')
+def do_batch_searching(
+        data_tokens: str = Query('*_101_*.csv', description='数据代号列表，英文逗号分隔，可用通配符匹配'
+                                                           f'{_data_root}和{"、".join(_quote_roots)}下的文件名'),
+        data_start_index: str = Query('2022/01/01', description='起始时间。'),
+        data_end_index: str = Query('2023/06/30', description='结束时间。'),
+        touruzijin: float = Query(100000, description='投入总资金，与单品种搜索相同，默认100000'),
+        shouxufeilv: float = Query(0.0001, description='手续费率，默认0.01%，0.1元起'),
+        n_search: int = Query(_batch_n_search, description='搜索密度，数量越大越精细，但耗时越久，'
+                                                           f'默认{_batch_n_search}'),
+        topn: int = Query(10, description='每个品种保留的最佳结果数，默认10'),
+        workers: int = Query(1, description='并行搜索的进程数，各品种分给不同进程，默认1'),
+        strategy: str = Query('grid', description='搜索策略：grid为全网格搜索，zoom为先粗后细的自适应搜索，默认grid'),
+        prune: bool = Query(False, description='是否剪枝，最佳结果不变，默认不剪枝'),
+        max_seconds: float = Query(0, description='每个品种搜索的时间预算（秒），默认0为不限时'),
+        path: str = Query('', description='K线内的价格路径：OHLC为开-高-低-收，OLHC为开-低-高-收，'
+                                          'auto为先到离开盘价近的极值，默认空为数据自己的路径'),
+        background: bool = Query(False, description='是否后台运行：立即返回任务id，'
+                                                    '用/jobs/{job_id}查看进度和结果，默认否')
+):
+    """
+    多品种批量参数搜索：同一套搜索条件搜索多个品种，返回按最佳盈亏比例排名的跨品种表格，
+    结果写为一个文件 batch_token=...batching.json。
+    """
+    if strategy not in _search_strategies:
+        return dict(success=0, message=f'批量搜索失败，原因：不支持的搜索策略{strategy}，'
+                                       f'可选：{"、".join(_search_strategies)}')
+    if path and path not in bar_paths:
+        return dict(success=0, message=f'批量搜索失败，原因：不支持的K线内价格路径{path}，可选：{"、".join(bar_paths)}')
+    patterns = data_tokens.split(',')
+    tokens = expand_tokens(patterns, (_data_root,) + _quote_roots)
+    if not tokens:
+        return dict(success=0, message=f'批量搜索失败，原因：没有匹配{data_tokens}的数据！')
+    search = dict(n_search=int(n_search), topn=int(topn), strategy=strategy, prune=bool(prune),
+                  max_seconds=float(max_seconds), path=path)
+    base = dict(data_start_index=data_start_index, data_end_index=data_end_index,
+                touruzijin=float(touruzijin), shouxufeilv=float(shouxufeilv))
+
+    # 准入控制：各品种预计耗时合计超过上限的，同步请求拒绝，后台任务放到大任务队列
+    cost = estimate_batch_cost(tokens, base, workers=int(workers), **search)
+    if cost['over_budget'] and not background:
+        return dict(success=0, message=f'批量搜索失败，原因：{over_budget_message(cost)}', data=cost)
+
+    run = functools.partial(run_batch_searching, patterns, data_start_index, data_end_index,
+                            touruzijin=float(touruzijin), shouxufeilv=float(shouxufeilv), workers=int(workers),
+                            **search)
+    if background:
+        queue = _large_job_queue if cost['over_budget'] else _job_queue
+        job = queue.submit('batch_searching', lambda job: run(progress=job.progress),
+                           params=dict(data_tokens=data_tokens))
+        return dict(success=1, message='batch searching job submitted.', data=dict(job_id=job.id, cost=cost))
+    return dict(success=1, message='do batch searching success.', data=run())
+
+
+def run_batch_searching(data_tokens, data_start_index, data_end_index, touruzijin=100000, shouxufeilv=0.0001,
+                        n_search=_batch_n_search, workers=1, progress=None, **kwargs):
+    """
+    多品种批量搜索并写结果文件，接口、后台任务和命令行共用。
+    ```
+    :param data_tokens: 数据代号列表，可含通配符
+    :param workers: 进程数，各品种分给不同进程，每个品种内单进程搜索
+    :param kwargs: search_series 的搜索参数
+    :return: dict(batch_token, result_path, table=排名表)
+    ```
+    """
+    tokens = expand_tokens(data_tokens, (_data_root,) + _quote_roots)
+    strategy = kwargs.get('strategy', 'grid')
+    items = []
+    for token in tokens:
+        # 行情在主进程各加载一次，子进程直接拿切好的K线
+        try:
+            series = parse_data(token, data_start_index, data_end_index)
+            if not len(series):
+                raise ValueError(f'no data between {data_start_index} and {data_end_index}')
+            # 投入资金相对股价太少、搜不了n_search档的品种，先数一遍候选，在排名表里给出原因
+            jiage_min, jiage_max = series.price_range()
+            if strategy == 'zoom':
+                count_zoom_candidates(touruzijin, jiage_min, jiage_max, n_search)
+            else:
+                count_candidates(touruzijin, jiage_min, jiage_max, n_search)
+        except Exception as e:
+            series = e
+        items.append((token, series))
+    base = dict(data_start_index=data_start_index, data_end_index=data_end_index,
+                touruzijin=float(touruzijin), shouxufeilv=float(shouxufeilv))
+    search = functools.partial(search_series, n_search=n_search, **kwargs)
+    table = batch_search(items, base, search, workers=workers, progress=progress)
+
+    config = dict(base, data_tokens=tokens, n_search=n_search, **kwargs)
+    # 搜索条件按内容保存为 batch.{md5前8位起}.json，同样的条件得到同一个batch_token
+    config_json = json.dumps(config, ensure_ascii=False, sort_keys=True)
+    batch_token = os.path.splitext(_content_store.put_bytes(config_json.encode('utf8'), 'batch', '.json',
+                                                            min_prefix=8))[0]
+    result_path = os.path.join(_data_root, f'batch_token={batch_token}.batching.json')
+    write_json(result_path, dict(batch_token=batch_token, config=config, table=table), separators=(',', ':'))
+    return dict(batch_token=batch_token, result_path=result_path, table=table)
 
 
 @app.get('/download_trading_detail')
@@ -449,7 +708,8 @@ def get_data(
                                                '如果是data则返回json的response')
 ):
     """获取股票数据。"""
-    names, data = parse_data(data_token, data_start_index=data_start_index, data_end_index=data_end_index)
+    names, data = parse_data(data_token, data_start_index=data_start_index,
+                             data_end_index=data_end_index).to_lists()
     s = data_start_index.replace('/', '-')
     e = data_end_index.replace('/', '-')
     out = list(zip(names, data))
@@ -467,6 +727,137 @@ def get_data(
         return dict(success=1, message='success', data=out)
 
 
+@app.get('/estimate_search')
+def estimate_search(
+        data_token: str = Query('data_token.csv', description='数据代号，数据文件名。'),
+        data_start_index: str = Query('2022/01/01', description='起始时间。'),
+        data_end_index: str = Query('2023/06/30', description='结束时间。'),
+        touruzijin: float = Query(100000, description='投入总资金，与单品种搜索相同，默认100000'),
+        shouxufeilv: float = Query(0.0001, description='手续费率，默认0.01%，0.1元起'),
+        n_search: int = Query(4, description='搜索密度，数量越大越精细，但耗时越久，默认4'),
+        topn: int = Query(10, description='返回最佳收益的结果数，默认10'),
+        workers: int = Query(1, description='并行搜索的进程数，默认1'),
+        strategy: str = Query('grid', description='搜索策略：grid或zoom，默认grid'),
+        prune: bool = Query(False, description='是否剪枝，默认不剪枝'),
+        max_seconds: float = Query(0, description='搜索的时间预算（秒），默认0为不限时'),
+        path: str = Query('', description='K线内的价格路径：OHLC为开-高-低-收，OLHC为开-低-高-收，'
+                                          'auto为先到离开盘价近的极值，默认空为数据自己的路径')
+):
+    """
+    预估参数搜索的开销：不生成候选参数，直接数出候选数，按实测的回测速度预计耗时，
+    并给出是否超过耗时上限（超过的搜索只能后台排队运行）。
+    """
+    if strategy not in _search_strategies:
+        return dict(success=0, message=f'预估搜索失败，原因：不支持的搜索策略{strategy}，'
+                                       f'可选：{"、".join(_search_strategies)}')
+    if path and path not in bar_paths:
+        return dict(success=0, message=f'预估搜索失败，原因：不支持的K线内价格路径{path}，可选：{"、".join(bar_paths)}')
+    base = dict(data_token=data_token, data_start_index=data_start_index, data_end_index=data_end_index,
+                touruzijin=float(touruzijin), shouxufeilv=float(shouxufeilv))
+    try:
+        cost = estimate_search_cost(base, n_search=int(n_search), topn=int(topn), workers=int(workers),
+                                    strategy=strategy, prune=bool(prune), max_seconds=float(max_seconds), path=path)
+    except ValueError as e:
+        return dict(success=0, message=f'预估搜索失败，原因：{e}')
+    return dict(success=1, message='estimate search success.', data=cost)
+
+
+@app.get('/jobs')
+def list_jobs():
+    """
+    查看后台任务列表（不含结果）。
+    """
+    jobs = sorted(_job_queue.jobs() + _large_job_queue.jobs(), key=lambda job: job.created)
+    return dict(success=1, message='success', data=[job.to_dict(with_result=False) for job in jobs])
+
+
+@app.get('/jobs/{job_id}')
+def get_job(job_id: str):
+    """
+    查看后台任务的状态、进度（已回测/总候选数）、目前最好的结果，完成后返回结果。
+    """
+    job = find_job(job_id)
+    if job is None:
+        return dict(success=0, message=f'获取任务失败，原因：任务{job_id}不存在！')
+    return dict(success=1, message='success', data=job.to_dict())
+
+
+@app.post('/jobs/{job_id}/cancel')
+def cancel_job(job_id: str):
+    """
+    取消后台任务：排队中的直接取消，运行中的在回测完当前一块候选后停止。
+    """
+    queue = _job_queue if _job_queue.get(job_id) is not None else _large_job_queue
+    job = queue.cancel(job_id)
+    if job is None:
+        return dict(success=0, message=f'取消任务失败，原因：任务{job_id}不存在！')
+    return dict(success=1, message='cancel requested.', data=job.to_dict(with_result=False))
+
+
+@app.get('/jobs/{job_id}/events')
+def stream_job(
+        job_id: str,
+        interval: float = Query(1.0, description='推送进度的间隔秒数，默认1秒'),
+        after: int = Query(0, description='从哪个事件序号之后开始推送，断线重连时续传，默认0从头推送'),
+        last_event_id: str = Header(None)
+):
+    """
+    以SSE（text/event-stream）推送后台任务的实时进度：
+    progress事件每隔interval秒推送一次，含已回测数、总数、回测速度（个/秒）；
+    top事件为新进入前topn的结果（名次、参数、回测结果）；任务结束时推送end事件并断开。
+    看到足够好的结果时可以调用 /jobs/{job_id}/cancel 提前停止。
+    """
+    job = find_job(job_id)
+    if job is None:
+        return dict(success=0, message=f'获取任务失败，原因：任务{job_id}不存在！')
+    if last_event_id and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+    interval = max(float(interval), 0.1)
+    return StreamingResponse(iter_job_events(job, interval, after), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def find_job(job_id):
+    """在各任务队列里找任务，没有则返回None。"""
+    return _job_queue.get(job_id) or _large_job_queue.get(job_id)
+
+
+def iter_job_events(job, interval=1.0, after=0):
+    """
+    后台任务的SSE消息流，直到任务结束。
+    :param job: Job
+    :param interval: 推送进度的间隔秒数
+    :param after: 从哪个事件序号之后开始推送
+    :return: SSE文本的生成器
+    """
+    last_done, last_time = job.done, time.time()
+    next_tick = last_time
+    while True:
+        for seq, name, data in job.wait_events(after, timeout=max(0.0, next_tick - time.time())):
+            yield sse_message(name, data, seq)
+            after = seq
+        now = time.time()
+        if now >= next_tick or job.ended:
+            elapsed = now - job.started if job.started else 0.0
+            progress = job.to_dict(with_result=False)['progress']
+            progress.update(status=job.status, elapsed=round(elapsed, 2),
+                            speed=round((job.done - last_done) / (now - last_time), 1) if now > last_time else 0.0,
+                            avg_speed=round(job.done / elapsed, 1) if elapsed > 0 else 0.0)
+            yield sse_message('progress', progress)
+            last_done, last_time = job.done, now
+            next_tick = now + interval
+        if job.ended:
+            yield sse_message('end', job.to_dict(with_result=False))
+            return
+
+
+def sse_message(event, data, event_id=None):
+    """按SSE格式编码一条消息。"""
+    text = json.dumps(data, ensure_ascii=False, default=str)
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}event: {event}\ndata: {text}\n\n'
+
+
 @app.get('/get_history')
 def get_history(
         pattern: str = Query('*', description='查看逻辑。'),
@@ -482,228 +873,292 @@ def get_history(
         return dict(success=0, message='获取历史数据失败，原因：token有误，请核对！')
 
 
-# @functools.lru_cache(maxsize=128)
-def grid_func(shuju, touruzijin, jizhunjia, dancifene, jiancangfene,
-              wanggeshangjie, wanggexiajie, wanggeleixing, mairuyuzhi, maichuyuzhi,
-              shouxufeilv=0.0001, **kwargs):
+def search_params(param, n_search=5, topn=10, workers=1, strategy='grid', prune=False, progress=None, max_seconds=0,
+                  path=''):
     """
-    网格交易回测
-    ```
-    :param shuju: 股票所有数据
-    :param touruzijin: 投入资金
-    :param jizhunjia: 基准价格，设置为0则为回测的第一个数据
-    :param dancifene: 买入卖出单次交易股数，等股交易
-    :param jiancangfene: 起始建仓股数
-    :param wanggeshangjie: 网格上界
-    :param wanggexiajie: 网格下界
-    :param wanggeleixing: 网格类型，1为差价，2为百分比
-    :param mairuyuzhi: 买入阈值，差价或百分比
-    :param maichuyuzhi: 卖出阈值，差价或百分比
-    :param shouxufeilv: 手续费率，默认0.01%，0.1元起
-    :return:
-    ```
+    搜索参数，结果按数据内容和搜索条件缓存在磁盘上。
+    同一段行情（无论起止时间怎么写）用同样的条件搜索时直接返回缓存的结果；workers不影响结果，不参与缓存的键。
+    progress为进度回调，每回测完一块候选（全网格搜索为1024个）调用 progress(已回测数, 总候选数, 目前最好的结果)。
+    max_seconds大于0时限时搜索，结果与回测速度有关，不写入缓存（已有完整搜索的缓存时仍直接返回）。
+    path为K线内的价格路径（见 bar_paths），默认空为数据自己的路径。
     """
-    # param = json.loads(param)
-    # names, values = parse_data(param["data_token"], param["data_start_index"], param["data_end_index"])
-    values = shuju
-    # 暂用起始价来做基准价
-    if not jizhunjia:
-        jizhunjia = values[0]
-
-    # 基准价是否限制在网格上下界
-    # if wanggexiajie <= values[0] <= wanggeshangjie:
-    #     jizhunjia = values[0]
-    # elif values[0] < wanggexiajie:
-    #     jizhunjia = wanggexiajie
-    # else:
-    #     jizhunjia = wanggeshangjie
-
-    # 是否建立起始仓位
-    xianjin = touruzijin - jiancangfene * jizhunjia
-    # 总共份额数
-    totalfene = jiancangfene
-    jizhunjingzhi = jizhunjia
-
-    maichu_jiazhi, mairu_jiazhi = [], []
-    maichu_idx, mairu_idx = [], []
-
-    # 找股价达到基准价的时刻
-    kaishi_idx = 0
-    for i, (v1, v2) in enumerate(zip(values, values[1:])):
-        if (jizhunjia - v1) * (jizhunjia - v2) <= 0:
-            # 基准价在前后两个股价之间，则开始交易
-            kaishi_idx = i
-            jizhunjingzhi = v1
-            break
-
-    jiazhi_lst = []
-    for i in range(0, len(values), 1):
-        # 记录每一天的总价值
-        if i < kaishi_idx:
-            jiazhi_lst.append(touruzijin)
-            # 股价达到基准价时候开始交易
-            continue
+    base = json.loads(param)
+    series = parse_data(base["data_token"], base["data_start_index"], base["data_end_index"])
+    return search_series(series, base, n_search=n_search, topn=topn, workers=workers, strategy=strategy, prune=prune,
+                         progress=progress, max_seconds=max_seconds, path=path)
 
-        # 获取当时股价净值
-        dangshijingzhi = values[i]
-        jiazhi_lst.append(xianjin + totalfene * dangshijingzhi)
 
-        # 涨破上界
-        if dangshijingzhi > wanggeshangjie:
-            continue
+def search_series(series, base, n_search=5, topn=10, workers=1, strategy='grid', prune=False, progress=None,
+                  max_seconds=0, path=''):
+    """
+    在已加载的行情上搜索参数，参数含义同 search_params，base为基础参数字典。
+    """
+    if strategy not in _search_strategies:
+        raise ValueError(f'unknown search strategy: {strategy}')
+    if path:
+        series = series.with_path(path)
+    key = search_cache_key(series, base, n_search, topn, strategy, prune)
+    packed = _result_cache.get(key)
+    if packed is None:
+        result = _search_params(series, base, n_search=n_search, topn=topn, workers=workers, strategy=strategy,
+                                prune=prune, progress=progress, max_seconds=max_seconds)
+        if max_seconds and max_seconds > 0:
+            return result
+        packed = pack_search_result(result, base_keys=set(base))
+        _result_cache.put(key, packed)
+        return unpack_search_result(packed, base)
+    result = unpack_search_result(packed, base)
+    if progress is not None:
+        # 命中缓存，直接报告完成
+        n = result['search_stats']['n_candidates']
+        progress(n, n, result['result_best'][0] if result['result_best'] else None)
+    return result
 
-        # 跌破下界
-        if dangshijingzhi < wanggexiajie:
-            continue
 
-        if wanggeleixing == 1:
-            # 差价网格
-            maichujia = jizhunjingzhi + maichuyuzhi
-        else:
-            # 比例网格
-            maichujia = jizhunjingzhi * (1 + maichuyuzhi / 100)
-        # 卖出基金
-        if dangshijingzhi >= maichujia and totalfene >= dancifene:
-            totalfene -= dancifene
-            shouxufei = max(0.1, shouxufeilv * dangshijingzhi * dancifene)
-            xianjin += (dangshijingzhi * dancifene - shouxufei)
-            maichu_idx.append(i)
-            maichu_jiazhi.append(xianjin + totalfene * dangshijingzhi)
-
-            # 用成交价更新基准价
-            jizhunjingzhi = dangshijingzhi
-
-            # 可能出现当时净值高于多个网格的情况
-            gengxin_idx = 0
-            continue
+def search_cache_key(series, base, n_search, topn, strategy, prune):
+    """搜索结果的缓存键：行情内容和影响结果的搜索条件，K线内的价格路径也算在内。"""
+    return _result_cache.key('searching', _cache_version, series.digest(), dict(
+        touruzijin=float(base['touruzijin']), shouxufeilv=float(base.get('shouxufeilv', 0.0001)),
+        n_search=int(n_search), topn=int(topn), strategy=strategy, prune=bool(prune), sketch_size=_sketch_size,
+        path=series.path))
+
 
-        if wanggeleixing == 1:
-            # 差价网格
-            mairujia = jizhunjingzhi - mairuyuzhi
+def estimate_search_cost(base, n_search=5, topn=10, workers=1, strategy='grid', prune=False, max_seconds=0,
+                         n_folds=0, fold_mode='rolling', data_end_index=None, path=''):
+    """
+    估计一次搜索的开销：不生成候选，直接数出候选数，再按最近实测的回测速度预计耗时。
+    ```
+    :param base: 基础参数，含数据和投入资金
+    :param data_end_index: 滚动验证时整段行情的结束时间（验证结束时间），默认用base里的
+    :return: dict(n_candidates=候选数（各折合计，zoom为上界）, bars=K线数, seconds=预计秒数,
+                  cached=是否已有缓存, budget=耗时上限, over_budget=是否超过上限, ...)
+    其余参数同 search_params 和 walk_forward
+    ```
+    """
+    series = parse_data(base['data_token'], base['data_start_index'], data_end_index or base['data_end_index'])
+    if path:
+        series = series.with_path(path)
+    if n_folds > 0:
+        windows = [series.slice(*train) for train, _ in split_folds(series, n_folds, fold_mode)]
+    else:
+        windows = [series]
+    batch_size = _budget_batch_size if max_seconds and max_seconds > 0 else _batch_size
+    if _cost_meter.rate is None:
+        _cost_meter.calibrate(series, base, batch_size=_batch_size)
+    counts, seconds = [], 0.0
+    for window in windows:
+        jiage_min, jiage_max = window.price_range()
+        if strategy == 'zoom':
+            n = count_zoom_candidates(base['touruzijin'], jiage_min, jiage_max, n_search, beam=topn)
+            n_grid = count_candidates(base['touruzijin'], jiage_min, jiage_max, coarse_density(n_search))
+            levels = zoom_levels(n_search)
         else:
-            # 比例网格
-            mairujia = jizhunjingzhi * (1 - mairuyuzhi / 100)
-        # 买入基金
-        if dangshijingzhi <= mairujia and xianjin >= (1 + shouxufeilv) * dancifene * dangshijingzhi:
-            totalfene += dancifene
-            shouxufei = max(0.1, shouxufeilv * dangshijingzhi * dancifene)
-            xianjin -= (dangshijingzhi * dancifene + shouxufei)
-            mairu_idx.append(i)
-            mairu_jiazhi.append(xianjin + totalfene * dangshijingzhi)
-
-            # 用成交价更新基准价
-            jizhunjingzhi = dangshijingzhi
-
-            # 可能出现当时净值低于多个网格的情况
-            gengxin_idx = 0
+            n = n_grid = count_candidates(base['touruzijin'], jiage_min, jiage_max, n_search)
+            levels = 0
+        # 最后补测示例还有一轮
+        rounds = count_rounds(n_grid, batch_size, workers, levels) + 1
+        counts.append(n)
+        seconds += _cost_meter.predict(n, len(window), workers, rounds=rounds)
+    cached = n_folds <= 0 and os.path.exists(
+        _result_cache.path(search_cache_key(series, base, n_search, topn, strategy, prune)))
+    if cached:
+        seconds = 0.0
+    elif max_seconds and max_seconds > 0:
+        seconds = min(seconds, max_seconds * len(windows))
+    return dict(n_candidates=sum(counts), bars=len(series), n_windows=len(windows), strategy=strategy,
+                seconds=round(seconds, 1), rate=round(_cost_meter.rate), cached=cached,
+                budget=_search_budget_seconds, over_budget=seconds > _search_budget_seconds)
+
+
+def estimate_batch_cost(tokens, base, workers=1, **kwargs):
+    """
+    估计一次批量搜索的开销：逐个品种 estimate_search_cost 后合计。
+    各品种分给不同进程、每个品种内单进程搜索，合计耗时按进程数折算。
+    加载失败或搜不了的品种不计，运行时在排名表里给出原因。
+    ```
+    :param tokens: 数据代号列表（已展开通配符）
+    :param base: 基础参数，不含数据代号
+    :param kwargs: estimate_search_cost 的搜索参数
+    :return: dict(n_candidates=候选数合计, n_symbols=计入的品种数, seconds=预计秒数, budget=耗时上限,
+                  over_budget=是否超过上限)
+    ```
+    """
+    n_candidates, seconds, n_symbols = 0, 0.0, 0
+    for token in tokens:
+        try:
+            cost = estimate_search_cost(dict(base, data_token=token), workers=1, **kwargs)
+        except Exception:
             continue
-    zongjiazhi = (xianjin + totalfene * values[-1])
-    report_content = ("投入资金：{}，回报总价值：{:.3f}（其中现金：{:.3f}，份额价值：{:.3f}），盈亏比例：{:.2f}%".format(
-        touruzijin, zongjiazhi, xianjin, totalfene * values[-1], (zongjiazhi / touruzijin) * 100))
-
-    xianjin = round(xianjin, 4)
-    report_data = dict(
-        touruzijin=touruzijin,
-        zongjiaoyicishu=len(mairu_idx) + len(maichu_idx),
-        zongjiageshu=len(values) - kaishi_idx,
-        kaishijiaoyidian=kaishi_idx,
-        kanpanjia=jizhunjia,
-        xianjin=xianjin,
-        totalfene=totalfene,
-        shoupanjia=values[-1],
-        fenejiazhi=totalfene * values[-1],
-        zongjiazhi=round(xianjin + totalfene * values[-1], 4),
-        yinkuibili=round(zongjiazhi / touruzijin, 4)
-    )
-    # from pprint import pprint
+        n_candidates += cost['n_candidates']
+        seconds += cost['seconds']
+        n_symbols += 1
+    seconds /= max(1, min(effective_workers(workers), n_symbols))
+    return dict(n_candidates=n_candidates, n_symbols=n_symbols, seconds=round(seconds, 1),
+                budget=_search_budget_seconds, over_budget=seconds > _search_budget_seconds)
 
-    # pprint(report_content)
-    result = dict(report_conclusion=dict(report_content=report_content, report_data=report_data),
-                  trading_detail=dict(maichu_jiazhi=maichu_jiazhi, maichu_idx=maichu_idx,
-                                      mairu_jiazhi=mairu_jiazhi, mairu_idx=mairu_idx,
-                                      jiazhi_lst=jiazhi_lst))
-    return result
 
+def over_budget_message(cost):
+    return (f'预计回测{cost["n_candidates"]}组参数、耗时{cost["seconds"]}秒，超过上限{cost["budget"]}秒，'
+            f'请减小n_search、设置max_seconds，或用background=true后台排队运行！')
 
-@functools.lru_cache(maxsize=128)
-def search_params(param, n_search=5, topn=10):
-    """搜索参数"""
-    param = json.loads(param)
-    names, shuju = parse_data(param["data_token"], param["data_start_index"], param["data_end_index"])
-
-    _shangjie_p = np.linspace(np.min(shuju), np.max(shuju), n_search)
-    _xiajie_p = np.linspace(np.min(shuju), np.max(shuju), n_search)
-    touruzijin = param['touruzijin']
-    # pprint.pprint(dict(_shangjie_p=_shangjie_p, _xiajie_p=_xiajie_p, touruzijin=touruzijin))
-    params = []
-    for _xiajie in _xiajie_p:
-        for _shangjie in _shangjie_p:
-            if _shangjie - _xiajie <= 0.001:
-                continue
-            _wangge_p = (np.linspace(0, _shangjie - _xiajie, n_search) ** 2) / (_shangjie - _xiajie)
-            _jizhunjia_p = np.linspace(_xiajie, _shangjie, n_search)
-            for _wangge in _wangge_p:
-                if _shangjie - _xiajie < _wangge:
-                    continue
-                if _wangge < 0.001:
-                    continue
-                for _jizhunjia in _jizhunjia_p:
-                    _jc_max = int(touruzijin // _jizhunjia // 100 * 100)
-                    _jc_min = 100
-                    _jiancangfene_p = np.arange(_jc_min, _jc_max + 1, 100)
-                    _jiancangfene_p = _jiancangfene_p[::len(_jiancangfene_p) // n_search]
-                    for _jiancangfene in _jiancangfene_p:
-                        _dancifene_p = np.arange(100, _jiancangfene + 1, 100)
-                        for _dancifene in _dancifene_p:
-                            if _jiancangfene % _dancifene != 0:
-                                continue
-                            p = dict(wanggeshangjie=round(_shangjie, 4), wanggexiajie=round(_xiajie, 4),
-                                     wanggeleixing=1,
-                                     mairuyuzhi=round(_wangge, 4), maichuyuzhi=round(_wangge, 4),
-                                     jizhunjia=round(_jizhunjia, 4), jiancangfene=int(_jiancangfene),
-                                     dancifene=int(_dancifene))
-                            pa = {**param, **p}
-                            params.append(pa)
-
-    res_lst = []
-    for param in tqdm.tqdm(params):
-        res = grid_func(shuju=shuju, **param)
-        result = res['report_conclusion']['report_data']
-        res_lst.append(dict(param=param, result=result))
-    outs = list(sorted(res_lst, key=lambda x: x['result']['yinkuibili'], reverse=True))
-    yinkuibili_lst = [x['result']['yinkuibili'] for x in outs]
-
-    # pprint.pprint(outs[:3])
-    return dict(result_best=outs[:1], result_topn=outs[:topn], result_examples=outs[::len(outs) // topn],
-                yinkuibili_examples=yinkuibili_lst[::len(yinkuibili_lst) // topn])
-
-
-def parse_data_index(names, data_start_index, data_end_index):
-    """
-    解析起止位置。
-    :param names:
+
+def evaluate_params(series, params):
+    """用 run_summary 批量回测多组参数，结果按数据内容和参数缓存在磁盘上。"""
+    key = _result_cache.key('evaluating', _cache_version, series.digest(),
+                            [{k: v for k, v in p.items() if k not in _data_keys} for p in params])
+    reports = _result_cache.get(key)
+    if reports is None:
+        reports = run_summary(series, params)
+        _result_cache.put(key, reports)
+    return reports
+
+
+def _search_params(series, param, n_search=5, topn=10, workers=1, strategy='grid', prune=False, progress=None,
+                   max_seconds=0):
+    """
+    搜索参数：候选参数流式生成、逐块回测，只保留topn个最佳结果和盈亏比例的分位数草图。
+    strategy为grid时搜索全网格，为zoom时先粗后细只在较好的区域细化。
+    workers大于1时用多进程搜索，结果与单进程一致；整个搜索共用一个进程池，自适应搜索每级细化不重新启动进程。
+    prune为True时，以已回测候选里第topn好的盈亏比例为阈值（按候选序号分段更新，与进程数无关），
+    上界达不到的参数组提前放弃，最佳结果不变；
+    被放弃的参数组没有回测完，不计入盈亏比例的分布和示例。search_stats给出候选数和剪枝数。
+    max_seconds大于0时限时搜索：全网格搜索改按均匀覆盖参数空间的顺序回测，到时停止，
+    search_stats另给出是否超时（timed_out）和已回测候选占全部候选的比例（coverage）；
+    自适应搜索的稀疏网格也按这个顺序分批回测，到时停止、不再细化，coverage为稀疏网格已回测的比例。
+    """
+    jiage_min, jiage_max = series.price_range()
+
+    top = TopK(topn)
+    sketch = QuantileSketch(_sketch_size)
+    stats = dict(n_candidates=0, n_pruned=0)
+    deadline = time.time() + max_seconds if max_seconds and max_seconds > 0 else None
+    spread = SpreadCandidates(param, jiage_min, jiage_max, n_search) \
+        if deadline is not None and strategy == 'grid' else None
+
+    def candidates():
+        if spread is not None:
+            return iter(spread)
+        return iter_candidates(param, jiage_min, jiage_max, n_search)
+
+    def timed_out():
+        if deadline is not None and time.time() >= deadline:
+            stats['timed_out'] = True
+        return stats.get('timed_out', False)
+
+    # 进度的总数：全网格搜索不生成候选直接数出来，自适应搜索事先不知道
+    if spread is not None:
+        total = len(spread)
+    elif progress is not None and strategy == 'grid':
+        total = count_candidates(param['touruzijin'], jiage_min, jiage_max, n_search)
+    else:
+        total = None
+    if progress is not None:
+        progress(0, total)
+
+    # 上一次报告进度时前topn里的候选序号，用来找出新进入前topn的结果
+    reported = set()
+
+    def report():
+        items = top.items()
+        new_top = [dict(rank=rank + 1, **item) for rank, (k, item) in enumerate(items) if k not in reported]
+        reported.clear()
+        reported.update(k for k, _ in items)
+        progress(stats['n_candidates'], total, items[0][1] if items else None, new_top=new_top)
+
+    def score(chunks, stride=None):
+        """回测候选块，结果并入top和草图，逐块产生盈亏比例（剪枝的为nan）。"""
+        scored = iter_scored_chunks(series, chunks, topn, threshold=top.kth if prune else None, stride=stride,
+                                    pool=pool)
+        for start, chunk, yinkuibili, chunk_top, n_pruned in scored:
+            stats['n_candidates'] += len(chunk)
+            stats['n_pruned'] += n_pruned
+            for k, result in chunk_top:
+                top.push(start + k, result['yinkuibili'], dict(param=chunk[k], result=result))
+            wancheng = ~np.isnan(yinkuibili)
+            sketch.add(yinkuibili[wancheng], np.arange(start, start + len(chunk))[wancheng])
+            if progress is not None:
+                report()
+            yield yinkuibili
+
+    pool = ScoringPool(series, workers) if workers > 1 else None
+    try:
+        if strategy == 'zoom':
+            evaluated = []
+
+            def evaluate(batch):
+                start = len(evaluated)
+                evaluated.extend(batch)
+                # 一批候选按能并行的进程数分块（每块回测有固定开销，块不宜多）；
+                # 一批里都用这批开始时的剪枝阈值，结果与分块无关
+                size = min(_batch_size, -(-len(batch) // effective_workers(workers)))
+                yinkuibili = np.concatenate(list(score(iter_chunks(batch, size, start=start), stride=_zoom_stride)))
+                # 剪枝的参数组不如前topn，不作为细化的中心
+                return np.where(np.isnan(yinkuibili), -np.inf, yinkuibili).tolist()
+
+            zoomed = zoom_search(param, jiage_min, jiage_max, n_search, evaluate, beam=topn,
+                                 stop=timed_out if deadline is not None else None, batch_size=_budget_batch_size)
+            # 自适应搜索的覆盖率按稀疏网格计
+            covered, quanbu = zoomed['coarse_done'], zoomed['n_coarse']
+            lookup = lambda ids: {k: evaluated[k] for k in ids}
+        else:
+            # 限时搜索用小块，超时后最多多回测一块；有进度回调时也用小块，每1024个候选报告一次进度。
+            # 块大小整除剪枝阈值的分段长度，剪枝结果与块大小无关
+            batch_size = _budget_batch_size if deadline is not None or progress is not None else _batch_size
+            t = time.time()
+            for _ in tqdm.tqdm(score(iter_chunks(candidates(), batch_size))):
+                if timed_out():
+                    break
+            if deadline is None and not prune:
+                # 完整块、不剪枝的搜索，记下回测速度供预计耗时
+                _cost_meter.record(stats['n_candidates'], len(series), time.time() - t, workers=workers,
+                                   rounds=count_rounds(stats['n_candidates'], batch_size, workers))
+            covered, quanbu = stats['n_candidates'], total
+            if spread is not None:
+                lookup = lambda ids: {k: spread[k] for k in ids}
+            else:
+                lookup = lambda ids: pick_candidates(candidates(), ids)
+    finally:
+        if pool is not None:
+            pool.close()
+    if deadline is not None:
+        stats.update(max_seconds=max_seconds, timed_out=stats.get('timed_out', False),
+                     coverage=round(covered / quanbu, 4) if quanbu else None)
+
+    # 按排名等距抽样，抽到的候选不在top里的，重新取出参数单独回测
+    examples = sketch.rank_items(range(0, sketch.count, max(1, sketch.count // topn)))
+    outs = dict(top.items())
+    missing = lookup([k for k, _ in examples if k not in outs])
+    params = list(missing.values())
+    for k, param, result in zip(missing, params, run_summary(series, params)):
+        outs[k] = dict(param=param, result=result)
+    result_topn = [item for _, item in top.items()]
+    return dict(result_best=result_topn[:1], result_topn=result_topn,
+                result_examples=[outs[k] for k, _ in examples],
+                yinkuibili_examples=[y for _, y in examples],
+                search_stats=stats)
+
+
+def parse_data_index(series, data_start_index, data_end_index):
+    """
+    解析起止位置，返回数据点位置。
+    :param series: BarSeries
     :param data_start_index:
     :param data_end_index:
     :return:
     """
-    # 用时间选择区域
-    times = [datetime.datetime.strptime(w, '%Y/%m/%d-%H:%M:%S') for w in names]
-
     if re.search(r'\d+/\d+/\d+', data_start_index):
         if not re.search(r'\d+:\d+:\d+', data_start_index):
             data_start_index = f'{data_start_index}-00:00:00'
             data_end_index = f'{data_end_index}-23:59:59'
 
-        time_start = datetime.datetime.strptime(data_start_index, '%Y/%m/%d-%H:%M:%S')
-        time_end = datetime.datetime.strptime(data_end_index, '%Y/%m/%d-%H:%M:%S')
-        data_start_index = None
-        data_end_index = None
-        for num, time_now in enumerate(times):
-            if data_start_index is None and time_now >= time_start:
-                data_start_index = str(num)
-
-            if data_end_index is None and time_now >= time_end:
-                data_end_index = str(num)
+        # 用时间选择区域：在数据点时间上二分查找
+        epoch = datetime.datetime(1970, 1, 1)
+        time_start, time_end = (
+            int((datetime.datetime.strptime(t, '%Y/%m/%d-%H:%M:%S') - epoch).total_seconds())
+            for t in (data_start_index, data_end_index))
+        start, end = series.tick_position([time_start, time_end])
+        data_start_index = str(int(start))
+        data_end_index = str(int(end)) if end < len(series) * 4 else '_'
 
     if data_start_index.lstrip('-').isdigit():
         data_start_index = int(data_start_index)
@@ -714,7 +1169,7 @@ def parse_data_index(names, data_start_index, data_end_index):
         data_end_index = int(data_end_index)
     else:
         data_end_index = None
-    return times, data_start_index, data_end_index
+    return data_start_index, data_end_index
 
 
 def display(shoupan, maichu_idx, mairu_idx):
@@ -737,114 +1192,170 @@ def display(shoupan, maichu_idx, mairu_idx):
     plt.show()
 
 
-@functools.lru_cache(maxsize=128)
 def parse_excel(data_path):
     """
     解析导出的Excel股票数据。
     :param data_path:
-    :return:
+    :return: BarSeries
     """
-    flag = 0
-    t_min, v_shift = '', 0
-    shijian, values = [], []
-    with open(data_path, encoding='gbk') as fin:
-        for line in fin:
-            parts = re.split(r'[,\s]+', line.strip())
-            if len(parts) >= 5:
-                if flag == 0:
-                    if parts[0] == '时间':
-                        if len(parts[0].split('-')) == 2:
-                            flag = 1
-                        else:
-                            flag = 2
-                    elif parts[0] == '日期':
-                        if parts[1] == '时间':
-                            flag = 3
-                        else:
-                            flag = 4
-                    else:
-                        flag = -1
-                    continue
-
-                if flag == 1:
-                    # 2023/02/28-10:31
-                    t_min = parts[0]
-                    v_shift = 1
-                elif flag == 2:
-                    # 2023/02/28
-                    t_min = f'{parts[0]}-10:00'
-                    v_shift = 1
-                elif flag == 3:
-                    # 2023-02-28 1031
-                    t_min = f'{parts[0].replace("-", "/")}-{parts[1][:-2]}:{parts[1][-2:]}'
-                    v_shift = 2
-                elif flag == 4:
-                    # 2023-02-28
-                    t_min = f'{parts[0].replace("-", "/")}-10:00'
-                    v_shift = 1
-                else:
-                    assert 1 <= flag <= 4
-
-                if 1 <= flag <= 4:
-                    print(parts, t_min)
-                    t = t_min
-                    shijian.append(f'{t}:10')
-                    values.append(float(parts[0 + v_shift]))
+    parser = ExcelStreamParser()
+    with open(data_path, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(_upload_chunk_size), b''):
+            parser.feed(chunk)
+    return parser.close()
 
-                    shijian.append(f'{t}:20')
-                    values.append(float(parts[1 + v_shift]))
 
-                    shijian.append(f'{t}:30')
-                    values.append(float(parts[2 + v_shift]))
+class ExcelStreamParser(object):
+    """
+    分块解析导出的Excel股票数据，上传时边接收边解析，内存只保存解析出的列。
+    表头（第一个至少5列的行）只识别一次，之后每块的完整数据行把逗号、空白分隔统一成逗号，整体交给pandas解析。
+    ```
+    parser = ExcelStreamParser()
+    parser.feed(chunk)  # 任意大小的字节块，按gbk解码
+    series = parser.close()
+    ```
+    """
 
-                    shijian.append(f'{t}:40')
-                    values.append(float(parts[3 + v_shift]))
-    return shijian, values
+    def __init__(self, encoding='gbk'):
+        # 与文本方式打开文件相同：增量解码，\r\n、\r 统一成 \n
+        self._decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+        self._pending = ''
+        self.flag = None
+        self._cols = []
+
+    def feed(self, chunk, final=False):
+        text = self._pending + self._decoder.decode(chunk, final=final)
+        lines = text.split('\n')
+        self._pending = '' if final else lines.pop()
+        if self.flag is None:
+            lines = self._find_header(lines)
+        if lines:
+            self._parse_lines(lines)
+
+    def _find_header(self, lines):
+        """找表头，返回表头之后的行。"""
+        for k, line in enumerate(lines):
+            parts = re.split(r'[,\s]+', line.strip())
+            if len(parts) >= 5:
+                if parts[0] == '时间':
+                    # 2023/02/28-10:31 或 2023/02/28
+                    self.flag = 2
+                elif parts[0] == '日期':
+                    # 2023-02-28,1031 或 2023-02-28
+                    self.flag = 3 if parts[1] == '时间' else 4
+                else:
+                    self.flag = -1
+                return lines[k + 1:]
+        return []
+
+    def _parse_lines(self, lines):
+        flag = self.flag
+        v_shift = 2 if flag == 3 else 1
+        ncols = 5 + v_shift
+
+        # 与逐行 re.split(r'[,\s]+', line.strip()) 相同的切分：
+        # 只用空白分隔或只用逗号分隔（没有空列）的数据直接解析，混用的先把分隔符统一成逗号
+        text = '\n'.join(lines)
+        if not text.strip():
+            return
+        sep = ','
+        if ',' not in text:
+            sep = r'\s+'
+        elif re.search(r'[^\S\n]|,,', text):
+            text = re.sub(r'^[^\S\n]+|[^\S\n]+$', '', text, flags=re.M)
+            text = re.sub(r'(?:,|[^\S\n])+', ',', text)
+        try:
+            df = pd.read_csv(io.StringIO(text), sep=sep, header=None, names=range(ncols), usecols=range(ncols),
+                             dtype=str, skip_blank_lines=True)
+        except pd.errors.ParserError:
+            # 这一块每行都不到ncols列（例如只有末尾的“数据来源:通达信”），不指定usecols时缺的列补空
+            df = pd.read_csv(io.StringIO(text), sep=sep, header=None, names=range(ncols), dtype=str,
+                             skip_blank_lines=True)
+        # 至少5列的才是数据行，例如末尾的“数据来源:通达信”不是
+        df = df[df[4].notna()]
+        if not len(df):
+            return
+        if flag == -1:
+            raise ValueError('unknown data header')
+
+        riqi = df[0]
+        if flag == 2:
+            shijian = riqi.where(riqi.str.contains('-', regex=False), riqi + '-10:00')
+        elif flag == 3:
+            t = df[1]
+            shijian = riqi.str.replace('-', '/', regex=False) + '-' + t.str[:-2] + ':' + t.str[-2:]
+        else:
+            shijian = riqi.str.replace('-', '/', regex=False) + '-10:00'
+        kaipan, zuigao, zuidi, shoupan = (df[k + v_shift].values.astype(float) for k in range(4))
+        chengjiaoliang = df[4 + v_shift].fillna('0').values.astype(float)
+        self._cols.append((to_epoch(shijian.tolist(), fmt='%Y/%m/%d-%H:%M'), kaipan, zuigao, zuidi, shoupan,
+                           chengjiaoliang))
+
+    def close(self):
+        """解析剩下的最后一行，返回BarSeries。"""
+        self.feed(b'', final=True)
+        cols = [np.concatenate(c) for c in zip(*self._cols)] if self._cols else [np.zeros(0)] * 6
+        shijian, kaipan, zuigao, zuidi, shoupan, chengjiaoliang = cols
+        return BarSeries(time=shijian, open=kaipan, high=zuigao, low=zuidi, close=shoupan, volume=chengjiaoliang,
+                         path='OHLC')
+
+
+def parse_quote_csv(data_path):
+    """
+    解析下载脚本保存的行情csv：efinance格式（股票名称,股票代码,日期,开盘,收盘,最高,最低,成交量,...）
+    或baostock格式（date,[time,]code,open,high,low,close,volume,...）。
+    :param data_path:
+    :return: BarSeries，K线内的价格路径为 开-低-高-收
+    """
+    return frame_to_series(pd.read_csv(data_path, dtype={'time': str}))
 
 
-@functools.lru_cache(maxsize=128)
 def request_data(stock_code='000665', start_date='20230701', end_date='20230730', frequency=5):
-    data = ef.stock.get_quote_history(stock_code, klt=frequency, beg=start_date, end=end_date)
-
-    shijian, values = [], []
-    for process_line in data.values:
-        t = process_line[2].strip().replace('-', '/').replace(' ', '-')
-        if not re.search(r'\d+:\d+', t):  # 日线
-            t = f'{t}-10:00'
-        shijian.append(f'{t}:10')
-        values.append(float(process_line[3]))
-
-        shijian.append(f'{t}:20')
-        values.append(float(process_line[6]))
-
-        shijian.append(f'{t}:30')
-        values.append(float(process_line[5]))
-
-        shijian.append(f'{t}:40')
-        values.append(float(process_line[4]))
-    # 股票名称    股票代码          日期       开盘       收盘       最高       最低     成交量           成交额    振幅   涨跌幅    涨跌额    换手率
-    # ['湖北广电' '000665' '2023-07-20' 5.55 5.5 5.57 5.5 104447 57728957.25 1.27 -0.54 -0.03 0.92]
-    return shijian, values
+    """
+    取行情数据：行情目录里的文件完整覆盖时直接用（没有同周期的文件时用更细周期的合成），
+    否则查本地行情库，只下载本地还没有的日期。
+    :return: BarSeries，K线内的价格路径为 开-低-高-收
+    """
+    series = _local_quotes.find(stock_code, start_date, end_date, frequency)
+    if series is None:
+        series = _quote_store.get(stock_code, start_date, end_date, frequency)
+    return series
 
 
-@functools.lru_cache(maxsize=128)
 def parse_data(data_token, data_start_index, data_end_index):
+    """
+    加载股票数据并按起止位置或时间切片。
+    行情文件的切片按文件内容缓存（文件改了就是新的缓存项）；在线行情每次都查本地行情库，
+    今天的K线不算已覆盖，会重新下载，所以不缓存。
+    :return: BarSeries
+    """
     if data_token.endswith('.csv'):
         data_path = os.path.join(_data_root, data_token)
-        names, data = parse_excel(data_path)
+        quote_paths = [os.path.join(root, data_token) for root in _quote_roots]
+        if not os.path.exists(data_path) and any(os.path.exists(path) for path in quote_paths):
+            # 下载脚本保存的行情
+            data_path = [path for path in quote_paths if os.path.exists(path)][0]
+            key, parser = _series_store.file_key(data_path), parse_quote_csv
+        else:
+            key, parser = _content_store.digest(data_token) or _series_store.file_key(data_path), parse_excel
+        return slice_file_data(data_path, key, parser, data_start_index, data_end_index)
+    stock_code, frequency = data_token.split('-')
+    return request_data(
+        stock_code=str(stock_code),
+        start_date=data_start_index.replace('/', ''),
+        end_date=data_end_index.replace('/', ''),
+        frequency=int(frequency))
 
-        times, data_start_index, data_end_index = parse_data_index(names, data_start_index, data_end_index)
 
-        names = names[data_start_index:data_end_index]
-        data = data[data_start_index:data_end_index]
-    else:
-        stock_code, frequency = data_token.split('-')
-        names, data = request_data(
-            stock_code=str(stock_code),
-            start_date=data_start_index.replace('/', ''),
-            end_date=data_end_index.replace('/', ''),
-            frequency=int(frequency))
-    return names, data
+@functools.lru_cache(maxsize=128)
+def slice_file_data(data_path, key, parser, data_start_index, data_end_index):
+    """
+    加载行情文件并切片，key为文件内容md5，同样的内容和起止时间直接返回上次的切片（连同算好的索引）。
+    :return: BarSeries
+    """
+    series = _series_store.load_file(data_path, parser, key=key)
+    data_start_index, data_end_index = parse_data_index(series, data_start_index, data_end_index)
+    return series.slice_ticks(data_start_index, data_end_index)
 
 
 def run_example():
@@ -860,8 +1371,8 @@ def run_example():
     data_token = '000155.csv'
     data_start_index = '2024/09/01'
     data_end_index = '2025/07/31'
-    shijian, shuju = parse_data(data_token, data_start_index, data_end_index)
-    # shijian, shuju = parse_excel(data_path)
+    shijian, shuju = parse_data(data_token, data_start_index, data_end_index).to_lists()
+    # shijian, shuju = parse_excel(data_path).to_lists()
     result = grid_func(
         shuju=shuju,  # 数据
         touruzijin=20000,  # 投入总资金
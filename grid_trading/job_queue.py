@@ -0,0 +1,190 @@
+"""
+后台任务队列。
+
+参数搜索和评估可能要跑几分钟，提交为后台任务后接口立即返回任务id，
+任务在有界的线程池里运行，运行中可以查询进度（已回测/总候选数）和目前最好的结果，也可以取消；
+新进入前topn的结果记为事件，可以按序号增量读取（供SSE推送）。
+任务记录保存在当前进程内存里。
+"""
+import collections
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """任务被取消，由 Job.progress 抛出，搜索循环收到后逐层退出。"""
+
+
+class Job(object):
+    """
+    一个后台任务。
+    ```
+    status: queued排队中、running运行中、done完成、failed失败、cancelled已取消
+    done/total: 已完成数和总数（候选参数数或折数），总数未知时为None
+    best: 目前最好的结果
+    events: 最近的事件 (序号, 名称, 内容)，序号从1递增
+    ```
+    """
+
+    def __init__(self, kind, params=None, max_events=10000):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = 0
+        self.total = None
+        self.best = None
+        self.result = None
+        self.error = None
+        self.events = collections.deque(maxlen=max_events)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._cancel = threading.Event()
+        self._future = None
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def ended(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def progress(self, done, total=None, best=None, new_top=None):
+        """
+        报告进度，由任务函数定期调用；任务已被取消时抛出 JobCancelled。
+        ```
+        :param done: 已完成数
+        :param total: 总数，未知时为None
+        :param best: 目前最好的结果，不传则保持不变
+        :param new_top: 这次新进入前topn的结果列表，每个记为一个top事件
+        ```
+        """
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+        with self._cond:
+            self.done, self.total = done, total
+            if best is not None:
+                self.best = best
+            for item in new_top or ():
+                self._emit('top', item)
+            self._cond.notify_all()
+
+    def _emit(self, name, data):
+        self._seq += 1
+        self.events.append((self._seq, name, data))
+
+    def finish(self, status):
+        """标记任务结束并唤醒等待事件的读者。"""
+        with self._cond:
+            self.status, self.finished = status, time.time()
+            self._cond.notify_all()
+
+    def wait_events(self, after=0, timeout=None):
+        """
+        等待并返回序号大于after的事件，超时或任务结束时可能返回空列表。
+        ```
+        :param after: 已读到的最后一个事件序号
+        :param timeout: 最多等待的秒数
+        :return: [(序号, 名称, 内容)]
+        ```
+        """
+        with self._cond:
+            if self._seq <= after and not self.ended:
+                self._cond.wait(timeout)
+            return [e for e in self.events if e[0] > after]
+
+    def to_dict(self, with_result=True):
+        out = dict(job_id=self.id, kind=self.kind, params=self.params, status=self.status,
+                   created=self.created, started=self.started, finished=self.finished,
+                   progress=dict(done=self.done, total=self.total,
+                                 ratio=round(self.done / self.total, 4) if self.total else None),
+                   best=self.best, error=self.error)
+        if with_result:
+            out['result'] = self.result
+        return out
+
+
+class JobQueue(object):
+    """
+    有界的后台任务队列。
+    ```
+    queue = JobQueue(max_workers=2)
+    job = queue.submit('searching', lambda job: run(progress=job.progress))
+    queue.get(job.id).to_dict()
+    queue.cancel(job.id)
+    ```
+    """
+
+    def __init__(self, max_workers=2, max_history=200):
+        self.max_history = max_history
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='grid-job')
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, params=None):
+        """
+        提交任务。
+        ```
+        :param kind: 任务类型，例如 searching、evaluating
+        :param func: func(job)，在后台线程运行，返回值为任务结果
+        :param params: 任务参数，查询时原样返回
+        :return: Job
+        ```
+        """
+        job = Job(kind, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        job._future = self._pool.submit(self._run, job, func)
+        return job
+
+    def _run(self, job, func):
+        if job.cancel_requested:
+            job.finish('cancelled')
+            return
+        job.status, job.started = 'running', time.time()
+        status = 'failed'
+        try:
+            job.result = func(job)
+            status = 'done'
+        except JobCancelled:
+            status = 'cancelled'
+        except Exception as e:
+            job.error = f'{type(e).__name__}: {e}'
+            traceback.print_exc()
+        finally:
+            job.finish(status)
+
+    def _trim(self):
+        """只保留最近 max_history 个已结束的任务。"""
+        ended = [k for k, j in self._jobs.items() if j.ended]
+        for k in ended[:max(0, len(ended) - self.max_history)]:
+            del self._jobs[k]
+
+    def get(self, job_id):
+        """按id取任务，没有则返回None。"""
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        """所有任务，按提交顺序。"""
+        return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """
+        取消任务：排队中的直接取消，运行中的在下一次报告进度时停止。
+        :return: Job，没有则返回None
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.ended:
+            return job
+        job._cancel.set()
+        if job._future is not None and job._future.cancel():
+            job.finish('cancelled')
+        return job
@@ -0,0 +1,314 @@
+"""
+本地增量行情库。
+
+按 代码+K线周期 各存一份列式K线（mnt/quotes/{代码}_{周期}/，格式同 SeriesStore），
+manifest 里记下已经下载过的日期区间。请求一段行情时先看本地覆盖了哪些日期，
+只下载缺的日期区间，合并进本地后再按日期切片返回；重叠的窗口不重复下载，重启后也还在。
+本地已有更细周期的K线时，粗周期（15/30/60分钟、日、周、月）直接合成，不再单独下载（见 resample）。
+行情来源可替换：默认用efinance下载，离线部署或测试时可以换成读本地csv文件的 FileFetcher。
+"""
+import datetime
+import fnmatch
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .bar_series import BarSeries, to_epoch
+from .series_store import SeriesStore
+from .resample import resample, finer_frequencies
+
+_epoch_ordinal = datetime.date(1970, 1, 1).toordinal()
+# efinance的K线周期在baostock文件名里的写法
+_frequency_alias = {101: ('d',), 102: ('w',), 103: ('m',)}
+
+
+def frame_to_series(df):
+    """
+    行情表转为BarSeries：efinance格式（股票名称,股票代码,日期,开盘,收盘,最高,最低,成交量,...）
+    或baostock格式（date,[time,]code,open,high,low,close,volume,...）。
+    ```
+    :param df: pandas.DataFrame
+    :return: BarSeries，K线内的价格路径为 开-低-高-收，日线记为当天10:00
+    ```
+    """
+    if '日期' in df.columns:
+        # 2025-05-21 10:30 或 2014-12-30（日线）
+        shijian = df['日期'].astype(str).str.strip().str.replace('-', '/').str.replace(' ', '-')
+        shijian = shijian.where(shijian.str.contains(':'), shijian + '-10:00')
+        cols = ('开盘', '最高', '最低', '收盘', '成交量')
+    elif 'date' in df.columns:
+        if 'time' in df.columns:
+            # 20230103103000000
+            t = df['time'].astype(str)
+            shijian = t.str[:4] + '/' + t.str[4:6] + '/' + t.str[6:8] + '-' + t.str[8:10] + ':' + t.str[10:12]
+        else:
+            shijian = df['date'].astype(str).str.replace('-', '/') + '-10:00'
+        cols = ('open', 'high', 'low', 'close', 'volume')
+    else:
+        raise ValueError(f'unknown quote columns: {list(df.columns)}')
+    kaipan, zuigao, zuidi, shoupan, chengjiaoliang = (df[c].values.astype(float) for c in cols)
+    return BarSeries(time=to_epoch(shijian.tolist(), fmt='%Y/%m/%d-%H:%M'), open=kaipan, high=zuigao, low=zuidi,
+                     close=shoupan, volume=chengjiaoliang, path='OLHC')
+
+
+def empty_series():
+    return BarSeries(time=[], open=[], high=[], low=[], close=[], volume=[], path='OLHC')
+
+
+def to_day(date):
+    """'20230701'、'2023/07/01'、'2023-07-01 09:30' 等取前8位数字，转为日序号（date.toordinal）。"""
+    digits = re.sub(r'\D', '', str(date))[:8]
+    return datetime.datetime.strptime(digits, '%Y%m%d').toordinal()
+
+
+def format_day(day):
+    return datetime.date.fromordinal(day).strftime('%Y%m%d')
+
+
+def slice_days(series, start_day, end_day):
+    """取 [start_day, end_day] 这几天的K线，K线时间须递增。"""
+    lo, hi = ((d - _epoch_ordinal) * 86400 for d in (start_day, end_day + 1))
+    start, end = np.searchsorted(series.time, [lo, hi], side='left')
+    return series.slice(int(start), int(end))
+
+
+def only_closed(start_day, end_day, closed=None):
+    """
+    [start_day, end_day] 里都不是交易日（空区间也算）：周末，或closed判断为休市的日子（节假日）。
+    ```
+    :param closed: closed(日序号) -> bool，None为只看周末
+    ```
+    """
+    return all(datetime.date.fromordinal(d).weekday() >= 5 or (closed is not None and closed(d))
+               for d in range(start_day, end_day + 1))
+
+
+def merge_series(old, new):
+    """合并两段K线并按时间排序，同一时间的K线以new为准。"""
+    cols = ('time', 'open', 'high', 'low', 'close', 'volume')
+    merged = {c: np.concatenate([getattr(old, c), getattr(new, c)]) for c in cols}
+    order = np.argsort(merged['time'], kind='stable')
+    t = merged['time'][order]
+    # 排序稳定，同一时间的K线里new排在后面，保留最后一个
+    keep = order[np.append(t[1:] != t[:-1], True)] if len(t) else order
+    return BarSeries(path=old.path, **{c: v[keep] for c, v in merged.items()})
+
+
+def missing_ranges(covered, start_day, end_day):
+    """
+    [start_day, end_day] 里没有被覆盖的日期区间。
+    ```
+    :param covered: 已覆盖的日期区间 [(起, 止)]，闭区间，已排序且不重叠
+    :return: [(起, 止)]
+    ```
+    """
+    gaps, day = [], start_day
+    for lo, hi in covered:
+        if hi < day:
+            continue
+        if lo > end_day:
+            break
+        if lo > day:
+            gaps.append((day, lo - 1))
+        day = max(day, hi + 1)
+    if day <= end_day:
+        gaps.append((day, end_day))
+    return gaps
+
+
+def merge_ranges(ranges):
+    """合并重叠或相邻的日期区间。"""
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+class QuoteFetcher(object):
+    """行情来源接口：fetch(代码, 起始日期, 结束日期, K线周期) 返回这段日期（含两端）的K线。"""
+
+    name = 'base'
+
+    def fetch(self, code, start_date, end_date, frequency):
+        """
+        ```
+        :param code: 股票或指数代码，例如 000665
+        :param start_date: 起始日期，YYYYMMDD
+        :param end_date: 结束日期，YYYYMMDD
+        :param frequency: K线周期（efinance的klt），5、15、30、60为分钟线，101为日线
+        :return: BarSeries，时间递增
+        ```
+        """
+        raise NotImplementedError
+
+
+class EfinanceFetcher(QuoteFetcher):
+    """用efinance在线下载。"""
+
+    name = 'efinance'
+
+    def fetch(self, code, start_date, end_date, frequency):
+        import efinance as ef
+        df = ef.stock.get_quote_history(code, klt=frequency, beg=start_date, end=end_date)
+        if df is None or not len(df):
+            return empty_series()
+        return frame_to_series(df)
+
+
+class FileFetcher(QuoteFetcher):
+    """
+    读下载脚本保存在本地的行情csv，离线部署和测试时代替在线下载。
+    文件名为 {代码}_{周期}_{起始日期}.csv（efinance）或 {市场}.{代码}_{周期}_{起始日期}.csv（baostock）。
+    ```
+    fetcher = FileFetcher(['data/stock', 'data/Index/points'])
+    ```
+    """
+
+    name = 'file'
+
+    def __init__(self, roots, loader=None):
+        """
+        ```
+        :param roots: 数据目录列表
+        :param loader: loader(文件路径) -> BarSeries，默认直接读csv
+        ```
+        """
+        self.roots = roots
+        self.loader = loader or (lambda path: frame_to_series(pd.read_csv(path, dtype={'time': str})))
+
+    def files(self, code, frequency):
+        """某个代码和周期的所有本地文件。"""
+        patterns = [f'{p}{code}_{f}_*.csv' for p in ('', '*.')
+                    for f in (str(frequency),) + _frequency_alias.get(int(frequency), ())]
+        return [os.path.join(root, name) for root in self.roots if os.path.isdir(root)
+                for name in sorted(os.listdir(root)) if any(fnmatch.fnmatch(name, p) for p in patterns)]
+
+    def load(self, code, frequency):
+        """某个代码和周期的所有本地文件合并成一条序列，没有文件时为空序列。"""
+        series = empty_series()
+        for path in self.files(code, frequency):
+            series = merge_series(series, self.loader(path))
+        return series
+
+    def start_day(self, path):
+        """文件名里的起始日期：下载脚本从这天开始下载，文件第一根K线之前的日子都不是交易日；取不到时为None。"""
+        try:
+            return to_day(os.path.splitext(os.path.basename(path))[0].rsplit('_', 1)[1])
+        except (IndexError, ValueError):
+            return None
+
+    def sources(self, frequency):
+        """能得到frequency周期K线的本地周期：先同周期，再由近到远的更细周期（更细的周期通常历史更短）。"""
+        return [int(frequency)] + finer_frequencies(frequency)[::-1]
+
+    def fetch(self, code, start_date, end_date, frequency):
+        """本地有同周期文件时直接切片，没有时用更细周期的文件合成。"""
+        for source in self.sources(frequency):
+            series = self.load(code, source)
+            if len(series):
+                return resample(slice_days(series, to_day(start_date), to_day(end_date)), frequency, source)
+        return empty_series()
+
+    def find(self, code, start_date, end_date, frequency):
+        """
+        本地文件完整覆盖这段日期时返回K线（必要时用更细周期合成），否则返回None。
+        文件覆盖的日期从文件名里的起始日期（早于第一根K线时）到最后一根K线；
+        所请求的起止日期超出覆盖范围的部分只能是休市日才算完整覆盖：周末，
+        或者这个代码其他周期的文件覆盖了那天却没有K线（节假日，例如2022年1月3日）。
+        """
+        start_day, end_day = to_day(start_date), to_day(end_date)
+        loaded = []
+        for source in self.sources(frequency):
+            series = self.load(code, source)
+            if not len(series):
+                continue
+            days = np.unique(series.time // 86400) + _epoch_ordinal
+            named = [d for d in map(self.start_day, self.files(code, source)) if d is not None]
+            first_day = min([int(days[0])] + named)
+            loaded.append((source, series, first_day, int(days[-1]), set(days.tolist())))
+
+        def closed(day):
+            """day是已知的休市日：某个文件覆盖了这天却没有这天的K线。"""
+            return any(lo <= day <= hi and day not in days for _, _, lo, hi, days in loaded)
+
+        for source, series, first_day, last_day, _ in loaded:
+            if all(only_closed(lo, hi, closed) for lo, hi in ((start_day, first_day - 1), (last_day + 1, end_day))):
+                return resample(slice_days(series, start_day, end_day), frequency, source)
+        return None
+
+
+class QuoteStore(object):
+    """
+    按 代码+K线周期 保存的本地增量行情库。
+    ```
+    store = QuoteStore('mnt/quotes', EfinanceFetcher())
+    series = store.get('000665', '20230701', '20230730', 5)  # 只下载本地还没有的日期
+    ```
+    """
+
+    def __init__(self, root, fetcher):
+        self.fetcher = fetcher
+        self.store = SeriesStore(root)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(code, frequency):
+        return f'{code}_{frequency}'
+
+    def covered(self, code, frequency):
+        """本地已覆盖的日期区间 [(起, 止)]，YYYYMMDD。"""
+        manifest = self.store.manifest(self.key(code, frequency)) or {}
+        return [tuple(r) for r in manifest.get('covered', [])]
+
+    def derive(self, code, start_day, end_day, frequency):
+        """本地已保存的更细周期完整覆盖这段日期时，用它合成K线，否则返回None。"""
+        for source in finer_frequencies(frequency)[::-1]:
+            covered = [(to_day(lo), to_day(hi)) for lo, hi in self.covered(code, source)]
+            if covered and not missing_ranges(covered, start_day, end_day):
+                series = self.store.load(self.key(code, source))
+                if series is not None:
+                    return resample(slice_days(series, start_day, end_day), frequency, source)
+        return None
+
+    def get(self, code, start_date, end_date, frequency):
+        """
+        取一段行情：本地已覆盖的日期直接切片；同周期没覆盖、但更细的周期已完整覆盖时用它合成；
+        都没有时缺的日期区间向行情来源下载后合并保存。
+        今天及以后的日期可能还有新K线，不记为已覆盖，下次请求会重新下载。
+        ```
+        :param code: 股票或指数代码
+        :param start_date: 起始日期，YYYYMMDD
+        :param end_date: 结束日期，YYYYMMDD
+        :param frequency: K线周期
+        :return: BarSeries
+        ```
+        """
+        key = self.key(code, frequency)
+        start_day, end_day = to_day(start_date), to_day(end_date)
+        with self._lock:
+            series = self.store.load(key)
+            if series is None:
+                series, covered = empty_series(), []
+            else:
+                covered = [(to_day(lo), to_day(hi)) for lo, hi in self.covered(code, frequency)]
+            gaps = missing_ranges(covered, start_day, end_day)
+            if gaps:
+                derived = self.derive(code, start_day, end_day, frequency)
+                if derived is not None:
+                    return derived
+                for lo, hi in gaps:
+                    series = merge_series(series, self.fetcher.fetch(code, format_day(lo), format_day(hi),
+                                                                     frequency))
+                today = datetime.date.today().toordinal()
+                covered = merge_ranges(covered + [(lo, min(hi, today - 1)) for lo, hi in gaps if lo < today])
+                self.store.save(key, series, code=code, frequency=frequency, source=self.fetcher.name,
+                                covered=[(format_day(lo), format_day(hi)) for lo, hi in covered])
+                loaded = self.store.load(key)
+                series = series if loaded is None else loaded
+        return slice_days(series, start_day, end_day)
@@ -0,0 +1,80 @@
+"""
+价格序列的区间最值索引。
+
+按 2 的幂次把价格序列分块，逐层保存每块的最大值和最小值（总共约 2n 个数）。
+回测时大部分数据点既不触发买入也不触发卖出，用这个索引可以在 O(log n) 内找到
+下一个可能触发交易的位置，跳过中间的平静区间。
+也可以直接对K线建索引：最大值取最高价，最小值取最低价。
+"""
+import numpy as np
+
+
+class RangeIndex(object):
+    """
+    区间最值索引，对一条价格序列只需构建一次。
+    ```
+    index = RangeIndex(values)
+    index.first_outside(i, lo, hi)  # 位置i及之后第一个 价格>=hi 或 价格<=lo 的位置
+    index.first_cross(jizhunjia)    # 股价第一次达到基准价的位置
+
+    bar_index = RangeIndex(high, low)  # K线索引，位置为K线序号
+    ```
+    """
+
+    def __init__(self, values, low=None):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.size = len(self.values)
+        self._max = [self.values]
+        self._min = [self.values if low is None else np.asarray(low, dtype=np.float64)]
+        while len(self._max[-1]) > 1:
+            mx, mn = self._max[-1], self._min[-1]
+            if len(mx) % 2:
+                mx = np.append(mx, mx[-1])
+                mn = np.append(mn, mn[-1])
+            self._max.append(np.maximum(mx[0::2], mx[1::2]))
+            self._min.append(np.minimum(mn[0::2], mn[1::2]))
+        self.levels = len(self._max)
+
+    def first_outside(self, start, lo, hi):
+        """
+        查找位置start及之后第一个 价格>=hi 或 价格<=lo 的位置。
+        ```
+        :param start: 起始位置
+        :param lo: 下边界，不需要时传 -inf
+        :param hi: 上边界，不需要时传 inf
+        :return: 位置，没有则返回序列长度
+        ```
+        """
+        i, k = int(start), 0
+        while i < self.size:
+            b = i >> k
+            if self._max[k][b] < hi and self._min[k][b] > lo:
+                # 整块都在区间内，跳过这一块，并尽量跳到更大的块
+                i = (b + 1) << k
+                while k + 1 < self.levels and not (i >> k) & 1:
+                    k += 1
+            elif k == 0:
+                return i
+            else:
+                # 块内有突破，缩小到左半块继续找
+                k -= 1
+        return self.size
+
+    def first_cross(self, jizhunjia):
+        """
+        找股价达到基准价的时刻：第一个满足 (基准价-v[i])*(基准价-v[i+1])<=0 的位置i。
+        ```
+        :param jizhunjia: 基准价
+        :return: 位置，没有则返回-1
+        ```
+        """
+        if self.size < 2:
+            return -1
+        v0 = self.values[0]
+        if v0 == jizhunjia:
+            return 0
+        if v0 < jizhunjia:
+            k = self.first_outside(1, -np.inf, jizhunjia)
+        else:
+            k = self.first_outside(1, jizhunjia, np.inf)
+        return k - 1 if k < self.size else -1
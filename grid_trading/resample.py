@@ -0,0 +1,95 @@
+"""
+把细粒度K线合成粗粒度K线。
+
+周期沿用efinance的klt：1、5、15、30、60为分钟线，101为日线，102为周线，103为月线。
+分钟线按A股的交易时段合成：上午 9:30-11:30、下午 13:00-15:00，K线时间记为结束时间（与efinance相同），
+例如60分钟线为 10:30、11:30、14:00、15:00，不会跨午休合成一根；时段外的K线归入相邻的一根：开盘前（集合竞价）的归入上午第一根，
+午休时间的归入上午最后一根，收盘后的归入下午最后一根。
+日线记为当天10:00；周线、月线记为这一周（月）最后一个交易日的10:00，与下载的日线、周线一致。
+开盘取第一根，收盘取最后一根，最高、最低取极值，成交量求和。
+"""
+import numpy as np
+
+from .bar_series import BarSeries
+
+# 分钟线周期
+intraday_frequencies = (1, 5, 15, 30, 60)
+# 交易时段（当天第几分钟）：上午 9:30-11:30，下午 13:00-15:00
+_sessions = ((570, 690), (780, 900))
+
+
+def can_resample(source, target):
+    """
+    source周期的K线能否合成target周期。
+    ```
+    :param source: 原周期
+    :param target: 目标周期
+    :return: bool
+    ```
+    """
+    source, target = int(source), int(target)
+    if source == target:
+        return True
+    if target in intraday_frequencies:
+        return source in intraday_frequencies and source < target and target % source == 0
+    if target == 101:
+        return source in intraday_frequencies
+    if target in (102, 103):
+        return source in intraday_frequencies or source == 101
+    return False
+
+
+def finer_frequencies(target):
+    """能合成target周期的更细的周期，从细到粗。"""
+    return [f for f in intraday_frequencies + (101,) if f != int(target) and can_resample(f, target)]
+
+
+def _bar_labels(time, frequency):
+    """每根原K线所属的目标K线的分组键和时间。"""
+    day = time // 86400
+    if frequency in intraday_frequencies:
+        minute = time % 86400 // 60
+        # 下午开盘之前（含午休）都算上午，午休的K线归入上午最后一根
+        morning = minute < _sessions[1][0]
+        start = np.where(morning, _sessions[0][0], _sessions[1][0])
+        length = np.where(morning, _sessions[0][1] - _sessions[0][0], _sessions[1][1] - _sessions[1][0])
+        # K线时间是结束时间：(start, start+k] 归入 start+k
+        offset = np.clip(-(-(minute - start) // frequency) * frequency, frequency, length)
+        label = day * 86400 + (start + offset) * 60
+        return label, label
+    if frequency == 101:
+        key = day
+    elif frequency == 102:
+        # 1970-01-01是星期四，加3后按7天整除即以星期一为一周的开始
+        key = (day + 3) // 7
+    elif frequency == 103:
+        key = time.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+    else:
+        raise ValueError(f'unknown frequency: {frequency}')
+    return key, day * 86400 + 10 * 3600
+
+
+def resample(series, frequency, source=None):
+    """
+    合成K线。
+    ```
+    :param series: BarSeries，时间递增
+    :param frequency: 目标周期
+    :param source: 原周期，给出时检查能否合成
+    :return: BarSeries，K线内的价格路径与原序列相同
+    ```
+    """
+    frequency = int(frequency)
+    if source is not None:
+        if int(source) == frequency:
+            return series
+        if not can_resample(source, frequency):
+            raise ValueError(f'cannot resample frequency {source} to {frequency}')
+    if not len(series):
+        return series
+    key, label = _bar_labels(series.time, frequency)
+    starts = np.flatnonzero(np.append(True, key[1:] != key[:-1]))
+    ends = np.append(starts[1:], len(key)) - 1
+    return BarSeries(time=label[ends], open=series.open[starts], high=np.maximum.reduceat(series.high, starts),
+                     low=np.minimum.reduceat(series.low, starts), close=series.close[ends],
+                     volume=np.add.reduceat(series.volume, starts), path=series.path)
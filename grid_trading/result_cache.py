@@ -0,0 +1,136 @@
+"""
+参数搜索和评估结果的磁盘缓存。
+
+缓存的键由行情数据内容的哈希（BarSeries.digest）和规范化后的搜索条件组成，
+与请求里起止时间的写法无关；结果以json文件保存在缓存目录下，服务重启或多个进程之间都能复用。
+缓存总大小超过上限时，按最近使用时间从旧到新删除。
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+
+class ResultCache(object):
+    """
+    基于文件的结果缓存。
+    ```
+    cache = ResultCache('mnt/cache', max_bytes=512 << 20)
+    key = cache.key('searching', series.digest(), dict(n_search=4, topn=10))
+    result = cache.get(key)
+    if result is None:
+        result = ...
+        cache.put(key, result)
+    ```
+    """
+
+    def __init__(self, root, max_bytes=512 << 20):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(*parts):
+        """由任意可json序列化的内容生成缓存键。"""
+        text = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(text.encode('utf8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, f'{key}.json')
+
+    def get(self, key):
+        """读取缓存，没有则返回None；读到时更新文件时间，作为最近使用时间。"""
+        path = self.path(key)
+        try:
+            with open(path, encoding='utf8') as fin:
+                value = json.load(fin)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """写入缓存：先写临时文件再改名，其他进程不会读到写了一半的文件。"""
+        if not os.path.exists(self.root):
+            os.makedirs(self.root, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wt', encoding='utf8') as fout:
+                json.dump(value, fout, ensure_ascii=False)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """总大小超过上限时，删除最久没用的缓存文件。"""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.json'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.root, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """清空缓存。"""
+        if os.path.exists(self.root):
+            for name in os.listdir(self.root):
+                if name.endswith('.json') or name.endswith('.tmp'):
+                    os.remove(os.path.join(self.root, name))
+
+
+def pack_search_result(result, base_keys):
+    """
+    把 search_params 的结果整理成可缓存的形式。
+    ```
+    result_best、result_topn、result_examples 里同一组参数是同一个字典，缓存里只存一份，用序号引用；
+    参数里的数据字段（data_token、起止时间等）与请求写法有关，不存。
+    :param result: search_params 的结果
+    :param base_keys: 请求的基础参数字段名
+    :return: dict
+    ```
+    """
+    entries, refs = [], {}
+
+    def ref(item):
+        if id(item) not in refs:
+            refs[id(item)] = len(entries)
+            param = {k: v for k, v in item['param'].items() if k not in base_keys}
+            entries.append(dict(item, param=param))
+        return refs[id(item)]
+
+    packed = {k: v for k, v in result.items() if k not in ('result_best', 'result_topn', 'result_examples')}
+    packed.update(entries=entries,
+                  result_topn=[ref(x) for x in result['result_topn']],
+                  result_examples=[ref(x) for x in result['result_examples']])
+    return packed
+
+
+def unpack_search_result(packed, param):
+    """
+    还原 pack_search_result 的结果，参数里的数据字段用本次请求的param补上。
+    :return: 与 search_params 的结果相同
+    """
+    items = [dict(entry, param={**param, **entry['param']}) for entry in packed['entries']]
+    result_topn = [items[k] for k in packed['result_topn']]
+    out = dict(result_best=result_topn[:1], result_topn=result_topn,
+               result_examples=[items[k] for k in packed['result_examples']])
+    out.update({k: v for k, v in packed.items() if k not in ('entries', 'result_topn', 'result_examples')})
+    return out
+
@@ -0,0 +1,174 @@
+"""
+先粗后细的自适应参数搜索。
+
+全网格搜索的候选数约随 n_search 的五次方增长，其中大部分落在收益很差的区域。
+这里先用较稀的网格覆盖整个参数空间，再只在当前最好的几组参数附近逐级细化：
+每一级把每组参数的每个维度往两边各挪1、2、4步，进入前列的就保留，然后步长缩小为 1/√2，
+直到步长比 n_search 对应网格间距的1/4细。
+每一级的邻居一次交给 evaluate 批量回测：批量引擎每次调用有按K线数计的固定开销，
+批越大分摊越少，所以不再在同一步长上一轮一轮地小批量细化。
+不同参数常常得到完全相同的回测结果，前列按盈亏比例去重，保证细化的区域不挤在一处。
+"""
+import math
+
+from .search_stream import iter_candidates, iter_chunks, SpreadCandidates, TopK
+
+# 每个维度往两边各挪几步
+_STEPS = (1, 2, 4)
+# 每个中心的邻居数：6个维度，每个维度两个方向
+n_neighbors = 6 * 2 * len(_STEPS)
+# 参与去重的参数字段
+_key_names = ('wanggeshangjie', 'wanggexiajie', 'mairuyuzhi', 'jizhunjia', 'jiancangfene', 'dancifene')
+
+
+def candidate_key(p):
+    """候选参数的去重键。"""
+    return tuple(p[k] for k in _key_names)
+
+
+def make_candidate(param, shangjie, xiajie, wangge, jizhunjia, dancifene, fenshu):
+    """
+    按全网格搜索相同的约束构造候选参数，不满足约束返回None。
+    ```
+    :param param: 基础参数
+    :param shangjie: 网格上界
+    :param xiajie: 网格下界
+    :param wangge: 网格大小（买入、卖出阈值）
+    :param jizhunjia: 基准价
+    :param dancifene: 单次交易股数
+    :param fenshu: 建仓份数，建仓股数 = 单次交易股数 * 建仓份数
+    :return: dict or None
+    ```
+    """
+    shangjie, xiajie = round(float(shangjie), 4), round(float(xiajie), 4)
+    wangge, jizhunjia = round(float(wangge), 4), round(float(jizhunjia), 4)
+    if shangjie - xiajie <= 0.001 or wangge < 0.001 or shangjie - xiajie < wangge:
+        return None
+    if not xiajie <= jizhunjia <= shangjie or jizhunjia <= 0:
+        return None
+    dancifene = max(100, int(round(dancifene / 100)) * 100)
+    jiancangfene = dancifene * max(1, int(fenshu))
+    if jiancangfene > param['touruzijin'] // jizhunjia // 100 * 100:
+        return None
+    p = dict(wanggeshangjie=shangjie, wanggexiajie=xiajie,
+             wanggeleixing=1,
+             mairuyuzhi=wangge, maichuyuzhi=wangge,
+             jizhunjia=jizhunjia, jiancangfene=jiancangfene,
+             dancifene=dancifene)
+    return {**param, **p}
+
+
+def iter_neighbors(param, center, buchang, beishu, jiage_min, jiage_max):
+    """
+    center附近的候选：每个维度单独往两边各挪 _STEPS 步，共 n_neighbors 个（不满足约束的为None）。
+    ```
+    :param center: 中心候选参数
+    :param buchang: 价格维度（上界、下界、基准价）的步长
+    :param beishu: 网格大小、股数维度的倍数步长，例如2表示乘2或除2
+    ```
+    """
+    shangjie, xiajie = center['wanggeshangjie'], center['wanggexiajie']
+    wangge, jizhunjia = center['mairuyuzhi'], center['jizhunjia']
+    dancifene = center['dancifene']
+    fenshu = center['jiancangfene'] // dancifene
+
+    def clip(v):
+        return min(max(v, jiage_min), jiage_max)
+
+    for k in _STEPS:
+        for d in (-buchang * k, buchang * k):
+            yield make_candidate(param, clip(shangjie + d), xiajie, wangge, jizhunjia, dancifene, fenshu)
+            yield make_candidate(param, shangjie, clip(xiajie + d), wangge, jizhunjia, dancifene, fenshu)
+            yield make_candidate(param, shangjie, xiajie, wangge, clip(jizhunjia + d), dancifene, fenshu)
+        for b in (beishu ** -k, beishu ** k):
+            yield make_candidate(param, shangjie, xiajie, wangge * b, jizhunjia, dancifene, fenshu)
+            yield make_candidate(param, shangjie, xiajie, wangge, jizhunjia, dancifene * b, fenshu)
+            # 份数至少变化k份
+            fs = round(fenshu * b)
+            yield make_candidate(param, shangjie, xiajie, wangge, jizhunjia, dancifene,
+                                 fs if abs(fs - fenshu) >= k else fenshu + (k if b > 1 else -k))
+
+
+def coarse_density(n_search):
+    """稀疏网格的搜索密度。"""
+    return max(3, (n_search + 1) // 2)
+
+
+def zoom_levels(n_search):
+    """
+    细化的级数：步长从稀疏网格间距的1/2开始，每级缩小为 1/√2，细到全网格搜索间距的1/4为止。
+    """
+    ratio = max(n_search - 1, 1) * 2 / (coarse_density(n_search) - 1)
+    return max(0, int(math.floor(2 * math.log2(ratio) + 1e-9)) + 1)
+
+
+def _front_centers(front, beam):
+    """前列里盈亏比例互不相同的前beam组参数，返回 [(序号, 候选参数)]。"""
+    centers, values = [], set()
+    for k, (yinkuibili, p) in front.items():
+        if yinkuibili not in values:
+            values.add(yinkuibili)
+            centers.append((k, p))
+            if len(centers) == beam:
+                break
+    return centers
+
+
+def zoom_search(param, jiage_min, jiage_max, n_search, evaluate, beam=10, stop=None, batch_size=1024):
+    """
+    先粗后细搜索参数。
+    ```
+    :param param: 基础参数
+    :param jiage_min: 最低价
+    :param jiage_max: 最高价
+    :param n_search: 搜索密度，最后的步长细到全网格搜索间距的1/4
+    :param evaluate: 回测一批候选参数的函数，返回对应的盈亏比例列表
+    :param beam: 每级在前多少组参数附近细化
+    :param stop: 返回True时停止（例如时间预算用完）：稀疏网格按覆盖优先的顺序分批回测，每批之后调用；
+                 之后每级细化之前调用
+    :param batch_size: 有stop时稀疏网格每批的候选数
+    :return: dict(n_candidates=回测的候选数, n_coarse=稀疏网格的候选数, coarse_done=稀疏网格已回测的候选数)
+    ```
+    """
+    seen = set()
+    front = TopK(beam * 4)
+    counter = [0]
+
+    def run(candidates):
+        batch = []
+        for p in candidates:
+            if p is None:
+                continue
+            key = candidate_key(p)
+            if key not in seen:
+                seen.add(key)
+                batch.append(p)
+        if not batch:
+            return
+        for p, yinkuibili in zip(batch, evaluate(batch)):
+            front.push(counter[0], yinkuibili, (yinkuibili, p))
+            counter[0] += 1
+
+    # 第一轮：稀疏网格
+    n_coarse = coarse_density(n_search)
+    if stop is None:
+        run(iter_candidates(param, jiage_min, jiage_max, n_coarse))
+        coarse_total = coarse_done = counter[0]
+    else:
+        # 分批回测，到时停下时已回测的候选也均匀分布在整个参数空间
+        coarse = SpreadCandidates(param, jiage_min, jiage_max, n_coarse)
+        coarse_total = len(coarse)
+        for _, batch in iter_chunks(coarse, batch_size):
+            run(batch)
+            if stop():
+                break
+        coarse_done = counter[0]
+
+    for level in range(zoom_levels(n_search)):
+        if stop is not None and stop():
+            break
+        buchang = (jiage_max - jiage_min) / (n_coarse - 1) / 2 * 2 ** (-level / 2)
+        beishu = 2.0 ** (2 ** (-level / 2))
+        centers = _front_centers(front, beam)
+        run(n for _, c in centers for n in iter_neighbors(param, c, buchang, beishu, jiage_min, jiage_max))
+    return dict(n_candidates=counter[0], n_coarse=coarse_total, coarse_done=coarse_done)
@@ -0,0 +1,173 @@
+"""
+参数搜索的开销估计。
+
+全网格搜索的候选数取决于 n_search、投入资金和价格区间：建仓股数和单次股数两层循环随 投入资金/价格 增长，
+事先很难看出一次搜索要回测多少组参数。这里不生成候选，按 iter_grid 的循环结构直接数出候选数：
+单次股数必须整除建仓股数，某个建仓股数（以100股为单位记为m）对应的候选数就是m的约数个数。
+回测耗时约与 候选数×K线数 成正比，比例（回测速度）用最近实际搜索的耗时滑动平均，没有记录时用一小段行情现场测一次；
+另外每轮回测（一次批量引擎调用，多进程时各进程同时算一块）有与K线数成正比的固定开销，
+自适应搜索的候选不多、轮数却不少，只按候选数估计会偏低很多。测得的速度保存在磁盘上，服务重启后不用重测。
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .search_stream import iter_candidates, GridLayout
+from .search_pool import _score_chunk
+from .search_adaptive import coarse_density, zoom_levels, n_neighbors
+
+
+def count_candidates(touruzijin, jiage_min, jiage_max, n_search):
+    """
+    不生成候选，数出 iter_candidates 会产生的候选数（见 GridLayout）。
+    ```
+    :param touruzijin: 投入资金
+    :param jiage_min: 最低价
+    :param jiage_max: 最高价
+    :param n_search: 搜索密度
+    :return: 候选数
+    ```
+    """
+    return len(GridLayout(touruzijin, jiage_min, jiage_max, n_search))
+
+
+def count_zoom_candidates(touruzijin, jiage_min, jiage_max, n_search, beam=10):
+    """
+    先粗后细搜索（zoom_search）回测候选数的上界：稀疏网格的候选数，加上每级每个中心的全部邻居。
+    实际因为去重会少一些。
+    """
+    n_coarse = coarse_density(n_search)
+    return count_candidates(touruzijin, jiage_min, jiage_max, n_coarse) + zoom_levels(n_search) * beam * n_neighbors
+
+
+def count_rounds(n_grid, batch_size, workers=1, levels=0):
+    """
+    回测的轮数：网格部分每块一次引擎调用，能并行的进程同时算的几块算一轮；自适应搜索每级细化另算一轮。
+    ```
+    :param n_grid: 按块回测的候选数（全网格，或自适应搜索的稀疏网格）
+    :param batch_size: 每块的候选数
+    :param levels: 自适应搜索的细化级数
+    ```
+    """
+    return -(-n_grid // (batch_size * effective_workers(workers))) + levels
+
+
+def effective_workers(workers):
+    """实际能并行的进程数，不超过CPU数。"""
+    return max(1, min(int(workers), os.cpu_count() or 1))
+
+
+class ThroughputMeter(object):
+    """
+    回测速度：每秒回测的 候选数×K线数（rate），按指数滑动平均记录最近的实测值；
+    以及每轮回测每根K线的固定开销秒数（overhead），由 calibrate 测出。
+    ```
+    meter = ThroughputMeter('mnt/cache/throughput.json')
+    meter.record(n_candidates, bars, seconds, rounds=3)
+    meter.predict(n_candidates, bars, workers=2, rounds=3)  # 预计秒数，没有记录时为None
+    ```
+    """
+
+    def __init__(self, path=None, alpha=0.3):
+        """
+        ```
+        :param path: 保存测得速度的json文件，None为不保存
+        ```
+        """
+        self.path = path
+        self.alpha = alpha
+        self.rate = None
+        self.overhead = 0.0
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, encoding='utf8') as fin:
+                saved = json.load(fin)
+            self.rate, self.overhead = float(saved['rate']), float(saved['overhead'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def _save(self):
+        """先写临时文件再改名，多个服务进程共用一个文件。"""
+        if self.path is None:
+            return
+        root = os.path.dirname(self.path) or '.'
+        os.makedirs(root, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wt', encoding='utf8') as fout:
+                json.dump(dict(rate=self.rate, overhead=self.overhead), fout)
+            os.replace(tmp, self.path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def record(self, n_candidates, bars, seconds, workers=1, rounds=0):
+        """
+        记录一次实测，太短的忽略；扣掉各轮的固定开销，多进程的实测按可用CPU数折算成单进程的速度。
+        ```
+        :param rounds: 这次实测回测了几轮，见 count_rounds
+        ```
+        """
+        if n_candidates <= 0 or bars <= 0 or seconds < 0.05:
+            return
+        seconds = max(seconds - rounds * bars * self.overhead, seconds * 0.1)
+        rate = n_candidates * bars / seconds / effective_workers(workers)
+        with self._lock:
+            self.rate = rate if self.rate is None else self.alpha * rate + (1 - self.alpha) * self.rate
+            self.samples += 1
+            self._save()
+
+    def predict(self, n_candidates, bars, workers=1, rounds=0):
+        """预计回测秒数：候选部分按可用CPU数折算，再加上各轮的固定开销。"""
+        if self.rate is None:
+            return None
+        return n_candidates * bars / self.rate / effective_workers(workers) + rounds * bars * self.overhead
+
+    def calibrate(self, series, param, batch_size=4096, bars=1024, small=16):
+        """
+        没有实测记录（磁盘上也没有）时，用开头一小段行情现场测一次：
+        第一块候选测回测速度，只有几个候选的一块测每轮的固定开销。
+        ```
+        :param series: BarSeries
+        :param param: 基础参数
+        :param batch_size: 候选数，与搜索时每块的候选数相同，测得的速度才可比
+        :param bars: 用多少根K线
+        :param small: 测固定开销用的候选数
+        ```
+        """
+        series = series.slice(0, bars)
+        jiage_min, jiage_max = series.price_range()
+        params = []
+        for n_search in range(3, 12):
+            try:
+                params = list(iter_candidates(param, jiage_min, jiage_max, n_search))
+            except ValueError:
+                break
+            if len(params) >= batch_size:
+                break
+        params = params[:batch_size]
+        t = time.time()
+        _score_chunk(series, params[:small], topn=1)
+        t_small = time.time() - t
+        t = time.time()
+        _score_chunk(series, params, topn=1)
+        t_full = time.time() - t
+        n_small = min(small, len(params))
+        if len(params) > n_small and t_full > t_small:
+            rate = (len(params) - n_small) * len(series) / (t_full - t_small)
+            overhead = max(0.0, t_small - n_small * len(series) / rate) / len(series)
+        else:
+            # 候选太少，分不出固定开销
+            rate, overhead = len(params) * len(series) / max(t_full, 1e-6), 0.0
+        with self._lock:
+            self.rate, self.overhead = rate, overhead
+            self.samples += 1
+            self._save()
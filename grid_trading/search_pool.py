@@ -0,0 +1,171 @@
+"""
+多进程参数搜索。
+
+候选参数按块分给进程池，K线的开高低收只通过 multiprocessing.shared_memory 发布一次，
+各进程直接映射同一块内存，不随每个任务重复序列化。进程池和共享内存可以在一次搜索的多次回测之间复用（ScoringPool），
+自适应搜索每一级细化都回测一批候选，不必每批重新启动进程。每个任务返回本块的 top-k
+和盈亏比例，主进程按块的顺序合并，结果与单进程搜索完全一致，与进程数无关。
+剪枝阈值也与进程数无关：候选按序号每 _threshold_stride 个分成一段，每段开始时记下当时的阈值，
+每块用上一段开始时记下的阈值，单进程和多进程、早完成还是晚完成都用同样的阈值。
+"""
+import collections
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .bar_series import BarSeries
+from .grid_engine import run_summary
+
+# 剪枝阈值每隔多少个候选更新一次，须是块大小的整数倍
+_threshold_stride = 1 << 14
+# 子进程里映射到共享内存的K线
+_worker_shm = None
+_worker_series = None
+
+
+def _init_worker(shm_name, nbars, path):
+    """子进程初始化：映射共享内存里的开高低收。"""
+    global _worker_shm, _worker_series
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    cols = np.ndarray((4, nbars), dtype=np.float64, buffer=_worker_shm.buf)
+    _worker_series = BarSeries(time=np.zeros(nbars, dtype=np.int64), open=cols[0], high=cols[1],
+                               low=cols[2], close=cols[3], path=path)
+
+
+def _score_chunk(series, params, topn, threshold=None):
+    """
+    回测一块候选参数。
+    ```
+    :param threshold: 剪枝阈值，剪枝的参数组没有回测完，盈亏比例记为nan，不进入top-k
+    :return: (本块盈亏比例数组, 本块top-k的[(块内序号, report_data)], 剪枝数)
+    ```
+    """
+    reports = run_summary(series, params, threshold=threshold)
+    yinkuibili = np.array([np.nan if r.get('jianzhi') else r['yinkuibili'] for r in reports], dtype=np.float64)
+    order = [k for k in range(len(reports)) if not reports[k].get('jianzhi')]
+    order = sorted(order, key=lambda k: reports[k]['yinkuibili'], reverse=True)[:topn]
+    return yinkuibili, [(k, reports[k]) for k in order], sum(1 for r in reports if r.get('jianzhi'))
+
+
+def _search_chunk(params, topn, threshold):
+    """子进程任务：用共享内存里的K线回测一块候选参数。"""
+    return _score_chunk(_worker_series, params, topn, threshold)
+
+
+class ScoringPool(object):
+    """
+    回测用的进程池，K线放在共享内存里，一次搜索里多次 iter_scored_chunks 共用。
+    ```
+    with ScoringPool(series, workers=4) as pool:
+        for chunk in iter_scored_chunks(series, chunks, topn, pool=pool):
+            ...
+    ```
+    """
+
+    def __init__(self, series, workers):
+        self.workers = workers
+        nbars = len(series)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, 4 * nbars * 8))
+        try:
+            cols = np.ndarray((4, nbars), dtype=np.float64, buffer=self.shm.buf)
+            cols[:] = (series.open, series.high, series.low, series.close)
+            del cols
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=(self.shm.name, nbars, series.path))
+        except BaseException:
+            self._unlink()
+            raise
+
+    def submit(self, params, topn, threshold):
+        return self.executor.submit(_search_chunk, params, topn, threshold)
+
+    def _unlink(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def close(self):
+        try:
+            self.executor.shutdown(cancel_futures=True)
+        finally:
+            self._unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_scored_chunks(series, chunks, topn, workers=1, threshold=None, stride=None, pool=None):
+    """
+    逐块回测候选参数，按输入顺序产生结果，与进程数无关。
+    ```
+    :param series: BarSeries
+    :param chunks: (块起始序号, 候选参数列表) 的可迭代对象，可以是生成器，序号须连续
+    :param topn: 每块返回的最佳结果数
+    :param workers: 进程数，1为在当前进程回测
+    :param pool: 共用的 ScoringPool，给出时workers不起作用；不给时workers大于1则为这次调用新建一个
+    :param threshold: 返回当前剪枝阈值的函数，调用方每合并完一块后结果随之更新，返回None则不剪枝；默认不剪枝
+    :param stride: 剪枝阈值每隔多少个候选更新一次：第k段（序号 k*stride 起）的块用第k-1段开始时的阈值，
+                   多进程时同时在途的块因此不超过两段；默认 _threshold_stride
+    :return: (块起始序号, 候选参数列表, 盈亏比例数组, [(块内序号, report_data)], 剪枝数) 的生成器
+    ```
+    """
+    stride = stride or _threshold_stride
+    # 段号 -> 这一段之前的候选都已合并时的阈值
+    snapshots = {}
+    merged = [None]
+
+    def mark_merged(end):
+        """调用方已合并end之前的全部候选。"""
+        merged[0] = end
+        if threshold is not None and end // stride not in snapshots:
+            snapshots[end // stride] = threshold()
+
+    def ready(start):
+        """start所在块要用的阈值是否已经记下。"""
+        return threshold is None or merged[0] is None or merged[0] >= (start // stride - 1) * stride
+
+    def chunk_threshold(start):
+        if threshold is None:
+            return None
+        if merged[0] is None:
+            # 第一块：此前的候选（例如自适应搜索的前几轮）都已合并
+            mark_merged(start)
+        need = max(start // stride - 1, min(snapshots))
+        return snapshots[max(k for k in snapshots if k <= need)]
+
+    if pool is None and workers <= 1:
+        for start, params in chunks:
+            yield (start, params) + _score_chunk(series, params, topn, chunk_threshold(start))
+            mark_merged(start + len(params))
+        return
+
+    own = pool is None
+    if own:
+        pool = ScoringPool(series, workers)
+    # 同时在途的任务数有上限，候选参数不会一次性全部生成
+    pending = collections.deque()
+    try:
+        for start, params in chunks:
+            # 要用的阈值还没记下时，先等前面的块合并
+            while pending and not ready(start):
+                done_start, done_params, future = pending.popleft()
+                yield (done_start, done_params) + future.result()
+                mark_merged(done_start + len(done_params))
+            pending.append((start, params, pool.submit(params, topn, chunk_threshold(start))))
+            if len(pending) >= pool.workers * 2:
+                done_start, done_params, future = pending.popleft()
+                yield (done_start, done_params) + future.result()
+                mark_merged(done_start + len(done_params))
+        while pending:
+            start, params, future = pending.popleft()
+            yield (start, params) + future.result()
+            mark_merged(start + len(params))
+    finally:
+        # 调用方提前停止（超时、取消）时，还没开始的块不再回测
+        for _, _, future in pending:
+            future.cancel()
+        if own:
+            pool.close()
@@ -0,0 +1,331 @@
+"""
+流式参数搜索的工具。
+
+候选参数由生成器逐个产生、按块回测，不再一次性保存全部候选和结果：
+最佳结果放在有界堆 TopK 里，盈亏比例的分布用固定大小的分位数草图 QuantileSketch 记录，
+内存占用不随搜索密度 n_search 增长。
+有时间预算时，候选改按覆盖优先的顺序（SpreadCandidates）回测，预算用完时已回测的候选均匀分布在整个参数空间。
+"""
+import functools
+import heapq
+import itertools
+import math
+
+import numpy as np
+
+
+def iter_candidates(param, jiage_min, jiage_max, n_search):
+    """
+    按原来五层循环的顺序逐个产生候选参数。
+    ```
+    :param param: 基础参数（数据、投入资金、手续费等）
+    :param jiage_min: 最低价
+    :param jiage_max: 最高价
+    :param n_search: 搜索密度
+    :return: 候选参数字典的生成器
+    ```
+    """
+    for p in iter_grid(param['touruzijin'], jiage_min, jiage_max, n_search):
+        yield {**param, **p}
+
+
+def iter_grid(touruzijin, jiage_min, jiage_max, n_search):
+    """按五层循环的顺序逐个产生网格参数（不含基础参数），参数含义同 iter_candidates。"""
+    _shangjie_p = np.linspace(jiage_min, jiage_max, n_search)
+    _xiajie_p = np.linspace(jiage_min, jiage_max, n_search)
+    for _xiajie in _xiajie_p:
+        for _shangjie in _shangjie_p:
+            if _shangjie - _xiajie <= 0.001:
+                continue
+            _wangge_p = (np.linspace(0, _shangjie - _xiajie, n_search) ** 2) / (_shangjie - _xiajie)
+            _jizhunjia_p = np.linspace(_xiajie, _shangjie, n_search)
+            for _wangge in _wangge_p:
+                if _shangjie - _xiajie < _wangge:
+                    continue
+                if _wangge < 0.001:
+                    continue
+                for _jizhunjia in _jizhunjia_p:
+                    _jc_max = int(touruzijin // _jizhunjia // 100 * 100)
+                    _jc_min = 100
+                    _jiancangfene_p = np.arange(_jc_min, _jc_max + 1, 100)
+                    _jiancangfene_p = _jiancangfene_p[::len(_jiancangfene_p) // n_search]
+                    for _jiancangfene in _jiancangfene_p:
+                        _dancifene_p = np.arange(100, _jiancangfene + 1, 100)
+                        for _dancifene in _dancifene_p:
+                            if _jiancangfene % _dancifene != 0:
+                                continue
+                            p = dict(wanggeshangjie=round(_shangjie, 4), wanggexiajie=round(_xiajie, 4),
+                                     wanggeleixing=1,
+                                     mairuyuzhi=round(_wangge, 4), maichuyuzhi=round(_wangge, 4),
+                                     jizhunjia=round(_jizhunjia, 4), jiancangfene=int(_jiancangfene),
+                                     dancifene=int(_dancifene))
+                            yield p
+
+
+@functools.lru_cache(maxsize=16)
+def divisor_counts(n):
+    """
+    0..n 每个整数的约数个数，0的约数个数记为0。
+    列出每个d在n以内的全部倍数（共约 n*ln(n) 个），按倍数计数，没有逐个整数的循环；结果按n缓存，只读。
+    """
+    n = max(int(n), 0)
+    d = np.arange(1, n + 1, dtype=np.int64)
+    counts = n // d
+    # 第i个d的倍数为 d*1 .. d*counts[i]
+    k = np.arange(int(counts.sum()), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    tau = np.bincount(np.repeat(d, counts) * k, minlength=n + 1).astype(np.int64)
+    tau.flags.writeable = False
+    return tau
+
+
+class GridLayout(object):
+    """
+    iter_grid 产生的候选按序号直接定位，不逐个生成。
+    ```
+    按五层循环的结构数出每层的候选数：(下界, 上界)、网格大小、基准价、(建仓股数, 单次股数)，
+    单次股数必须整除建仓股数，某个建仓股数（以100股为单位记为m）对应的候选数就是m的约数个数。
+    第k个候选用各层的累计数逐层二分查找得到，与 iter_grid 产生的第k个候选相同。
+    layout = GridLayout(touruzijin, jiage_min, jiage_max, n_search)
+    len(layout)  # 候选总数
+    layout.grid(k)  # 第k个候选的网格参数
+    ```
+    """
+
+    def __init__(self, touruzijin, jiage_min, jiage_max, n_search):
+        """参数含义同 iter_candidates，投入资金太少、建仓股数的档位不够n_search档时抛 ValueError。"""
+        self.touruzijin = touruzijin
+        self.n_search = n_search
+        self.tau = divisor_counts(int(touruzijin // max(jiage_min, 0.01) // 100))
+        self._fene = {}
+        self._divisors = {}
+        self._pairs = []
+        counts = []
+        _shangjie_p = np.linspace(jiage_min, jiage_max, n_search)
+        _xiajie_p = np.linspace(jiage_min, jiage_max, n_search)
+        for _xiajie in _xiajie_p:
+            for _shangjie in _shangjie_p:
+                if _shangjie - _xiajie <= 0.001:
+                    continue
+                _wangge_p = (np.linspace(0, _shangjie - _xiajie, n_search) ** 2) / (_shangjie - _xiajie)
+                _wangge_p = _wangge_p[(_shangjie - _xiajie >= _wangge_p) & (_wangge_p >= 0.001)]
+                if not len(_wangge_p):
+                    continue
+                _jizhunjia_p = np.linspace(_xiajie, _shangjie, n_search)
+                # 每个基准价的候选数的累计
+                leiji = np.cumsum([self.fene(j)[1][-1] for j in _jizhunjia_p])
+                self._pairs.append((_shangjie, _xiajie, _wangge_p, _jizhunjia_p, leiji))
+                counts.append(len(_wangge_p) * int(leiji[-1]))
+        self._leiji = np.cumsum(np.array(counts, dtype=np.int64))
+
+    def __len__(self):
+        return int(self._leiji[-1]) if len(self._leiji) else 0
+
+    def fene(self, jizhunjia):
+        """
+        某个基准价下的建仓股数档位（以100股为单位）和 (建仓股数, 单次股数) 组合数的累计。
+        ```
+        :return: (档位数组, 累计组合数数组)
+        ```
+        """
+        if jizhunjia not in self._fene:
+            m = int(self.touruzijin // jizhunjia // 100)
+            step = max(m, 0) // self.n_search
+            if step == 0:
+                # 与 iter_grid 一致：可建仓的股数档位少于 n_search 时无法按密度抽样
+                raise ValueError(f'touruzijin {self.touruzijin} is too small to search {self.n_search} levels '
+                                 f'at price {round(float(jizhunjia), 4)}')
+            units = np.arange(1, m + 1, step)
+            self._fene[jizhunjia] = (units, np.cumsum(self.tau[units]))
+        return self._fene[jizhunjia]
+
+    def divisors(self, m):
+        """m从小到大的约数。"""
+        if m not in self._divisors:
+            self._divisors[m] = [d for d in range(1, m + 1) if m % d == 0]
+        return self._divisors[m]
+
+    def grid(self, k):
+        """第k个候选的网格参数（不含基础参数），与 iter_grid 产生的字典相同。"""
+        if not 0 <= k < len(self):
+            raise IndexError(k)
+        i = int(np.searchsorted(self._leiji, k, side='right'))
+        r = k - (int(self._leiji[i - 1]) if i else 0)
+        _shangjie, _xiajie, _wangge_p, _jizhunjia_p, leiji = self._pairs[i]
+        w, r = divmod(r, int(leiji[-1]))
+        j = int(np.searchsorted(leiji, r, side='right'))
+        r -= int(leiji[j - 1]) if j else 0
+        units, fene_leiji = self.fene(_jizhunjia_p[j])
+        u = int(np.searchsorted(fene_leiji, r, side='right'))
+        r -= int(fene_leiji[u - 1]) if u else 0
+        m = int(units[u])
+        _wangge, _jizhunjia = _wangge_p[w], _jizhunjia_p[j]
+        return dict(wanggeshangjie=round(_shangjie, 4), wanggexiajie=round(_xiajie, 4),
+                    wanggeleixing=1,
+                    mairuyuzhi=round(_wangge, 4), maichuyuzhi=round(_wangge, 4),
+                    jizhunjia=round(_jizhunjia, 4), jiancangfene=m * 100,
+                    dancifene=self.divisors(m)[r] * 100)
+
+
+def spread_step(n):
+    """spread_order 的步长：最接近 n/黄金分割比 且与n互素的整数。"""
+    if n <= 2:
+        return 1
+    a = max(1, int(round(n / (1 + 5 ** 0.5) * 2)))
+    while math.gcd(a, n) != 1:
+        a += 1
+    return a
+
+
+def spread_order(n):
+    """
+    0..n-1 的低差异排列：第i个为 i*a mod n，a见 spread_step。
+    任意前k个在 [0, n) 上都分布得很均匀；候选序号按五层循环排列，均匀覆盖序号即在外层参数上分层抽样。
+    """
+    return np.arange(n, dtype=np.int64) * spread_step(n) % max(n, 1)
+
+
+class SpreadCandidates(object):
+    """
+    按覆盖优先的顺序排列的全部候选参数，可以重复迭代，顺序固定。
+    ```
+    不事先生成候选：候选总数由 GridLayout 直接数出，迭代时按 spread_order 的顺序逐个定位，
+    构造时只数各层的候选数，内存不随候选数增长。
+    cands = SpreadCandidates(param, jiage_min, jiage_max, n_search)
+    len(cands)  # 候选总数
+    cands[i]  # 第i个候选
+    for p in cands: ...
+    ```
+    """
+
+    def __init__(self, param, jiage_min, jiage_max, n_search):
+        self.param = param
+        self.layout = GridLayout(param['touruzijin'], jiage_min, jiage_max, n_search)
+        self._step = spread_step(len(self.layout))
+
+    def __len__(self):
+        return len(self.layout)
+
+    def __getitem__(self, i):
+        return {**self.param, **self.layout.grid(i * self._step % len(self))}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def iter_chunks(candidates, size, start=0):
+    """把候选参数按块切分，产生 (块内第一个候选的序号, 候选列表)，序号从start开始。"""
+    it = iter(candidates)
+    for start in itertools.count(start, size):
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield start, chunk
+
+
+def pick_candidates(candidates, ids):
+    """从候选生成器里按序号取出候选参数，返回 {序号: 候选}。"""
+    ids = set(ids)
+    out = {}
+    for k, p in enumerate(candidates):
+        if k in ids:
+            out[k] = p
+            if len(out) == len(ids):
+                break
+    return out
+
+
+class TopK(object):
+    """
+    有界堆，只保留盈亏比例最高的k个结果。
+    排序与对全部结果 sorted(..., reverse=True) 相同：盈亏比例从高到低，相同时按候选顺序。
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+
+    def push(self, idx, yinkuibili, item):
+        """加入一个结果，idx为候选序号。"""
+        # 堆顶是最差的结果：盈亏比例最低，相同时序号最大
+        key = (yinkuibili, -idx)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, (key, idx, item))
+        elif self.k and key > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (key, idx, item))
+
+    def kth(self):
+        """第k好的盈亏比例，还不满k个时返回None。"""
+        if not self.k or len(self._heap) < self.k:
+            return None
+        return self._heap[0][0][0]
+
+    def items(self):
+        """从好到差的 [(序号, 结果)]。"""
+        return [(idx, item) for _, idx, item in sorted(self._heap, key=lambda x: x[0], reverse=True)]
+
+
+class QuantileSketch(object):
+    """
+    固定大小的分位数草图，记录盈亏比例的排名分布。
+    ```
+    每层最多保存size个 (盈亏比例, 候选序号)，第i层的每个样本代表2**i个候选。
+    一层存满后按排名排序、隔一个取一个并入上一层，内存为 O(size * log(n/size))。
+    候选总数不超过size时不会压缩，rank_items 的结果是精确的。
+    ```
+    """
+
+    def __init__(self, size=1 << 16):
+        self.size = size
+        self.count = 0
+        self._levels = []
+        self._flips = []
+
+    def add(self, values, ids):
+        """批量加入盈亏比例和对应的候选序号。"""
+        values = np.asarray(values, dtype=np.float64)
+        ids = np.asarray(ids, dtype=np.int64)
+        self.count += len(values)
+        self._push(0, values, ids)
+
+    def _push(self, level, values, ids):
+        if level == len(self._levels):
+            self._levels.append([])
+            self._flips.append(0)
+        self._levels[level].append((values, ids))
+        stored = sum(len(v) for v, _ in self._levels[level])
+        if stored <= self.size:
+            return
+        values = np.concatenate([v for v, _ in self._levels[level]])
+        ids = np.concatenate([i for _, i in self._levels[level]])
+        self._levels[level] = []
+        order = self._order(values, ids)
+        # 交替取奇偶位置，避免压缩总是偏向一侧
+        keep = order[self._flips[level]::2]
+        self._flips[level] ^= 1
+        self._push(level + 1, values[keep], ids[keep])
+
+    @staticmethod
+    def _order(values, ids):
+        """排名顺序：盈亏比例从高到低，相同时按候选序号。"""
+        return np.lexsort((ids, -values))
+
+    def rank_items(self, ranks):
+        """
+        按排名查询样本。
+        ```
+        :param ranks: 排名列表，0为最好
+        :return: [(候选序号, 盈亏比例)]
+        ```
+        """
+        parts = [(v, i, 1 << level) for level, chunks in enumerate(self._levels) for v, i in chunks]
+        if not parts:
+            return []
+        values = np.concatenate([v for v, _, _ in parts])
+        ids = np.concatenate([i for _, i, _ in parts])
+        weights = np.concatenate([np.full(len(v), w, dtype=np.int64) for v, _, w in parts])
+        order = self._order(values, ids)
+        # 每个样本覆盖的排名区间为 [累计权重-权重, 累计权重)
+        upper = np.cumsum(weights[order])
+        pos = np.minimum(np.searchsorted(upper, np.asarray(ranks, dtype=np.int64), side='right'), len(order) - 1)
+        return [(int(ids[order[k]]), float(values[order[k]])) for k in pos]
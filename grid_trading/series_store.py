@@ -0,0 +1,177 @@
+"""
+解析后的K线序列的二进制列式缓存。
+
+上传的行情文件第一次解析后，按列保存成 .npy 文件，另加一个 manifest.json 记录列和解析方式，
+目录名为文件内容的md5：mnt/series/{md5}/{time,open,high,low,close,volume}.npy。
+之后加载直接用 np.load(mmap_mode='r') 内存映射各列，不再解析文本；
+多个 uvicorn 进程映射同一批文件，共用操作系统的页缓存，不各自保存一份。
+"""
+import collections
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from .bar_series import BarSeries
+
+# 缓存格式的版本，列或含义变化时加一，旧缓存自动失效
+_store_version = 1
+_columns = ('time', 'open', 'high', 'low', 'close', 'volume')
+
+
+def file_md5(path, block=1 << 20):
+    """文件内容的md5。"""
+    h = hashlib.md5()
+    with open(path, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(block), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class SeriesStore(object):
+    """
+    按md5保存的列式K线缓存。
+    ```
+    store = SeriesStore('mnt/series')
+    series = store.load_file('mnt/wp/data_token.csv', parse_excel)  # 第一次解析并保存，之后内存映射
+    ```
+    """
+
+    def __init__(self, root, max_loaded=32):
+        self.root = root
+        self.max_loaded = max_loaded
+        # (路径, 大小, 修改时间) -> md5，同一进程里不重复计算文件的md5
+        self._md5 = {}
+        # 最近加载的序列，同一文件反复切片时复用序列上算好的时间索引等
+        self._loaded = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def file_key(self, data_path):
+        """文件内容的md5，文件没变时用记下的结果。"""
+        st = os.stat(data_path)
+        stamp = (os.path.abspath(data_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            key = self._md5.get(stamp)
+        if key is None:
+            key = file_md5(data_path)
+            with self._lock:
+                self._md5[stamp] = key
+        return key
+
+    def manifest(self, key):
+        """缓存的manifest，没有缓存或格式版本不同时返回None。"""
+        try:
+            with open(os.path.join(self.path(key), 'manifest.json'), encoding='utf8') as fin:
+                manifest = json.load(fin)
+        except (OSError, ValueError):
+            return None
+        return manifest if manifest.get('version') == _store_version else None
+
+    def load(self, key, parser=None):
+        """
+        内存映射读取缓存的序列，没有缓存（或解析方式、格式版本不同）时返回None。
+        ```
+        :param key: 文件内容的md5
+        :param parser: 解析函数名，与保存时不同则视为没有缓存
+        :return: BarSeries or None
+        ```
+        """
+        folder = self.path(key)
+        manifest = self.manifest(key)
+        if manifest is None or (parser and manifest.get('parser') != parser):
+            return None
+        try:
+            cols = {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r') for name in _columns}
+        except (OSError, ValueError, KeyError):
+            return None
+        return BarSeries(path=manifest['path'], **cols)
+
+    def save(self, key, series, **meta):
+        """
+        保存序列：先写到临时目录再整个改名，其他进程不会读到写了一半的缓存。
+        ```
+        :param key: 文件内容的md5
+        :param series: BarSeries
+        :param meta: 写进manifest的其他信息，例如解析函数名parser、原文件名source
+        ```
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.root, prefix=f'.{key}.')
+        try:
+            for name in _columns:
+                np.save(os.path.join(tmp, f'{name}.npy'), np.ascontiguousarray(getattr(series, name)))
+            manifest = dict(version=_store_version, key=key, path=series.path, bars=len(series),
+                            columns={name: str(getattr(series, name).dtype) for name in _columns},
+                            created=time.time(), **meta)
+            with open(os.path.join(tmp, 'manifest.json'), 'wt', encoding='utf8') as fout:
+                json.dump(manifest, fout, ensure_ascii=False, indent=4)
+            folder = self.path(key)
+            if os.path.exists(folder):
+                # 旧版本或不同解析方式的缓存
+                shutil.rmtree(folder, ignore_errors=True)
+            try:
+                os.rename(tmp, folder)
+            except OSError:
+                # 其他进程刚保存了同一个文件
+                pass
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+
+    def load_file(self, data_path, parser, key=None):
+        """
+        加载行情文件：有缓存则内存映射，没有则用parser解析并保存。
+        ```
+        :param data_path: 行情文件路径
+        :param parser: 解析函数，parser(data_path) -> BarSeries
+        :param key: 已知的文件内容md5（例如内容寻址保存的文件），不传则计算
+        :return: BarSeries
+        ```
+        """
+        key = key or self.file_key(data_path)
+        with self._lock:
+            series = self._loaded.get((key, parser.__name__))
+            if series is not None:
+                self._loaded.move_to_end((key, parser.__name__))
+                return series
+        series = self.load(key, parser=parser.__name__)
+        if series is None:
+            series = parser(data_path)
+            self.save(key, series, parser=parser.__name__, source=os.path.basename(data_path))
+            series = self.load(key, parser=parser.__name__) or series
+        with self._lock:
+            self._loaded[(key, parser.__name__)] = series
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return series
+
+    def put_file(self, data_path, key, series, parser):
+        """
+        登记已经解析好的文件（例如上传时边接收边解析的），之后 load_file 不再计算md5和解析。
+        ```
+        :param data_path: 文件路径
+        :param key: 文件内容的md5
+        :param series: 解析出的BarSeries
+        :param parser: 解析函数
+        ```
+        """
+        st = os.stat(data_path)
+        with self._lock:
+            self._md5[(os.path.abspath(data_path), st.st_size, st.st_mtime_ns)] = key
+        if self.load(key, parser=parser.__name__) is None:
+            self.save(key, series, parser=parser.__name__, source=os.path.basename(data_path))
+
+    def clear(self):
+        """清空缓存。"""
+        with self._lock:
+            self._loaded.clear()
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
@@ -0,0 +1,137 @@
+"""
+滚动（walk-forward）验证。
+
+把一段行情按交易日切成 N+1 段，第k折用前面的数据搜索参数，再在紧接着的第k+1段上验证：
+rolling 只用前一段训练，anchored 从第一段一直训练到前一段。
+各折互不依赖，可以多进程并行；行情只加载一次，各折用切片。
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .bar_series import format_epoch
+
+# 切分方式：rolling为滚动窗口，anchored为起点固定、训练集逐折变长
+fold_modes = ('rolling', 'anchored')
+
+
+def split_folds(series, n_folds, mode='rolling'):
+    """
+    按交易日把行情切成 n_folds+1 段，返回每折的训练和验证区间（K线位置，左闭右开）。
+    ```
+    :param series: BarSeries
+    :param n_folds: 折数
+    :param mode: rolling或anchored
+    :return: [((训练起, 训练止), (验证起, 验证止)), ...]
+    ```
+    """
+    if mode not in fold_modes:
+        raise ValueError(f'unknown fold mode: {mode}')
+    days = series.time // 86400
+    uniq = np.unique(days)
+    if len(uniq) < n_folds + 1:
+        raise ValueError(f'{len(uniq)} trading days cannot be split into {n_folds} folds')
+    groups = np.array_split(uniq, n_folds + 1)
+    bounds = [int(np.searchsorted(days, g[0])) for g in groups] + [len(series)]
+    folds = []
+    for k in range(1, n_folds + 1):
+        train_start = 0 if mode == 'anchored' else bounds[k - 1]
+        folds.append(((train_start, bounds[k]), (bounds[k], bounds[k + 1])))
+    return folds
+
+
+def window_info(series):
+    """切片的起止日期和K线数，日期格式与请求参数相同。"""
+    start, end = format_epoch(series.time[[0, -1]], fmt='%Y/%m/%d')
+    return dict(start=start, end=end, bars=len(series))
+
+
+def run_fold(search, evaluate, base, train, validate):
+    """
+    一折：在训练切片上搜索参数，在验证切片上回测搜索出的参数。
+    ```
+    :param search: search(series, base) -> search_params 格式的结果
+    :param evaluate: evaluate(series, params) -> report_data 列表
+    :param base: 基础参数，起止时间会换成本折训练集的起止日期
+    :param train: 训练集 BarSeries
+    :param validate: 验证集 BarSeries
+    :return: dict
+    ```
+    """
+    train_info, validate_info = window_info(train), window_info(validate)
+    base = dict(base, data_start_index=train_info['start'], data_end_index=train_info['end'])
+    result = search(train, base)
+    dts = result['result_topn']
+    for dt, rep in zip(dts, evaluate(validate, [dt['param'] for dt in dts])):
+        dt['result_evaluating'] = rep
+    train_y = [dt['result']['yinkuibili'] for dt in dts]
+    validate_y = [dt['result_evaluating']['yinkuibili'] for dt in dts]
+    stats = dict(
+        train_yinkuibili=train_y[0] if dts else None,
+        validate_yinkuibili=validate_y[0] if dts else None,
+        topn_validate_mean=round(float(np.mean(validate_y)), 4) if dts else None,
+        topn_validate_median=round(float(np.median(validate_y)), 4) if dts else None,
+        topn_validate_win=round(float(np.mean(np.array(validate_y) > 1)), 4) if dts else None,
+    )
+    return dict(train=train_info, validate=validate_info, result_best=dts[:1], result_topn=dts, stats=stats)
+
+
+def summarize_folds(folds):
+    """
+    汇总各折的样本外（验证集）表现。
+    ```
+    validate_yinkuibili_mean: 各折最佳参数在验证集上的平均盈亏比例
+    validate_yinkuibili_compound: 各折最佳参数的验证盈亏比例连乘，即每折换用新参数、资金滚动投入的结果
+    validate_win_rate: 最佳参数在验证集上盈利的折数占比
+    topn_validate_mean: 各折前topn个参数验证盈亏比例均值的平均
+    ```
+    """
+    best = [f['stats']['validate_yinkuibili'] for f in folds if f['stats']['validate_yinkuibili'] is not None]
+    topn = [f['stats']['topn_validate_mean'] for f in folds if f['stats']['topn_validate_mean'] is not None]
+    if not best:
+        return dict(n_folds=len(folds))
+    return dict(
+        n_folds=len(folds),
+        validate_yinkuibili_mean=round(float(np.mean(best)), 4),
+        validate_yinkuibili_compound=round(float(np.prod(best)), 4),
+        validate_win_rate=round(float(np.mean(np.array(best) > 1)), 4),
+        topn_validate_mean=round(float(np.mean(topn)), 4),
+    )
+
+
+def walk_forward(series, base, n_folds, search, evaluate, mode='rolling', workers=1, progress=None):
+    """
+    滚动验证。
+    ```
+    :param series: 整段行情 BarSeries，只加载一次
+    :param base: 基础参数
+    :param n_folds: 折数
+    :param search: 见 run_fold，多进程时须可pickle（模块级函数或其functools.partial）
+    :param evaluate: 见 run_fold
+    :param mode: rolling或anchored
+    :param workers: 并行的进程数，1为逐折运行
+    :param progress: 每完成一折调用 progress(已完成折数, 总折数)
+    :return: dict(folds=每折结果, summary=汇总)
+    ```
+    """
+    tasks = [(series.slice(*train), series.slice(*validate))
+             for train, validate in split_folds(series, n_folds, mode)]
+    if workers <= 1:
+        folds = []
+        for train, validate in tasks:
+            folds.append(run_fold(search, evaluate, base, train, validate))
+            if progress is not None:
+                progress(len(folds), len(tasks))
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(tasks)))
+        try:
+            futures = [pool.submit(run_fold, search, evaluate, base, train, validate) for train, validate in tasks]
+            for done, _ in enumerate(as_completed(futures), 1):
+                if progress is not None:
+                    progress(done, len(tasks))
+            folds = [future.result() for future in futures]
+        finally:
+            # 中途取消时不再启动排队中的折
+            pool.shutdown(cancel_futures=True)
+    folds = [dict(fold=k + 1, **fold) for k, fold in enumerate(folds)]
+    return dict(folds=folds, summary=summarize_folds(folds))
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Date    : 2026/10/18 10:20
+# @Desc    : 批量同步行情：多个代码、周期、日期区间并发下载，共用连接池，断点续传
+"""
+按 代码 × K线周期 × 日期区间 批量下载行情，写成 ef_download.py 一样的文件：
+{根目录}/{代码}_{周期}_{起始日期}.csv（股票放 data/stock，指数放 data/Index/points）。
+
+每个任务按日期切成若干段，所有段交给有界的线程池并发下载，共用一个 requests.Session 的连接池；
+每下载完一段就把这段存成临时文件，并在检查点（{根目录}/.sync/checkpoint.jsonl）末尾追加一行，
+中断后重新运行同样的命令只下载没完成的段。一个任务的所有段都完成后合并写出最终文件。
+行情来源可替换：eastmoney 为 efinance 用的东方财富K线接口，longhu 为 get_1_mintus.py 的1分钟线接口；
+两者都可以用 --base-url 指向本地的假服务器做测试（eastmoney 查市场代号的接口用 --search-url）。
+
+    python -m my_grid.bulk_download 000665 513010 --frequency 60 101 --range 20230101-20250630
+    python -m my_grid.bulk_download 399975 2.930606 --frequency 101 --range 20140101-20250630 --root data/Index/points
+"""
+import argparse
+import datetime
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 与 efinance.stock.get_quote_history 返回的列相同
+_ef_columns = ['股票名称', '股票代码', '日期', '开盘', '收盘', '最高', '最低', '成交量', '成交额',
+               '振幅', '涨跌幅', '涨跌额', '换手率']
+
+
+def make_session(pool_size: int = 8, retries: int = 3) -> requests.Session:
+    """共用的连接池：连接复用，遇到限流和服务端错误按指数退避重试。"""
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def split_dates(start: str, end: str, days: int) -> List[Tuple[str, str]]:
+    """把 [start, end]（YYYYMMDD，含两端）切成每段最多 days 天。"""
+    lo = datetime.datetime.strptime(start, '%Y%m%d').date()
+    hi = datetime.datetime.strptime(end, '%Y%m%d').date()
+    chunks = []
+    while lo <= hi:
+        stop = min(hi, lo + datetime.timedelta(days=days - 1))
+        chunks.append((lo.strftime('%Y%m%d'), stop.strftime('%Y%m%d')))
+        lo = stop + datetime.timedelta(days=1)
+    return chunks
+
+
+class Source(object):
+    """行情来源：把日期区间切成段，按段下载，返回 efinance 格式的 DataFrame。"""
+
+    name = 'base'
+
+    def chunks(self, frequency: int, start: str, end: str) -> List[Tuple[str, str]]:
+        return split_dates(start, end, 366)
+
+    def fetch(self, session: requests.Session, code: str, frequency: int, start: str, end: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+
+class EastmoneySource(Source):
+    """东方财富K线接口（efinance.stock.get_quote_history 用的接口），分钟线按月、日线以上按年分段。"""
+
+    name = 'eastmoney'
+
+    def __init__(self, base_url: str = 'https://push2his.eastmoney.com', timeout: float = 10,
+                 search_url: str = 'https://searchapi.eastmoney.com'):
+        self.base_url = base_url.rstrip('/')
+        self.search_url = search_url.rstrip('/')
+        self.timeout = timeout
+        self._secids = {}
+        self._lock = threading.Lock()
+
+    def secid(self, session: requests.Session, code: str) -> str:
+        """
+        市场.代码（如 1.000300、2.930606）：可以直接给出；否则与 efinance 一样用东方财富的搜索接口查，
+        同一代码只查一次。同一个代码可能是不同市场的股票和指数（如 000300），要指定时直接给出市场。
+        """
+        if '.' in code:
+            return code
+        # 查询期间持锁，同一代码的各段不会同时去查
+        with self._lock:
+            if code not in self._secids:
+                params = dict(input=code, type=14, token='D43BF722C8E33BDC906FB84D85E326E8', count=5)
+                response = session.get(f'{self.search_url}/api/suggest/get', params=params, timeout=self.timeout)
+                response.raise_for_status()
+                quotes = (response.json().get('QuotationCodeTable') or {}).get('Data') or []
+                matched = [q['QuoteID'] for q in quotes if q.get('Code') == code and q.get('QuoteID')]
+                if not matched:
+                    raise ValueError(f'cannot resolve market of {code}, give it as market.code, e.g. 1.{code}')
+                self._secids[code] = matched[0]
+            return self._secids[code]
+
+    def chunks(self, frequency, start, end):
+        return split_dates(start, end, 31 if frequency < 101 else 366)
+
+    def fetch(self, session, code, frequency, start, end):
+        params = dict(fields1='f1,f2,f3,f4,f5,f6', fields2='f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61',
+                      ut='7eea3edcaed734bea9cbfc24409ed989', klt=frequency, fqt=1, secid=self.secid(session, code),
+                      beg=start, end=end)
+        response = session.get(f'{self.base_url}/api/qt/stock/kline/get', params=params, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json().get('data') or {}
+        rows = [[data.get('name'), data.get('code', code)] + line.split(',') for line in data.get('klines') or []]
+        df = pd.DataFrame(rows, columns=_ef_columns)
+        df[_ef_columns[3:]] = df[_ef_columns[3:]].apply(pd.to_numeric, errors='coerce')
+        return df
+
+
+class LonghuMinuteSource(Source):
+    """get_1_mintus.py 的1分钟线接口，一次一天；只有最新价，开高低收都记为最新价。"""
+
+    name = 'longhu'
+
+    def __init__(self, base_url: str = 'https://apphis.longhuvip.com', timeout: float = 10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def chunks(self, frequency, start, end):
+        return split_dates(start, end, 1)
+
+    def fetch(self, session, code, frequency, start, end):
+        data = dict(Day=start, PhoneOSNew='2', StockID=code.split('.')[-1], Token='0', UserID='0',
+                    VerSion='5.2.1.0', a='GetStockTrend', apiv='w28', c='StockL2History')
+        response = session.post(f'{self.base_url}/w1/api/index.php', data=data, timeout=self.timeout)
+        response.raise_for_status()
+        js = response.json()
+        df = pd.DataFrame(columns=_ef_columns)
+        if not js.get('trend'):
+            # 非交易日
+            return df
+        trend = pd.DataFrame([row[:4] for row in js['trend']], columns=['时间', '最新价', '均价', '成交量'])
+        day = datetime.datetime.strptime(js['day'], '%Y%m%d').strftime('%Y-%m-%d')
+        df['日期'] = day + ' ' + trend['时间'].astype(str)
+        for col in ('开盘', '收盘', '最高', '最低'):
+            df[col] = pd.to_numeric(trend['最新价'])
+        df['成交量'] = pd.to_numeric(trend['成交量'])
+        df['股票代码'] = code
+        return df
+
+
+sources = {'eastmoney': EastmoneySource, 'longhu': LonghuMinuteSource}
+
+
+@dataclass
+class SyncTask:
+    """一个下载任务：一个代码的一种K线周期的一段日期。"""
+
+    code: str
+    frequency: int
+    start: str  # YYYYMMDD
+    end: str  # YYYYMMDD
+    root: str = 'data/stock'
+
+    @property
+    def key(self) -> str:
+        return f'{self.code}_{self.frequency}_{self.start}_{self.end}'
+
+    @property
+    def file_path(self) -> str:
+        return os.path.join(self.root, f'{self.code.split(".")[-1]}_{self.frequency}_{self.start}.csv')
+
+
+class Checkpoint(object):
+    """
+    已完成的段：每完成一段在文件末尾追加一行，不重写整个文件；打开时按顺序重放，并压缩成每个任务一行。
+    ```
+    {"key": 任务key, "done": ["20230101_20230131"]}
+    {"key": 任务key, "finished": true}
+    {"key": 任务key, "reset": true}
+    ```
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {}
+        try:
+            with open(path, encoding='utf8') as fin:
+                for line in fin:
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        # 中断时写了一半的最后一行
+                        continue
+        except OSError:
+            pass
+        self._compact()
+
+    def _apply(self, record: dict):
+        if record.get('reset'):
+            self.state.pop(record['key'], None)
+        task = self.task(record['key'])
+        task['done'].update(record.get('done', ()))
+        task['finished'] = task['finished'] or bool(record.get('finished'))
+
+    def _compact(self):
+        """重写为每个任务一行（先写临时文件再改名）。"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'wt', encoding='utf8') as fout:
+            for key, task in self.state.items():
+                fout.write(json.dumps(dict(key=key, done=sorted(task['done']), finished=task['finished']),
+                                      ensure_ascii=False) + '\n')
+        os.replace(tmp, self.path)
+
+    def _append(self, record: dict):
+        with open(self.path, 'at', encoding='utf8') as fout:
+            fout.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._apply(record)
+
+    def task(self, key: str) -> dict:
+        return self.state.setdefault(key, dict(done=set(), finished=False))
+
+    def is_done(self, key: str, chunk: str) -> bool:
+        with self._lock:
+            return chunk in self.task(key)['done']
+
+    def mark_done(self, key: str, chunk: str):
+        with self._lock:
+            self._append(dict(key=key, done=[chunk]))
+
+    def reset(self, key: str):
+        with self._lock:
+            self._append(dict(key=key, reset=True))
+
+    def is_finished(self, key: str) -> bool:
+        with self._lock:
+            return self.task(key)['finished']
+
+    def mark_finished(self, key: str):
+        with self._lock:
+            self._append(dict(key=key, finished=True))
+
+
+class BulkDownloader(object):
+    """
+    批量下载。
+    ```
+    downloader = BulkDownloader(EastmoneySource(), workers=8)
+    downloader.run([SyncTask('000665', 60, '20230101', '20250630')])
+    ```
+    """
+
+    def __init__(self, source: Source, workers: int = 8, session: requests.Session = None):
+        self.source = source
+        self.workers = workers
+        self.session = session or make_session(pool_size=workers)
+
+    @staticmethod
+    def part_dir(task: SyncTask) -> str:
+        return os.path.join(task.root, '.sync', task.key)
+
+    def part_path(self, task: SyncTask, chunk: Tuple[str, str]) -> str:
+        return os.path.join(self.part_dir(task), f'{chunk[0]}_{chunk[1]}.csv')
+
+    def fetch_chunk(self, task: SyncTask, checkpoint: Checkpoint, chunk: Tuple[str, str]) -> int:
+        """下载一段并存为临时文件，返回行数。"""
+        df = self.source.fetch(self.session, task.code, task.frequency, *chunk)
+        os.makedirs(self.part_dir(task), exist_ok=True)
+        part = self.part_path(task, chunk)
+        df.to_csv(f'{part}.tmp', index=False, encoding='utf-8')
+        os.replace(f'{part}.tmp', part)
+        checkpoint.mark_done(task.key, f'{chunk[0]}_{chunk[1]}')
+        return len(df)
+
+    def finish_task(self, task: SyncTask, checkpoint: Checkpoint) -> int:
+        """所有段按日期合并去重，写出最终文件，返回行数。"""
+        parts = [self.part_path(task, chunk) for chunk in self.source.chunks(task.frequency, task.start, task.end)]
+        frames = [pd.read_csv(p, dtype={'股票代码': str}) for p in parts]
+        df = pd.concat([f for f in frames if len(f)] or frames[:1], ignore_index=True)
+        df = df.drop_duplicates(subset='日期', keep='last').sort_values('日期', kind='stable')
+        os.makedirs(task.root, exist_ok=True)
+        df.to_csv(f'{task.file_path}.tmp', index=False, encoding='utf-8')  # 避免中文乱码
+        os.replace(f'{task.file_path}.tmp', task.file_path)
+        checkpoint.mark_finished(task.key)
+        for p in parts:
+            os.remove(p)
+        os.rmdir(self.part_dir(task))
+        return len(df)
+
+    def run(self, tasks: List[SyncTask], checkpoint_path: str = None) -> List[dict]:
+        """
+        下载所有任务，已完成的段和任务跳过。
+        ```
+        :param tasks: SyncTask 列表
+        :param checkpoint_path: 检查点文件，默认为第一个任务根目录下的 .sync/checkpoint.jsonl
+        :return: [dict(file=文件路径, rows=行数, error=出错信息)]
+        ```
+        """
+        if not tasks:
+            return []
+        checkpoint = Checkpoint(checkpoint_path or os.path.join(tasks[0].root, '.sync', 'checkpoint.jsonl'))
+        skipped, errors = set(), {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {}
+            for task in tasks:
+                if checkpoint.is_finished(task.key):
+                    if os.path.exists(task.file_path):
+                        skipped.add(task.key)
+                        continue
+                    # 文件被删了，重新下载
+                    checkpoint.reset(task.key)
+                for chunk in self.source.chunks(task.frequency, task.start, task.end):
+                    if not (checkpoint.is_done(task.key, f'{chunk[0]}_{chunk[1]}')
+                            and os.path.exists(self.part_path(task, chunk))):
+                        futures[pool.submit(self.fetch_chunk, task, checkpoint, chunk)] = task
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    # 这一段没有记入检查点，下次运行重新下载
+                    errors.setdefault(task.key, f'{type(e).__name__}: {e}')
+        report = []
+        for task in tasks:
+            row = dict(code=task.code, frequency=task.frequency, file=task.file_path, rows=None,
+                       error=errors.get(task.key), skipped=task.key in skipped)
+            if row['error'] is None and not row['skipped']:
+                row['rows'] = self.finish_task(task, checkpoint)
+            report.append(row)
+        return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量下载行情，断点续传')
+    parser.add_argument('codes', nargs='+', help='代码，例如 000665 513010 1.000300，不带市场时查询市场代号')
+    parser.add_argument('--frequency', type=int, nargs='+', default=[101], help='K线周期（efinance的klt）')
+    parser.add_argument('--range', nargs='+', default=['20230101-20250630'], help='日期区间，起-止，YYYYMMDD')
+    parser.add_argument('--root', default='data/stock', help='保存目录，指数用 data/Index/points')
+    parser.add_argument('--source', default='eastmoney', choices=sorted(sources), help='行情来源')
+    parser.add_argument('--base-url', default=None, help='行情接口地址，测试时指向本地服务器')
+    parser.add_argument('--search-url', default=None, help='eastmoney查询市场代号的接口地址，测试时指向本地服务器')
+    parser.add_argument('--workers', type=int, default=8, help='并发连接数')
+    parser.add_argument('--checkpoint', default=None, help='检查点文件')
+    args = parser.parse_args(argv)
+
+    options = dict(base_url=args.base_url, search_url=args.search_url if args.source == 'eastmoney' else None)
+    source = sources[args.source](**{k: v for k, v in options.items() if v})
+    tasks = [SyncTask(code, frequency, *r.split('-'), root=args.root)
+             for code in args.codes for frequency in args.frequency for r in args.range]
+    for row in BulkDownloader(source, workers=args.workers).run(tasks, args.checkpoint):
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+批量下载断点续传：中断（某一段下载失败）后重新运行，只下载检查点里没有完成的段；全部完成后不再下载，最终文件被删了才重新下载。
+"""
+import datetime
+import os
+
+import pandas as pd
+import requests
+
+from my_grid.bulk_download import BulkDownloader, Source, SyncTask, split_dates, _ef_columns
+
+
+class FakeSource(Source):
+    """每天一根日线的假行情来源，记下下载过的段，fail里的段下载时出错。"""
+
+    name = 'fake'
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.fetched = []
+
+    def chunks(self, frequency, start, end):
+        return split_dates(start, end, 10)
+
+    def fetch(self, session, code, frequency, start, end):
+        self.fetched.append((start, end))
+        if (start, end) in self.fail:
+            raise ConnectionError(f'{start}-{end}')
+        lo, hi = (datetime.datetime.strptime(d, '%Y%m%d') for d in (start, end))
+        days = [lo + datetime.timedelta(days=k) for k in range((hi - lo).days + 1)]
+        return pd.DataFrame([['假行情', code, d.strftime('%Y-%m-%d'), 1.0, 1.0, 1.0, 1.0, 100, 100.0, 0, 0, 0, 0]
+                             for d in days], columns=_ef_columns)
+
+
+def test_resume_from_checkpoint(tmp_path):
+    task = SyncTask('000665', 101, '20230101', '20230131', root=str(tmp_path))
+    chunks = split_dates(task.start, task.end, 10)
+    checkpoint = os.path.join(str(tmp_path), '.sync', 'checkpoint.jsonl')
+
+    source = FakeSource(fail=[chunks[1]])
+    report = BulkDownloader(source, workers=2, session=requests.Session()).run([task])
+    assert report[0]['error'] is not None
+    assert not os.path.exists(task.file_path)
+    assert sorted(source.fetched) == chunks
+    # 中断时写了一半的最后一行
+    with open(checkpoint, 'at', encoding='utf8') as fout:
+        fout.write('{"key": "000665_101_2023')
+
+    source = FakeSource()
+    report = BulkDownloader(source, workers=2, session=requests.Session()).run([task])
+    assert report[0]['error'] is None and report[0]['rows'] == 31
+    assert source.fetched == [chunks[1]]
+    df = pd.read_csv(task.file_path, dtype={'股票代码': str})
+    assert df['日期'].tolist() == [f'2023-01-{d:02d}' for d in range(1, 32)]
+    assert set(df['股票代码']) == {'000665'}
+
+    source = FakeSource()
+    report = BulkDownloader(source, workers=2, session=requests.Session()).run([task])
+    assert report[0]['skipped'] and source.fetched == []
+
+    # 文件被删了，重新下载整个任务
+    os.remove(task.file_path)
+    source = FakeSource()
+    report = BulkDownloader(source, workers=2, session=requests.Session()).run([task])
+    assert report[0]['rows'] == 31 and sorted(source.fetched) == chunks
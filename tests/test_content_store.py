@@ -0,0 +1,26 @@
+"""
+ContentStore：两个进程各自的实例先后保存，索引不会互相覆盖，同名同内容重复保存仍返回原来的别名。
+"""
+from grid_trading.content_store import ContentStore
+
+
+def test_two_stores_share_index(tmp_path):
+    a, b = ContentStore(str(tmp_path)), ContentStore(str(tmp_path))
+    # b 在 a 保存之前就读过索引
+    b.digest('missing.json')
+    assert a.put_bytes(b'{"a": 1}', 'p', '.json') == 'p.json'
+    assert b.put_bytes(b'{"b": 2}', 'q', '.json') == 'q.json'
+
+    fresh = ContentStore(str(tmp_path))
+    assert fresh.digest('p.json') is not None
+    assert fresh.digest('q.json') is not None
+    assert b.put_bytes(b'{"a": 1}', 'p', '.json') == 'p.json'
+    assert fresh.put_bytes(b'{"a": 1}', 'p', '.json') == 'p.json'
+
+
+def test_same_name_other_content(tmp_path):
+    store = ContentStore(str(tmp_path))
+    assert store.put_bytes(b'1', 'p', '.json') == 'p.json'
+    other = store.put_bytes(b'2', 'p', '.json')
+    assert other.startswith('p.') and other != 'p.json'
+    assert store.digest('p.json') != store.digest(other)
@@ -0,0 +1,143 @@
+"""
+批量回测引擎与逐组回测的一致性：grid_func、run_summary
+在同一份行情、同一批随机参数上给出完全相同的 report_data，并与改写前逐tick回测的原始实现（baseline_report_data）一致；
+交易行为相同、规范化去重后只回测一次的参数组，结果与逐组回测相同。
+"""
+import os
+
+import numpy as np
+import pytest
+
+from grid_trading.grid_engine import grid_func, run_summary, canonical_params, stack_params
+from grid_trading.grid_handler import parse_excel
+
+_data_path = os.path.join(os.path.dirname(__file__), '..', 'static', 'data', 'SZ#000665#5min.csv')
+
+
+@pytest.fixture(scope='module')
+def series():
+    return parse_excel(_data_path)
+
+
+def baseline_report_data(values, touruzijin, jizhunjia, dancifene, jiancangfene, wanggeshangjie, wanggexiajie,
+                         wanggeleixing, mairuyuzhi, maichuyuzhi, shouxufeilv=0.0001):
+    """改写前 grid_func 的逐tick回测原样照抄（只保留 report_data），作为引擎改写的参照。"""
+    if not jizhunjia:
+        jizhunjia = values[0]
+    xianjin = touruzijin - jiancangfene * jizhunjia
+    totalfene = jiancangfene
+    jizhunjingzhi = jizhunjia
+    n_maichu, n_mairu = 0, 0
+
+    kaishi_idx = 0
+    for i, (v1, v2) in enumerate(zip(values, values[1:])):
+        if (jizhunjia - v1) * (jizhunjia - v2) <= 0:
+            kaishi_idx = i
+            jizhunjingzhi = v1
+            break
+
+    for i in range(kaishi_idx, len(values)):
+        dangshijingzhi = values[i]
+        if dangshijingzhi > wanggeshangjie or dangshijingzhi < wanggexiajie:
+            continue
+        if wanggeleixing == 1:
+            maichujia = jizhunjingzhi + maichuyuzhi
+        else:
+            maichujia = jizhunjingzhi * (1 + maichuyuzhi / 100)
+        if dangshijingzhi >= maichujia and totalfene >= dancifene:
+            totalfene -= dancifene
+            shouxufei = max(0.1, shouxufeilv * dangshijingzhi * dancifene)
+            xianjin += (dangshijingzhi * dancifene - shouxufei)
+            n_maichu += 1
+            jizhunjingzhi = dangshijingzhi
+            continue
+        if wanggeleixing == 1:
+            mairujia = jizhunjingzhi - mairuyuzhi
+        else:
+            mairujia = jizhunjingzhi * (1 - mairuyuzhi / 100)
+        if dangshijingzhi <= mairujia and xianjin >= (1 + shouxufeilv) * dancifene * dangshijingzhi:
+            totalfene += dancifene
+            shouxufei = max(0.1, shouxufeilv * dangshijingzhi * dancifene)
+            xianjin -= (dangshijingzhi * dancifene + shouxufei)
+            n_mairu += 1
+            jizhunjingzhi = dangshijingzhi
+            continue
+    zongjiazhi = (xianjin + totalfene * values[-1])
+    xianjin = round(xianjin, 4)
+    return dict(
+        touruzijin=touruzijin,
+        zongjiaoyicishu=n_mairu + n_maichu,
+        zongjiageshu=len(values) - kaishi_idx,
+        kaishijiaoyidian=kaishi_idx,
+        kanpanjia=jizhunjia,
+        xianjin=xianjin,
+        totalfene=totalfene,
+        shoupanjia=values[-1],
+        fenejiazhi=totalfene * values[-1],
+        zongjiazhi=round(xianjin + totalfene * values[-1], 4),
+        yinkuibili=round(zongjiazhi / touruzijin, 4)
+    )
+
+
+def random_params(series, n, seed=0):
+    """在行情的价格区间里随机取网格参数，差价和比例网格、基准价取0（用起始价）都有。"""
+    rng = np.random.default_rng(seed)
+    jiage_min, jiage_max = series.price_range()
+    params = []
+    for _ in range(n):
+        xiajie, shangjie = np.sort(rng.uniform(jiage_min, jiage_max, 2))
+        wanggeleixing = int(rng.integers(1, 3))
+        if wanggeleixing == 1:
+            yuzhi = rng.uniform(0.01, max(0.02, (shangjie - xiajie) / 2))
+        else:
+            yuzhi = rng.uniform(0.2, 10)
+        jizhunjia = 0 if rng.random() < 0.2 else rng.uniform(xiajie, shangjie)
+        dancifene = int(rng.integers(1, 11)) * 100
+        params.append(dict(
+            touruzijin=100000, jizhunjia=round(float(jizhunjia), 4), dancifene=dancifene,
+            jiancangfene=dancifene * int(rng.integers(0, 11)),
+            wanggeshangjie=round(float(shangjie), 4), wanggexiajie=round(float(xiajie), 4),
+            wanggeleixing=wanggeleixing, mairuyuzhi=round(float(yuzhi), 4),
+            maichuyuzhi=round(float(rng.uniform(0.5, 1.5) * yuzhi), 4),
+            shouxufeilv=float(rng.choice([0.0001, 0.0003, 0.001]))))
+    return params
+
+
+def test_summary_matches_detail(series):
+    params = random_params(series, 20, seed=1)
+    expected = [grid_func(shuju=series.ticks, **p)['report_conclusion']['report_data'] for p in params]
+    assert run_summary(series, params) == expected
+
+
+@pytest.mark.parametrize('bars, n, seed', [(None, 30, 2), (2000, 300, 3)])
+def test_matches_baseline(series, bars, n, seed):
+    if bars is not None:
+        series = series.slice(len(series) - bars, len(series))
+    values = series.ticks.tolist()
+    params = random_params(series, n, seed=seed)
+    expected = [baseline_report_data(values, **p) for p in params]
+    assert [grid_func(shuju=series.ticks, **p)['report_conclusion']['report_data']
+            for p in params] == expected
+    assert run_summary(series, params) == expected
+
+
+def test_canonical_params_dedup(series):
+    series = series.slice(len(series) - 2000, len(series))
+    jiage_min, jiage_max = series.price_range()
+    levels = series.price_levels()
+    params = []
+    for p in random_params(series, 40, seed=4):
+        # 高于最高价的上界、低于最低价的下界、落在相邻两个价格之间的上下界、没有价格的空区间，都与原参数等价
+        k = int(np.searchsorted(levels, p['wanggeshangjie'], side='right'))
+        between = (levels[k - 1] + levels[k]) / 2 if 0 < k < len(levels) else p['wanggeshangjie']
+        params += [p, dict(p, wanggeshangjie=jiage_max + 1), dict(p, wanggeshangjie=jiage_max + 5),
+                   dict(p, wanggexiajie=jiage_min - 1), dict(p, wanggexiajie=0.01),
+                   dict(p, wanggeshangjie=round(float(between), 4)),
+                   dict(p, wanggexiajie=levels[0] + 0.0001, wanggeshangjie=levels[0] + 0.0002),
+                   dict(p, wanggexiajie=levels[1] + 0.0001, wanggeshangjie=levels[1] + 0.0002)]
+    _, first, inverse = canonical_params(series, stack_params(params))
+    assert len(first) < len(params) * 3 // 4
+    assert len(inverse) == len(params)
+    expected = [grid_func(shuju=series.ticks.tolist(), **p)['report_conclusion']['report_data']
+                for p in params]
+    assert run_summary(series, params) == expected
@@ -0,0 +1,126 @@
+"""
+行情文件解析：批量解析（parse_excel、parse_quote_csv）与原来逐行解析的结果相同；
+上传时分块解析（ExcelStreamParser）的结果与块的大小无关，块边界落在行中间、gbk双字节字符或\r\n中间都一样。
+"""
+import csv
+import glob
+import os
+import re
+
+import numpy as np
+import pytest
+
+from grid_trading.bar_series import format_epoch
+from grid_trading.grid_handler import parse_excel, parse_quote_csv, ExcelStreamParser
+
+_root = os.path.join(os.path.dirname(__file__), '..')
+_exports = sorted(glob.glob(os.path.join(_root, 'static', 'data', '*')))
+_quotes = [os.path.join(_root, 'data', 'Index', 'points', name)
+           for name in ('930606_101_20140101.csv', 'sz.399998_60_2016-01-01.csv', 'sz.399998_d_2016-01-01.csv')] + \
+          [os.path.join(_root, 'data', 'stock', '513010_60_20230101.csv')]
+
+
+def line_parse_excel(data_path):
+    """原来的逐行解析（去掉逐行打印），返回 (时间字符串, 开, 高, 低, 收, 成交量) 列表。"""
+    flag = 0
+    t_min, v_shift = '', 0
+    rows = []
+    with open(data_path, encoding='gbk') as fin:
+        for line in fin:
+            parts = re.split(r'[,\s]+', line.strip())
+            if len(parts) >= 5:
+                if flag == 0:
+                    if parts[0] == '时间':
+                        if len(parts[0].split('-')) == 2:
+                            flag = 1
+                        else:
+                            flag = 2
+                    elif parts[0] == '日期':
+                        if parts[1] == '时间':
+                            flag = 3
+                        else:
+                            flag = 4
+                    else:
+                        flag = -1
+                    continue
+
+                if flag in (1, 2) and '-' in parts[0]:
+                    t_min = parts[0]
+                    v_shift = 1
+                elif flag == 2:
+                    t_min = f'{parts[0]}-10:00'
+                    v_shift = 1
+                elif flag == 3:
+                    t_min = f'{parts[0].replace("-", "/")}-{parts[1][:-2]}:{parts[1][-2:]}'
+                    v_shift = 2
+                elif flag == 4:
+                    t_min = f'{parts[0].replace("-", "/")}-10:00'
+                    v_shift = 1
+                else:
+                    assert 1 <= flag <= 4
+
+                if 1 <= flag <= 4:
+                    rows.append((t_min, float(parts[0 + v_shift]), float(parts[1 + v_shift]),
+                                 float(parts[2 + v_shift]), float(parts[3 + v_shift]),
+                                 float(parts[4 + v_shift]) if len(parts) > 4 + v_shift else 0.0))
+    return rows
+
+
+def row_parse_quote_csv(data_path):
+    """
+    原来的逐行解析：efinance格式同原来的 request_data，baostock格式同 my_grid/read_data.py，
+    返回 (时间字符串, 开, 高, 低, 收) 列表。
+    """
+    rows = []
+    with open(data_path, encoding='utf8') as fin:
+        for line in csv.DictReader(fin):
+            if '日期' in line:
+                t = line['日期'].strip().replace('-', '/').replace(' ', '-')
+                if not re.search(r'\d+:\d+', t):  # 日线
+                    t = f'{t}-10:00'
+                rows.append((t, float(line['开盘']), float(line['最高']), float(line['最低']), float(line['收盘'])))
+            else:
+                if 'time' in line:
+                    t = line['time']
+                    t = f'{t[:4]}/{t[4:6]}/{t[6:8]}-{t[8:10]}:{t[10:12]}'
+                else:
+                    t = f'{line["date"].replace("-", "/")}-10:00'
+                rows.append((t, float(line['open']), float(line['high']), float(line['low']), float(line['close'])))
+    return rows
+
+
+def columns(series, volume=True):
+    cols = [format_epoch(series.time, '%Y/%m/%d-%H:%M'), series.open, series.high, series.low, series.close]
+    return [list(c) for c in cols + ([series.volume] if volume else [])]
+
+
+@pytest.mark.parametrize('data_path', _exports, ids=os.path.basename)
+def test_parse_excel_matches_line_parser(data_path):
+    series = parse_excel(data_path)
+    assert len(series) > 0
+    assert series.path == 'OHLC'
+    assert columns(series) == [list(c) for c in zip(*line_parse_excel(data_path))]
+
+
+@pytest.mark.parametrize('data_path', _quotes, ids=os.path.basename)
+def test_parse_quote_csv_matches_row_parser(data_path):
+    series = parse_quote_csv(data_path)
+    assert len(series) > 0
+    assert series.path == 'OLHC'
+    assert columns(series, volume=False) == [list(c) for c in zip(*row_parse_quote_csv(data_path))]
+    # 展开的数据点与原来 request_data 一样按 开-低-高-收 排列
+    ticks = np.column_stack([series.open, series.low, series.high, series.close]).reshape(-1)
+    assert series.ticks.tolist() == ticks.tolist()
+
+
+@pytest.mark.parametrize('data_path', _exports, ids=os.path.basename)
+def test_stream_parser_chunk_size(data_path):
+    with open(data_path, 'rb') as fin:
+        data = fin.read()
+    expected = columns(parse_excel(data_path))
+    sizes = [len(data), 65536, 4099] + ([97] if len(data) < 200000 else [])
+    for size in sizes:
+        parser = ExcelStreamParser()
+        for k in range(0, len(data), size):
+            parser.feed(data[k:k + size])
+        assert columns(parser.close()) == expected, size
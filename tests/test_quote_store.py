@@ -0,0 +1,98 @@
+"""
+本地增量行情库：只下载本地还没有的日期区间，重叠的窗口和重启后的请求直接切片返回。
+本地行情文件：起止日期外只差休市日（周末、节假日）也算完整覆盖；分钟线合成时午休的K线归入上午最后一根。
+"""
+import datetime
+
+import numpy as np
+
+from grid_trading.bar_series import BarSeries, to_epoch
+from grid_trading.quote_store import QuoteFetcher, QuoteStore, FileFetcher, to_day
+from grid_trading.resample import resample
+
+
+class FakeFetcher(QuoteFetcher):
+    """工作日每天一根日线的假行情来源，记下每次下载的日期区间。"""
+
+    name = 'fake'
+
+    def __init__(self):
+        self.fetched = []
+
+    def fetch(self, code, start_date, end_date, frequency):
+        self.fetched.append((start_date, end_date))
+        days = [datetime.date.fromordinal(d) for d in range(to_day(start_date), to_day(end_date) + 1)]
+        days = [d for d in days if d.weekday() < 5]
+        price = np.array([10 + d.toordinal() % 7 for d in days], dtype=float)
+        return BarSeries(time=to_epoch([d.strftime('%Y/%m/%d-10:00') for d in days], fmt='%Y/%m/%d-%H:%M'),
+                         open=price, high=price + 1, low=price - 1, close=price, volume=np.full(len(days), 100.0),
+                         path='OLHC')
+
+
+def same_bars(a, b):
+    return all(np.array_equal(getattr(a, c), getattr(b, c)) for c in ('time', 'open', 'high', 'low', 'close'))
+
+
+def test_fetch_only_missing_ranges(tmp_path):
+    fetcher = FakeFetcher()
+    store = QuoteStore(str(tmp_path), fetcher)
+    series = store.get('000665', '20230101', '20230131', 101)
+    assert fetcher.fetched == [('20230101', '20230131')]
+    assert same_bars(series, FakeFetcher().fetch('000665', '20230101', '20230131', 101))
+
+    # 重叠的窗口只下载缺的部分，前后都缺时下载两段
+    series = store.get('000665', '20230115', '20230210', 101)
+    assert fetcher.fetched[1:] == [('20230201', '20230210')]
+    assert same_bars(series, FakeFetcher().fetch('000665', '20230115', '20230210', 101))
+    store.get('000665', '20221220', '20230220', 101)
+    assert fetcher.fetched[2:] == [('20221220', '20221231'), ('20230211', '20230220')]
+    assert store.covered('000665', 101) == [('20221220', '20230220')]
+
+    # 已覆盖的窗口不再下载，重启（新的QuoteStore）后也一样
+    store.get('000665', '20230105', '20230125', 101)
+    restarted = QuoteStore(str(tmp_path), fetcher)
+    series = restarted.get('000665', '20221220', '20230220', 101)
+    assert len(fetcher.fetched) == 4
+    assert same_bars(series, FakeFetcher().fetch('000665', '20221220', '20230220', 101))
+
+    # 其他代码各自下载
+    restarted.get('000666', '20230105', '20230125', 101)
+    assert fetcher.fetched[4:] == [('20230105', '20230125')]
+
+
+def test_file_coverage_skips_holidays(tmp_path):
+    """2022年1月3日（星期一）元旦休市，日线文件从1月4日开始。"""
+    bars = {}
+
+    def write(name, start_date, end_date, holidays=()):
+        series = FakeFetcher().fetch('000665', start_date, end_date, 101)
+        keep = np.flatnonzero(~np.isin(series.time // 86400, [to_day(d) - to_day('19700101') for d in holidays]))
+        bars[str(tmp_path / name)] = BarSeries(path=series.path, **{c: getattr(series, c)[keep] for c in
+                                                                    ('time', 'open', 'high', 'low', 'close', 'volume')})
+        (tmp_path / name).write_text('')
+
+    fetcher = FileFetcher([str(tmp_path)], loader=bars.__getitem__)
+    # 文件名里的起始日期早于第一根K线：之间都不是交易日
+    write('000665_101_20220101.csv', '20220104', '20220131')
+    assert fetcher.find('000665', '20220101', '20220131', 101) is not None
+    assert fetcher.find('000665', '20220101', '20220210', 101) is None
+
+    # 文件名从第一根K线那天开始时，靠更细周期的文件知道1月3日休市
+    (tmp_path / '000665_101_20220101.csv').unlink()
+    write('000665_101_20220104.csv', '20220104', '20220131')
+    assert fetcher.find('000665', '20220101', '20220131', 101) is None
+    write('000665_60_20211201.csv', '20211201', '20220131', holidays=['20220103'])
+    series = fetcher.find('000665', '20220101', '20220131', 101)
+    assert series is not None and len(series) == 20
+
+def test_resample_lunch_break():
+    """午休时间的K线归入上午最后一根，开盘前的归入第一根，收盘后的归入最后一根。"""
+    minutes = ['09:25', '09:31', '11:30', '11:31', '12:59', '13:01', '15:00', '15:05']
+    n = len(minutes)
+    price = np.arange(n, dtype=float) + 10
+    series = BarSeries(time=to_epoch([f'2023/07/03-{m}' for m in minutes], fmt='%Y/%m/%d-%H:%M'),
+                       open=price, high=price, low=price, close=price, volume=np.ones(n), path='OLHC')
+    out = resample(series, 60, 1)
+    assert [datetime.datetime.utcfromtimestamp(int(t)).strftime('%H:%M') for t in out.time] == ['10:30', '11:30', '14:00',
+                                                                                                  '15:00']
+    assert out.volume.tolist() == [2, 3, 1, 2]
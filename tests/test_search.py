@@ -0,0 +1,63 @@
+"""
+参数搜索：多进程与单进程结果逐字节相同（剪枝时也是）；
+剪枝不改变前topn，回测完的候选盈亏比例与不剪枝时相同，放弃的候选确实进不了前topn。
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from grid_trading import search_pool
+from grid_trading.grid_engine import run_summary
+from grid_trading.grid_handler import parse_excel, _search_params
+from grid_trading.search_pool import iter_scored_chunks
+from grid_trading.search_stream import iter_candidates, iter_chunks
+
+_data_path = os.path.join(os.path.dirname(__file__), '..', 'static', 'data', 'SZ#000665#5min.csv')
+_base = dict(data_token='SZ#000665#5min.csv', data_start_index='0', data_end_index='0', touruzijin=100000.0,
+             shouxufeilv=0.0001)
+
+
+@pytest.fixture(scope='module')
+def series():
+    series = parse_excel(_data_path)
+    return series.slice(len(series) - 2000, len(series))
+
+
+@pytest.fixture
+def small_stride(monkeypatch):
+    """剪枝阈值按4096个候选分段，约1万个候选的搜索也会剪枝。"""
+    monkeypatch.setattr(search_pool, '_threshold_stride', 4096)
+
+
+@pytest.mark.parametrize('strategy', ['grid', 'zoom'])
+@pytest.mark.parametrize('prune', [False, True])
+def test_workers_do_not_change_result(series, small_stride, prune, strategy):
+    results = [json.dumps(_search_params(series, _base, n_search=6, workers=workers, prune=prune, strategy=strategy))
+               for workers in (1, 3)]
+    assert results[0] == results[1]
+    if prune:
+        assert json.loads(results[0])['search_stats']['n_pruned'] > 0
+
+
+def test_prune_matches_unpruned(series, small_stride):
+    full = _search_params(series, _base, n_search=6)
+    pruned = _search_params(series, _base, n_search=6, prune=True)
+    assert pruned['search_stats']['n_pruned'] > 0
+    assert pruned['result_topn'] == full['result_topn']
+    # 示例都是回测完的候选，结果与单独回测相同
+    params = [ex['param'] for ex in pruned['result_examples']]
+    assert [ex['result'] for ex in pruned['result_examples']] == run_summary(series, params)
+    assert pruned['yinkuibili_examples'] == [ex['result']['yinkuibili'] for ex in pruned['result_examples']]
+
+    # 以最终第topn好的盈亏比例为阈值逐块回测：没放弃的与不剪枝时逐个相同，放弃的都不如阈值
+    candidates = list(iter_candidates(_base, *series.price_range(), 6))
+    expected = np.array([r['yinkuibili'] for r in run_summary(series, candidates)])
+    kth = full['result_topn'][-1]['result']['yinkuibili']
+    scored = iter_scored_chunks(series, iter_chunks(candidates, 4096), 10, threshold=lambda: kth)
+    yinkuibili = np.concatenate([chunk[2] for chunk in scored])
+    wancheng = ~np.isnan(yinkuibili)
+    assert not wancheng.all()
+    assert (yinkuibili[wancheng] == expected[wancheng]).all()
+    assert (expected[~wancheng] < kth).all()
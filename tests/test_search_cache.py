@@ -0,0 +1,83 @@
+"""
+搜索结果的磁盘缓存：同一段行情无论起止时间怎么写（2025/6/3、2025/06/03、数据点位置）缓存键都相同，
+换一种写法再搜索直接命中缓存；K线内的价格路径不同则是不同的搜索。
+"""
+import pytest
+
+from grid_trading import grid_handler
+from grid_trading.result_cache import ResultCache
+from grid_trading.series_store import SeriesStore
+
+_data_token = '513010_60_20230101.csv'
+
+
+@pytest.fixture(autouse=True)
+def stores(tmp_path, monkeypatch):
+    """解析后的行情和搜索结果缓存写到临时目录。"""
+    monkeypatch.setattr(grid_handler, '_series_store', SeriesStore(str(tmp_path / 'series')))
+    monkeypatch.setattr(grid_handler, '_result_cache', ResultCache(str(tmp_path / 'cache')))
+    grid_handler.slice_file_data.cache_clear()
+    yield
+    grid_handler.slice_file_data.cache_clear()
+
+
+def base(start, end, **kwargs):
+    return dict(dict(data_token=_data_token, data_start_index=start, data_end_index=end, touruzijin=100000.0,
+                     shouxufeilv=0.0001), **kwargs)
+
+
+def cache_key(param):
+    series = grid_handler.parse_data(param['data_token'], param['data_start_index'], param['data_end_index'])
+    return grid_handler.search_cache_key(series, param, 4, 10, 'grid', False)
+
+
+def test_key_ignores_date_spelling():
+    full = grid_handler.parse_data(_data_token, '0', '_')
+    start, end = grid_handler.parse_data_index(full, '2025/06/03', '2025/06/20')
+    keys = {cache_key(base('2025/6/3', '2025/6/20')), cache_key(base('2025/06/03', '2025/06/20')),
+            cache_key(base(str(start), str(end))), cache_key(base('2025/06/03', '2025/06/20', touruzijin=100000))}
+    assert len(keys) == 1
+    assert cache_key(base('2025/06/04', '2025/06/20')) not in keys
+
+
+def test_search_hits_cache(monkeypatch):
+    param = base('2025/06/03', '2025/06/20')
+    series = grid_handler.parse_data(_data_token, '2025/06/03', '2025/06/20')
+    result = grid_handler.search_series(series, param, n_search=4)
+
+    def no_search(*args, **kwargs):
+        raise AssertionError('should hit the cache')
+
+    monkeypatch.setattr(grid_handler, '_search_params', no_search)
+    param = base('2025/6/3', '2025/6/20')
+    cached = grid_handler.search_series(grid_handler.parse_data(_data_token, '2025/6/3', '2025/6/20'), param,
+                                        n_search=4, workers=2)
+    assert cached['result_topn'] == [dict(item, param=dict(item['param'], data_start_index='2025/6/3',
+                                                                 data_end_index='2025/6/20'))
+                                     for item in result['result_topn']]
+
+
+def test_path_changes_key(monkeypatch):
+    param = base('2025/06/03', '2025/06/20')
+    series = grid_handler.parse_data(_data_token, '2025/06/03', '2025/06/20')
+    keys = {path: grid_handler.search_cache_key(series.with_path(path), param, 4, 10, 'grid', False)
+            for path in ('OHLC', 'OLHC', 'auto')}
+    assert len(set(keys.values())) == 3
+    assert keys[series.path] == cache_key(param)
+
+    grid_handler.search_series(series, param, n_search=4, path='OHLC')
+    calls = []
+    search = grid_handler._search_params
+    monkeypatch.setattr(grid_handler, '_search_params', lambda series, *args, **kwargs: calls.append(series.path) or
+                        search(series, *args, **kwargs))
+    grid_handler.search_series(series, param, n_search=4, path='OHLC')
+    grid_handler.search_series(series, param, n_search=4, path='OLHC')
+    assert calls == ['OLHC']
+
+
+def test_endpoint_rejects_unknown_path():
+    out = grid_handler.do_searching(data_token=_data_token, data_start_index='2025/06/03',
+                                    data_end_index='2025/06/20', name='searching', touruzijin=100000,
+                                    shouxufeilv=0.0001, n_search=4, topn=10, workers=1, strategy='grid', prune=False,
+                                    max_seconds=0, path='HLOC', background=False)
+    assert out['success'] == 0 and 'HLOC' in out['message']
@@ -0,0 +1,56 @@
+"""
+搜索开销估计：自适应搜索候选数的上界与 zoom_search 的实际候选数一致；测得的回测速度保存在磁盘上。
+"""
+import os
+
+import pytest
+
+from grid_trading.grid_handler import parse_excel
+from grid_trading.search_adaptive import zoom_search, iter_neighbors, n_neighbors
+from grid_trading.search_cost import count_zoom_candidates, ThroughputMeter
+
+_data_path = os.path.join(os.path.dirname(__file__), '..', 'static', 'data', 'SZ#000665#5min.csv')
+_base = dict(data_token='SZ#000665#5min.csv', data_start_index='0', data_end_index='0', touruzijin=100000.0,
+             shouxufeilv=0.0001)
+
+
+@pytest.fixture(scope='module')
+def series():
+    series = parse_excel(_data_path)
+    return series.slice(len(series) - 1000, len(series))
+
+
+def test_neighbor_count(series):
+    jiage_min, jiage_max = series.price_range()
+    center = dict(_base, wanggeshangjie=jiage_max, wanggexiajie=jiage_min, mairuyuzhi=0.1, maichuyuzhi=0.1,
+                  jizhunjia=round((jiage_min + jiage_max) / 2, 4), jiancangfene=400, dancifene=100)
+    assert len(list(iter_neighbors(_base, center, 0.05, 1.5, jiage_min, jiage_max))) == n_neighbors
+
+
+@pytest.mark.parametrize('n_search', [4, 6, 8])
+def test_zoom_count_is_upper_bound(series, n_search):
+    jiage_min, jiage_max = series.price_range()
+    beam = 3
+    batches = []
+
+    def evaluate(batch):
+        batches.append(len(batch))
+        # 任意但确定的打分，只看候选数
+        return [(p['jizhunjia'] * 7 + p['mairuyuzhi'] * 13 + p['jiancangfene'] / 100) % 1 for p in batch]
+
+    zoomed = zoom_search(_base, jiage_min, jiage_max, n_search, evaluate, beam=beam)
+    bound = count_zoom_candidates(_base['touruzijin'], jiage_min, jiage_max, n_search, beam=beam)
+    levels = batches[1:]
+    assert zoomed['n_candidates'] <= bound
+    assert zoomed['n_coarse'] + len(levels) * beam * n_neighbors == bound
+    assert all(n <= beam * n_neighbors for n in levels)
+
+
+def test_meter_saved_on_disk(series, tmp_path):
+    path = str(tmp_path / 'throughput.json')
+    meter = ThroughputMeter(path)
+    meter.calibrate(series, _base, batch_size=256, bars=200)
+    assert meter.rate > 0 and meter.overhead >= 0
+    restarted = ThroughputMeter(path)
+    assert (restarted.rate, restarted.overhead) == (meter.rate, meter.overhead)
+    assert restarted.predict(1000, 500, rounds=3) == pytest.approx(1000 * 500 / meter.rate + 3 * 500 * meter.overhead)